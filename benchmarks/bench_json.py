@@ -0,0 +1,56 @@
+"""
+Benchmark of the JSON backends on a large zone-like response.
+
+    python benchmarks/bench_json.py [vertices]
+
+Parses and serializes an nspd-like search response with every installed
+backend of ``rosreestr2coord.jsonlib`` (orjson, ujson, json).
+"""
+import math
+import sys
+import timeit
+
+from rosreestr2coord import jsonlib
+
+
+def make_response(vertices, rings=4):
+    per_ring = vertices // rings
+    coordinates = []
+    for r in range(rings):
+        radius = 5000.0 * (r + 1)
+        angles = [2 * math.pi * i / per_ring for i in range(per_ring)]
+        ring = [[4187000.0 + radius * math.cos(a), 7509000.0 + radius * math.sin(a)] for a in angles]
+        ring.append(ring[0])
+        coordinates.append(ring)
+    feature = {
+        "type": "Feature",
+        "properties": {"label": "38:00-6.123", "options": {"name": "Зона с особыми условиями"}},
+        "geometry": {"type": "Polygon", "coordinates": coordinates},
+    }
+    return {"data": {"type": "FeatureCollection", "features": [feature]}}
+
+
+def bench(name, func, repeat=5):
+    best = min(timeit.repeat(func, number=1, repeat=repeat))
+    print(f"{name:<16} {best * 1000:10.2f} ms")
+    return best
+
+
+def main():
+    vertices = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    response = make_response(vertices)
+    raw = jsonlib.dumps_bytes(response)
+    print(f"{vertices} vertices, {len(raw) / 1024 / 1024:.1f} MB")
+    for name in jsonlib.BACKENDS:
+        try:
+            jsonlib.set_backend(name)
+        except ValueError:
+            print(f"{name:<16} not installed")
+            continue
+        bench(f"{name} loads", lambda: jsonlib.loads(raw))
+        bench(f"{name} dumps", lambda: jsonlib.dumps_bytes(response))
+    jsonlib.set_backend()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Micro-benchmark of the Web-Mercator -> WGS84 transform used for nspd responses.
+
+    python benchmarks/bench_transform.py [vertices]
+
+Compares the pure-Python and numpy paths of ``rings_to_wgs`` (and the old
+per-point ``xy2lonlat`` loop) on a zone-like polygon with many vertices.
+"""
+import math
+import sys
+import timeit
+
+from rosreestr2coord.utils import np, rings_to_wgs, xy2lonlat
+
+
+def make_rings(vertices, rings=4):
+    per_ring = vertices // rings
+    result = []
+    for r in range(rings):
+        radius = 5000.0 * (r + 1)
+        angles = [2 * math.pi * i / per_ring for i in range(per_ring)]
+        ring = [[4187000.0 + radius * math.cos(a), 7509000.0 + radius * math.sin(a)] for a in angles]
+        ring.append(ring[0])
+        result.append(ring)
+    return result
+
+
+def bench(name, func, repeat=5):
+    best = min(timeit.repeat(func, number=1, repeat=repeat))
+    print(f"{name:<12} {best * 1000:10.2f} ms")
+    return best
+
+
+def main():
+    vertices = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rings = make_rings(vertices)
+    print(f"{sum(len(r) for r in rings)} vertices in {len(rings)} rings")
+
+    bench("xy2lonlat", lambda: [[xy2lonlat(x, y) for x, y in ring] for ring in rings])
+    python_time = bench("python", lambda: rings_to_wgs(rings, use_numpy=False))
+    if np is None:
+        print("numpy is not installed, skipping the numpy path")
+        return
+    numpy_time = bench("numpy", lambda: rings_to_wgs(rings, use_numpy=True))
+    print(f"speedup      {python_time / numpy_time:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+End-to-end throughput of ``Area``, ``make_request`` and ``batch_parser`` against the local mock nspd server.
+
+    pip install pytest-benchmark
+    python -m pytest benchmarks [--benchmark-json=result.json]
+
+Every mode reports codes/sec, p50/p99 latency (of a request, or of an area for the
+cached mode) and the peak RSS of the process in the ``extra_info`` of its benchmark.
+The number of codes and the simulated server latency are set with the
+``BENCH_CODES`` and ``BENCH_LATENCY`` environment variables.
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from rosreestr2coord.batch import batch_parser
+from rosreestr2coord.parser import Area
+from rosreestr2coord.request.request import make_request
+from rosreestr2coord.request.urlib_adapter import UrllibAdapter
+from tests.mock_server import MockNspdServer
+
+pytest.importorskip("pytest_benchmark")
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CODES = int(os.environ.get("BENCH_CODES", 200))
+LATENCY = float(os.environ.get("BENCH_LATENCY", 0.005))
+ROUNDS = 3
+
+
+class TimedAdapter(UrllibAdapter):
+    """Adapter recording the duration of every request."""
+
+    def __init__(self):
+        super().__init__()
+        self.durations = []
+        self._lock = threading.Lock()
+
+    def perform_request(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().perform_request(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.durations.append(time.perf_counter() - start)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q / 100 * (len(values) - 1)))] if values else 0.0
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def report(benchmark, durations, codes=CODES):
+    benchmark.extra_info.update(
+        codes_per_sec=round(codes / benchmark.stats.stats.mean, 1),
+        p50_ms=round(percentile(durations, 50) * 1000, 2),
+        p99_ms=round(percentile(durations, 99) * 1000, 2),
+        peak_rss_mb=peak_rss_mb(),
+    )
+
+
+@pytest.fixture(scope="module")
+def server():
+    with MockNspdServer(latency=LATENCY) as server:
+        yield server
+
+
+@pytest.fixture
+def codes():
+    return [f"38:06:144003:{i}" for i in range(1, CODES + 1)]
+
+
+def area_options(server, tmp_path, adapter, **kwargs):
+    options = dict(area_type=1, media_path=str(tmp_path), base_url=server.url, adapter=adapter, with_log=False)
+    options.update(kwargs)
+    return options
+
+
+def test_make_request(benchmark, server, codes):
+    adapter = TimedAdapter()
+    urls = [f"{server.url}?thematicSearchId=1&query={code}&CRS=EPSG:3857" for code in codes]
+
+    def run():
+        for url in urls:
+            make_request(url, adapter=adapter)
+
+    benchmark.pedantic(run, rounds=ROUNDS, iterations=1)
+    report(benchmark, adapter.durations)
+
+
+def test_single(benchmark, server, codes, tmp_path):
+    adapter = TimedAdapter()
+    options = area_options(server, tmp_path, adapter, use_cache=False)
+
+    def run():
+        for code in codes:
+            Area(code, **options)
+
+    benchmark.pedantic(run, rounds=ROUNDS, iterations=1)
+    report(benchmark, adapter.durations)
+
+
+def test_cached(benchmark, server, codes, tmp_path):
+    adapter = TimedAdapter()
+    options = area_options(server, tmp_path, adapter)
+    for code in codes:
+        Area(code, **options)
+    durations = []
+
+    def run():
+        for code in codes:
+            start = time.perf_counter()
+            Area(code, **options)
+            durations.append(time.perf_counter() - start)
+
+    benchmark.pedantic(run, rounds=ROUNDS, iterations=1)
+    assert len(adapter.durations) == len(codes)
+    report(benchmark, durations)
+
+
+@pytest.mark.parametrize("workers", [1, 8], ids=["batch", "concurrent"])
+def test_batch(benchmark, server, codes, tmp_path, workers):
+    adapter = TimedAdapter()
+    options = area_options(server, tmp_path, adapter, use_cache=False)
+
+    def run():
+        batch_parser(
+            codes,
+            output=str(tmp_path / "output"),
+            file_name="list",
+            delay=0,
+            workers=workers,
+            formats=["geojsonseq"],
+            **options,
+        )
+
+    benchmark.pedantic(run, rounds=ROUNDS, iterations=1)
+    report(benchmark, adapter.durations)
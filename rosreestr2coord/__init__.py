@@ -1 +1,31 @@
-from rosreestr2coord.parser import Area
+from typing import TYPE_CHECKING
+
+# The public classes are imported on first access, so that importing the package
+# (e.g. to start the console) does not load asyncio or the spatial index
+_EXPORTS = {
+    "Area": "rosreestr2coord.parser",
+    "AsyncArea": "rosreestr2coord.async_parser",
+    "fetch_many": "rosreestr2coord.async_parser",
+    "SpatialIndex": "rosreestr2coord.spatial_index",
+}
+
+__all__ = list(_EXPORTS)
+
+if TYPE_CHECKING:
+    from rosreestr2coord.async_parser import AsyncArea, fetch_many
+    from rosreestr2coord.parser import Area
+    from rosreestr2coord.spatial_index import SpatialIndex
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        import importlib
+
+        value = getattr(importlib.import_module(_EXPORTS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted([*globals(), *_EXPORTS])
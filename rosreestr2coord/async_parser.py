@@ -0,0 +1,130 @@
+import asyncio
+import functools
+import time
+from typing import AsyncIterator, Dict, Iterable, Optional, Union
+
+from .metrics import AREA_SECONDS, get_metrics
+from .parser import Area
+from .request.base_adapter import AsyncRequestAdapter
+from .request.request import async_make_request, make_request
+from .utils import guess_area_types
+
+DEFAULT_CONCURRENCY = 10
+
+
+class AsyncArea(Area):
+    """
+    Asyncio counterpart of :class:`Area`.
+
+    Creating the object does no network I/O and accessing ``feature`` never triggers
+    a blocking request, the lookup is done by :meth:`aget_geometry` (or :meth:`fetch`).
+    With an ``AsyncRequestAdapter`` (e.g. ``AsyncHttpxAdapter``) requests run on the
+    event loop, a synchronous adapter is called in a worker thread.
+    """
+
+    _fetch_on_init = False
+
+    @classmethod
+    async def fetch(cls, code: str, area_type: Optional[int] = None, **kwargs) -> "AsyncArea":
+        """Create an area and load its geometry. Errors are logged like in ``Area.__init__``."""
+        area = cls(code, area_type=area_type, **kwargs)
+        if area.code:
+            start = time.perf_counter()
+            try:
+                geom = await area.aget_geometry()
+                area._set_result(geom)
+            except Exception as er:
+                area._set_error(er)
+            get_metrics().observe(AREA_SECONDS, time.perf_counter() - start)
+        return area
+
+    async def aget_geometry(self) -> Optional[dict]:
+        if self.area_type is not None:
+            self._validate_area_type()
+            return await self._aquery_with_area_type(self.area_type)
+        return await self._aquery_candidate_types()
+
+    async def _afetch_area_type(self, area_type: int) -> Optional[dict]:
+        cache_key = self._cache_key(area_type)
+        resp = self._get_cached_response(cache_key)
+        if resp is None:
+            url = self.search_url(area_type)
+            resp = await self.amake_request(url)
+            self._cache_response(cache_key, resp)
+        return self._parse_response(resp)
+
+    async def _aquery_with_area_type(self, area_type: int) -> Optional[dict]:
+        feature = await self._afetch_area_type(area_type)
+        if feature:
+            self.feature = feature
+        return feature
+
+    async def _aquery_candidate_types(self) -> Optional[dict]:
+        """Asynchronous :meth:`Area._query_candidate_types`, the requests still running are cancelled."""
+        tasks = {
+            asyncio.ensure_future(self._afetch_area_type(area_type)): area_type
+            for area_type in guess_area_types(self.code)
+        }
+        pending = set(tasks)
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        feature = task.result()
+                    except Exception as er:
+                        error = error or er
+                        continue
+                    if feature:
+                        return self._set_found_type(tasks[task], feature)
+        finally:
+            for task in pending:
+                task.cancel()
+        if error:
+            raise error
+        return None
+
+    async def amake_request(
+        self,
+        url: str,
+        method: str = "GET",
+        body: Optional[Union[Dict, bytes]] = None,
+    ) -> dict:
+        options = self._request_options(url, method, body)
+        if isinstance(self.adapter, AsyncRequestAdapter):
+            return await async_make_request(**options)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(make_request, **options))
+
+
+async def fetch_many(
+    codes: Iterable[str],
+    area_type: Optional[int] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    **kwargs,
+) -> AsyncIterator[AsyncArea]:
+    """
+    Look up many codes with at most ``concurrency`` requests in flight.
+
+    Areas are yielded in completion order, the found geometry is in ``area.feature``::
+
+        async for area in fetch_many(codes, area_type=1):
+            print(area.code, area.feature)
+    """
+    codes_iter = iter(codes)
+    pending = set()
+    try:
+        while True:
+            for code in codes_iter:
+                pending.add(asyncio.ensure_future(AsyncArea.fetch(code, area_type, **kwargs)))
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
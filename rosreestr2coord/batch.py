@@ -1,85 +1,336 @@
+import heapq
+import itertools
 import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from time import sleep
 
-from .export import area_json_output, batch_csv_output, batch_json_output
-from .parser import Area
+from .export import DEFAULT_BATCH_FORMATS, area_json_output, codes_csv_output, open_batch_writers
+from .journal import BatchJournal
+from .metrics import get_metrics
+from .parser import STATUS_ERROR, STATUS_NO_COORD, STATUS_OK, STATUS_PENDING, Area
+from .prefetch import prefetch_quarters
 from .request.exceptions import TimeoutException
+from .request.rate_limit import RateLimiter
+from .request.request import get_request_adapter
+from .request.retry import CircuitBreaker, RetryPolicy
+from .utils import AREA_TYPE_OBJECT, clear_code
 
 
-def batch_parser(
-    codes, with_log=False, file_name="example", areas=None, output=os.path.join("output"), repeat=0, delay=1, **kwargs
-):
-    if areas is None:
-        areas = []
-    with_error = []
-    with_no_coord = []
-    success = 0
-    print("================================")
-    print("Launched parsing of %i areas:" % len(codes))
-    print("================================")
+def _fetch_area(code, with_log, kwargs):
+    try:
+        area = Area(code, with_log=with_log, **kwargs)
+    except Exception:
+        return None, STATUS_ERROR
+    if isinstance(area.exception, TimeoutException):
+        raise area.exception
+    return area, area.status
+
+
+def _check_proxies(code, workers, kwargs):
+    """Score every proxy of the batch with one search for ``code``, return the number of working ones."""
+    area = Area(code, lazy=True, with_log=False, **kwargs)
+    url = area.search_url(area.area_type or AREA_TYPE_OBJECT)
+    adapter = area.adapter or get_request_adapter()
+    pool = area.get_proxy_pool()
+    return pool.health_check(url, adapter, timeout=area.timeout, workers=workers, logger=area.logger)
+
+
+class RetryQueue:
+    """
+    Codes to fetch: fresh codes in input order interleaved with failed codes re-queued after a delay.
+
+    A re-queued code is handed out as soon as its delay is over, before the next fresh code.
+    """
+
+    def __init__(self, codes):
+        self._fresh = iter(codes)
+        self._delayed = []
+        self._counter = itertools.count()
+
+    def push(self, code, delay):
+        heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._counter), code))
+
+    def pop(self, block=True):
+        """
+        Next code to fetch, or None if there is nothing left.
+
+        With ``block=False`` None is also returned while the re-queued codes are still delayed.
+        """
+        if self._delayed and self._delayed[0][0] <= time.monotonic():
+            return heapq.heappop(self._delayed)[2]
+        for code in self._fresh:
+            return code
+        if self._delayed and block:
+            sleep(max(self._delayed[0][0] - time.monotonic(), 0))
+            return heapq.heappop(self._delayed)[2]
+        return None
+
+
+def _iter_sequential(queue, fetch, delay):
     need_sleep = 0
-    features = []
-    for c in codes:
-        area = None
-        code = c.strip("'\" \t\n\r")
-        print("{}".format(code), end="")
-        try:
-            sleep(need_sleep)
-            area = Area(code, with_log=with_log, **kwargs)
-            need_sleep = delay
-            if len(area.get_coord()):
-                print(" - ok", end="")
-                success += 1
-            else:
-                print(" - no coord", end="")
-                with_no_coord.append(area)
-        except TimeoutException:
-            print(" - error")
-            print("Your IP is probably blocked. Try later or use proxy")
+    while True:
+        code = queue.pop()
+        if code is None:
             break
-        except Exception:
-            print(" - error", end="")
-            with_error.append(code)
+        sleep(need_sleep)
+        need_sleep = delay
+        yield code, fetch(code)
+
+
+def _iter_concurrent(queue, fetch, workers, ordered=True):
+    """Run ``fetch`` in a bounded thread pool, yielding results in input or completion order."""
+    max_pending = workers * 2
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        while True:
+            while len(pending) < max_pending:
+                # Only wait for delayed codes when nothing is in flight
+                code = queue.pop(block=not pending)
+                if code is None:
+                    break
+                pending.append((code, executor.submit(fetch, code)))
+            if not pending:
+                break
+            if ordered:
+                code, future = pending.popleft()
+                yield code, future.result()
+            else:
+                done, _ = wait([future for _, future in pending], return_when=FIRST_COMPLETED)
+                for item in [item for item in pending if item[1] in done]:
+                    pending.remove(item)
+                    yield item[0], item[1].result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def clean_codes(codes):
+    """Codes of the lines of a list, without quotes and whitespace around them."""
+    return [c.strip("'\" \t\n\r") for c in codes]
+
+
+def group_codes(codes):
+    """
+    Group the codes by their canonical form (``clear_code``) so every area is requested once.
+
+    Return a dict mapping the first variant of each group, used for the request,
+    to all the input codes of the group in input order.
+    """
+    groups = {}
+    for code in codes:
+        groups.setdefault(clear_code(code), []).append(code)
+    return {variants[0]: variants for variants in groups.values()}
+
 
-        percent = ((success + len(with_error) + len(with_no_coord)) / len(codes)) * 100
-        print(", %i%%" % percent)
+def _checkpoints(writers):
+    return {writer.file_format: writer.checkpoint() for writer in writers}
 
-        if area:
-            areas.append(area)
-            feature = area_json_output(output, area)
-            if feature:
-                features.append(feature)
-            # area_csv_output(output, area)
 
+def _print_summary(success, with_error, with_no_coord, adapter, saved=0, snapshot=None):
     print("=================")
     print("Parsing complete:")
     print("  success     : %i" % success)
     print("  error       : %i" % len(with_error))
     print("  no_coord    : %i" % len(with_no_coord))
+    if saved:
+        print("  deduplicated: %i requests saved" % saved)
+    connections = adapter.stats()
+    if connections:
+        print("  connections : %i opened, %i reused" % (connections["opened"], connections["reused"]))
+    phases = snapshot.phases() if snapshot else {}
+    if phases:
+        print("  time, ms    :      mean       p99     count")
+        for phase, summary in phases.items():
+            mean, p99 = summary["mean"] * 1000, summary["p99"] * 1000
+            print("    %-10s: %9.2f %9.2f %9i" % (phase, mean, p99, summary["count"]))
     print("-----------------")
 
-    if len(with_error) and repeat:
-        print("Retries parse areas with error")
-        batch_parser(
-            with_error,
-            with_log=with_log,
-            file_name=file_name,
-            repeat=repeat - 1,
-            areas=areas,
-            output=output,
-            delay=delay,
-            **kwargs
-        )
+
+def batch_parser(
+    codes,
+    with_log=False,
+    file_name="example",
+    areas=None,
+    output=os.path.join("output"),
+    repeat=0,
+    delay=1,
+    workers=1,
+    ordered=True,
+    rate=None,
+    formats=DEFAULT_BATCH_FORMATS,
+    resume=False,
+    prefetch=False,
+    metrics_sinks=None,
+    shard=None,
+    check_proxies=False,
+    **kwargs
+):
+    """
+    Fetch the areas of ``codes`` and stream the found features to the batch outputs (``formats``).
+
+    Results are written as they arrive, so memory use does not grow with the list size.
+    Area objects are only collected if a list is passed as ``areas``.
+
+    The status of every code is recorded in ``<output>/<file_name>.journal.jsonl``.
+    With ``resume=True`` the codes already done are skipped and the outputs are continued
+    from the last journaled checkpoint, so a feature written but not journaled is not repeated.
+
+    Duplicates and variants of the same code (e.g. differing by leading zeros) are requested
+    once, the result is written for every input line.
+
+    With ``check_proxies=True`` (and ``with_proxy=True``) every proxy is tried once, concurrently,
+    before the batch starts; the failing ones are put on cool-down.
+
+    With ``prefetch=True`` parcels are looked up quarter by quarter first (one request per
+    quarter holding several listed parcels) and the found ones are served from the cache.
+
+    A code failed by a transient error is re-queued up to ``repeat`` times with an exponential backoff, interleaved
+    with the remaining codes. All requests share a circuit breaker pausing the batch while
+    the server answers with 403/429.
+
+    Request counts and the time spent in every phase (connect, ttfb, parse, export...)
+    during the batch are summarized at the end and passed to every sink of ``metrics_sinks``
+    (e.g. ``JsonSummarySink``, ``PrometheusTextSink`` from ``rosreestr2coord.metrics``).
+
+    With a ``shard`` (``rosreestr2coord.shard.Shard``) only its part of the codes is fetched,
+    the outputs are named ``<file_name>.part-i-of-N`` and the proxies of the default list
+    are split between the shards.
+    """
+    codes = clean_codes(codes)
+    if shard is not None:
+        codes = [c for c in codes if shard.contains_code(c)]
+        file_name = shard.file_name(file_name)
+        if kwargs.get("with_proxy") and not kwargs.get("proxy_handler"):
+            kwargs["proxy_handler"] = shard.proxy_pool(kwargs.get("media_path"))
+        print("Shard %i of %i: %i codes" % (shard.index, shard.count, len(codes)))
+    journal = BatchJournal(os.path.join(output, "%s.journal.jsonl" % file_name), resume=resume)
+    with_no_coord = [c for c in dict.fromkeys(codes) if journal.statuses.get(c) == STATUS_NO_COORD]
+    with_error = []
+    success = 0
+    if resume:
+        skipped = len(codes)
+        codes = [c for c in codes if not journal.is_done(c)]
+        print("Resume: %i areas are already done" % (skipped - len(codes)))
+
+    def fetch(code):
+        journal.record(code, STATUS_PENDING)
+        return _fetch_area(code, with_log, kwargs)
+
+    if workers > 1 and "rate_limiter" not in kwargs:
+        # Every proxy (and the direct connection) keeps the sequential pace of one request per `delay`,
+        # `rate` additionally caps the whole batch.
+        kwargs["rate_limiter"] = RateLimiter(rate=rate, per_proxy_rate=1 / delay if delay else None, burst=workers)
+
+    if "retry_policy" not in kwargs:
+        breaker = CircuitBreaker(on_open=lambda pause: print("The server is blocking requests, pause for %i s" % pause))
+        kwargs["retry_policy"] = RetryPolicy(breaker=breaker)
+    requeue_policy = RetryPolicy(tries=repeat + 1, base_delay=max(delay, 1), max_delay=300)
+
+    groups = group_codes(codes)
+    saved = len(codes) - len(groups)
+    if check_proxies and kwargs.get("with_proxy") and groups:
+        working = _check_proxies(next(iter(groups)), max(workers, 10), kwargs)
+        print("Proxy check: %i proxies are working" % working)
+    if prefetch and kwargs.get("area_type") in (None, 1) and kwargs.get("use_cache", True):
+        seeded = prefetch_quarters(groups, delay=0 if workers > 1 else delay, **kwargs)
+        print("Prefetched by quarter: %i areas" % seeded)
+
+    print("================================")
+    print("Launched parsing of %i areas:" % len(codes))
+    if saved:
+        print("%i duplicate codes are not requested again" % saved)
+    print("================================")
+
+    writers = open_batch_writers(
+        output,
+        file_name,
+        formats,
+        crs_name=kwargs.get("coord_out", "EPSG:4326"),
+        append=resume,
+        checkpoints=journal.outputs,
+    )
+    journal.record_outputs(_checkpoints(writers))
+    queue = RetryQueue(groups)
+    attempts = {}
+    if workers > 1:
+        results = _iter_concurrent(queue, fetch, workers, ordered)
     else:
-        path = batch_csv_output(output, areas, file_name)
-        if len(with_no_coord):
-            path = batch_csv_output(output, areas, "%s_no_coord" % file_name)
-            print("Create output for no_coord complete: %s" % path)
-        if len(features):
-            path = batch_json_output(output, areas, file_name)
-            print("Create output complete: %s" % path)
-        if len(with_error):
-            print("-----------------")
-            print("Error list:")
-            for e in with_error:
-                print(e)
+        results = _iter_sequential(queue, fetch, delay)
+
+    metrics = get_metrics()
+    before = metrics.snapshot()
+    done = 0
+    unjournaled = False
+    try:
+        for requested, (area, status) in results:
+            # A code that failed for good (400, invalid area type or CRS) isn't requested again
+            if status == STATUS_ERROR and area is not None and requeue_policy.is_retryable(area.exception):
+                attempts[requested] = attempts.get(requested, 0) + 1
+                if attempts[requested] < requeue_policy.tries:
+                    retry_in = requeue_policy.delay(attempts[requested], area.exception)
+                    print("{} - error, retry in {:.0f} s".format(requested, retry_in))
+                    queue.push(requested, retry_in)
+                    continue
+            if status == STATUS_OK:
+                feature = area.to_geojson(dumps=False)
+                start = time.perf_counter()
+                area_json_output(output, area)
+                metrics.phase("export", time.perf_counter() - start)
+            for code in groups[requested]:
+                done += 1
+                if status == STATUS_OK:
+                    success += 1
+                elif status == STATUS_NO_COORD:
+                    with_no_coord.append(code)
+                else:
+                    with_error.append(code)
+
+                percent = (done / len(codes)) * 100
+                print("{} - {}, {}%".format(code, status.replace("_", " "), int(percent)))
+
+                outputs = None
+                if status == STATUS_OK:
+                    start = time.perf_counter()
+                    unjournaled = True
+                    for writer in writers:
+                        writer.write(feature)
+                        writer.flush()
+                    outputs = _checkpoints(writers)
+                    metrics.phase("export", time.perf_counter() - start)
+                # Recorded only once the outputs are flushed, so a done code is never lost
+                journal.record(code, status, outputs)
+                unjournaled = False
+                if area and areas is not None and status != STATUS_ERROR:
+                    areas.append(area)
+    except TimeoutException:
+        print("Your IP is probably blocked. Try later or use proxy")
+    finally:
+        # Stop the workers right away on Ctrl+C
+        results.close()
+        for writer in writers:
+            if unjournaled:
+                # Stopped between writing a feature and journaling it: the code is not done yet
+                writer.rollback(journal.outputs.get(writer.file_format))
+            writer.close()
+        journal.close()
+
+    snapshot = metrics.snapshot() - before
+    _print_summary(success, with_error, with_no_coord, kwargs.get("adapter") or get_request_adapter(), saved, snapshot)
+    for sink in metrics_sinks or ():
+        sink.emit(snapshot)
+
+    if len(with_no_coord):
+        path = codes_csv_output(output, with_no_coord, "%s_no_coord" % file_name)
+        print("Create output for no_coord complete: %s" % path)
+    for writer in writers:
+        if writer.count:
+            print("Create output complete: %s" % writer.path)
+    if len(with_error):
+        print("-----------------")
+        print("Error list:")
+        for e in with_error:
+            print(e)
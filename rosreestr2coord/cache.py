@@ -0,0 +1,166 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+from . import jsonlib
+from .utils import clear_code
+
+DEFAULT_TTL = 3600 * 24 * 7  # 7 days
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024  # 512 MB
+EVICTION_RATIO = 0.9
+
+_caches: Dict[str, "ResponseCache"] = {}
+_caches_lock = threading.Lock()
+
+
+def make_cache_key(area_type: int, code: str, crs: str) -> str:
+    """Content address of a search response: thematicSearchId + normalized code + CRS."""
+    raw = f"{area_type}|{clear_code(code.strip())}|{crs.upper()}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk cache of nspd search responses.
+
+    Entries are stored as ``<path>/<key[:2]>/<key>.json``. The file mtime is
+    the write time and is used for TTL, the atime is refreshed on every hit
+    and is used for LRU eviction once the cache grows above ``max_size`` bytes.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = DEFAULT_TTL, max_size: Optional[int] = DEFAULT_MAX_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._total_size: Optional[int] = None
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._entry_path(key)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        now = time.time()
+        if self.ttl is not None and now - stat.st_mtime > self.ttl:
+            self._remove(path, stat.st_size)
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = jsonlib.loads(f.read())
+        except (OSError, ValueError):
+            self._remove(path, stat.st_size)
+            return None
+        try:
+            os.utime(path, (now, stat.st_mtime))
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: dict) -> None:
+        path = self._entry_path(key)
+        content = jsonlib.dumps_bytes(data)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._total_size is None:
+                self._total_size = sum(size for _, size, _ in self._scan())
+            else:
+                self._total_size += len(content) - old_size
+            if self.max_size is not None and self._total_size > self.max_size:
+                self._evict()
+
+    def responses(self) -> Iterator[dict]:
+        """Yield every response that has not expired, without refreshing their LRU order."""
+        now = time.time()
+        for path, _, _ in list(self._scan()):
+            try:
+                if self.ttl is not None and now - os.path.getmtime(path) > self.ttl:
+                    continue
+                with open(path, "rb") as f:
+                    data = jsonlib.loads(f.read())
+            except (OSError, ValueError):
+                continue
+            yield data
+
+    def last_modified(self) -> float:
+        """Last time an entry was added or removed (mtime of the bucket directories), 0 for an empty cache."""
+        try:
+            buckets = [entry for entry in os.scandir(self.path) if entry.is_dir()]
+        except OSError:
+            return 0.0
+        return max((bucket.stat().st_mtime for bucket in buckets), default=0.0)
+
+    def delete(self, key: str) -> None:
+        path = self._entry_path(key)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        self._remove(path, size)
+
+    def clear(self) -> None:
+        for path, size, _ in list(self._scan()):
+            self._remove(path, size)
+
+    def _remove(self, path: str, size: int) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._total_size is not None:
+                self._total_size = max(self._total_size - size, 0)
+
+    def _scan(self) -> Iterator[Tuple[str, int, float]]:
+        """Yield ``(path, size, atime)`` for every entry in the cache."""
+        try:
+            buckets = list(os.scandir(self.path))
+        except OSError:
+            return
+        for bucket in buckets:
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_atime
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache fits into ``max_size``."""
+        entries = sorted(self._scan(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        limit = self.max_size * EVICTION_RATIO
+        for path, size, _ in entries:
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._total_size = total
+
+
+def get_cache(path: str, **kwargs) -> ResponseCache:
+    """Return a process-wide cache instance for ``path`` so batch workers share size accounting."""
+    path = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = ResponseCache(path, **kwargs)
+            _caches[path] = cache
+        return cache
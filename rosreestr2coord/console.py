@@ -1,18 +1,56 @@
 #!/usr/bin/env python
 # coding: utf-8
 import argparse
-import importlib.metadata
-import json
+import functools
 import os
 import signal
 import sys
 
+from . import jsonlib
 from .batch import batch_parser
-from .export import area_csv_output
+from .cache import get_cache
+from .crs import validate_crs
+from .export import BATCH_WRITERS, DEFAULT_BATCH_FORMATS, area_csv_output
+from .logger import configure_logging
+from .metrics import JsonSummarySink, PrometheusTextSink, get_metrics
 from .parser import TYPES, Area
+from .request.request import ADAPTERS, create_adapter
+from .spatial_index import INDEX_FILE_NAME, get_spatial_index
 from .utils import code_to_filename
 
-__version__ = importlib.metadata.version("rosreestr2coord")
+
+def get_version():
+    # importlib.metadata is slow to import and scans the installed distributions, so only for --version
+    import importlib.metadata
+
+    try:
+        return importlib.metadata.version("rosreestr2coord")
+    except importlib.metadata.PackageNotFoundError:
+        # Run from a source checkout that is not installed
+        return "unknown"
+
+
+def __getattr__(name):
+    if name == "__version__":
+        return get_version()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def shard_spec(value):
+    # Imported here, only needed for sharded batches
+    from .shard import Shard
+
+    try:
+        return Shard.parse(value)
+    except ValueError as er:
+        raise argparse.ArgumentTypeError(str(er))
+
+
+def crs_name(value):
+    try:
+        return validate_crs(value)
+    except ValueError as er:
+        raise argparse.ArgumentTypeError(str(er))
 
 
 def getopts():
@@ -29,9 +67,12 @@ def getopts():
         "--area_type",
         type=int,
         default=1,
-        help=f"area types: {', '.join(f'{k}: {v}' for k, v in TYPES.items())}",
+        help=f"area types: {', '.join(f'{k}: {v}' for k, v in TYPES.items())}, 0: detect by the code",
     )
     parser.add_argument("-p", "--path", type=str, help="media path")
+    parser.add_argument(
+        "--crs", type=crs_name, default="EPSG:4326", help="output CRS (other than EPSG:4326/EPSG:3857 requires pyproj)"
+    )
     parser.add_argument("-o", "--output", type=str, default=os.path.join(os.getcwd(), "output"), help="output path")
     parser.add_argument("-l", "--list", type=str, help="path of file with cadastral codes list")
     parser.add_argument("-d", "--display", action="store_true", help="display plot (only for --code mode)")
@@ -41,14 +82,118 @@ def getopts():
     parser.add_argument("-P", "--proxy", action="store_true", help="use proxies")
     parser.add_argument("-v", "--version", action="store_true", help="show current version")
     parser.add_argument("-u", "--proxy_url", type=str, help="set proxy URL")
+    parser.add_argument(
+        "--log", type=str, nargs="?", const="debug.log", metavar="PATH", help="write a debug log (default: debug.log)"
+    )
+    parser.add_argument("--adapter", type=str, choices=ADAPTERS, default="urllib", help="HTTP client")
+    parser.add_argument("--http2", action="store_true", help="use HTTP/2 (only for --adapter httpx)")
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="number of parallel requests (only for --list mode)"
+    )
+    parser.add_argument(
+        "--rate", type=float, help="max requests per second for the whole batch (only for --list mode with --workers)"
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        type=str,
+        action="append",
+        choices=list(BATCH_WRITERS),
+        help=f"batch output format, can be repeated "
+        f"(default: {', '.join(DEFAULT_BATCH_FORMATS)}; only for --list mode)",
+    )
+    parser.add_argument(
+        "--unordered", action="store_true", help="emit results as soon as they are ready (only for --list mode)"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip the codes already done by a previous run and continue its outputs (only for --list mode)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="how many times a code failed by a transient error is queued again, with a growing delay "
+        "(only for --list mode)",
+    )
+    parser.add_argument(
+        "--check-proxies",
+        action="store_true",
+        help="try every proxy once before the batch and put the failing ones aside (only for --list mode with -P)",
+    )
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="request parcels of the same cadastral quarter with one query (only for --list mode)",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        type=str,
+        metavar="PATH",
+        help="write request counts and time per phase (dns, connect, tls, ttfb, download, parse, transform, export) "
+        "as JSON at the end, '-' for stdout",
+    )
+    parser.add_argument("--metrics-prom", type=str, metavar="PATH", help="write the metrics as a Prometheus text file")
+    sharding = parser.add_mutually_exclusive_group()
+    sharding.add_argument(
+        "--shard",
+        type=shard_spec,
+        metavar="i/N",
+        help="fetch only the part i of N of the list, e.g. on one of N machines (only for --list mode)",
+    )
+    sharding.add_argument(
+        "--shards",
+        type=int,
+        metavar="N",
+        help="split the list into N shards run by local processes and merge their outputs (only for --list mode)",
+    )
+    sharding.add_argument(
+        "--merge",
+        type=int,
+        metavar="N",
+        help="merge the outputs of the N shards of the list run with --shard and exit (only for --list mode)",
+    )
+    parser.add_argument("--processes", type=int, help="max number of shard processes at once (default: --shards)")
+
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    index = subparsers.add_parser(
+        "index",
+        help="find cached areas by point or box with a spatial index stored next to the cache",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    index.add_argument("--point", type=float, nargs=2, metavar=("X", "Y"), help="areas containing the point (in --crs)")
+    index.add_argument(
+        "--bbox", type=float, nargs=4, metavar=("MINX", "MINY", "MAXX", "MAXY"), help="areas intersecting the box"
+    )
+    index.add_argument("--rebuild", action="store_true", help="build the index from the cache again")
+    index.add_argument("--geojson", action="store_true", help="print the areas found as a GeoJSON FeatureCollection")
+
+    serve = subparsers.add_parser(
+        "serve",
+        help="run a lookup service keeping connections, proxies and cache warm (GET /area?code=...)",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    serve.add_argument("--host", type=str, default="127.0.0.1", help="address to listen on")
+    serve.add_argument("--port", type=int, default=8765, help="port to listen on")
+    serve.add_argument("--socket", type=str, metavar="PATH", help="listen on a unix socket instead of --host/--port")
     return parser.parse_args()
 
 
-def handle_batch_processing(file_path, output, delay, kwargs):
+def list_file_name(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def handle_batch_processing(file_path, output, delay, kwargs, shards=None, processes=None, **options):
     with open(file_path, "r") as file:
         codes = file.readlines()
-    file_name = os.path.splitext(os.path.basename(file_path))[0]
-    batch_parser(codes, output=output, delay=delay, file_name=file_name, **kwargs)
+    file_name = list_file_name(file_path)
+    if shards:
+        from .shard import run_shards
+
+        run_shards(codes, shards, processes, output=output, delay=delay, file_name=file_name, **options, **kwargs)
+    else:
+        batch_parser(codes, output=output, delay=delay, file_name=file_name, **options, **kwargs)
 
 
 def get_by_code(code, output, display, **kwargs):
@@ -87,26 +232,107 @@ def save_file(content, output_path, file_name, extension):
     print(f"{extension} - {file_path}")
 
 
-def run_console(opt):
-    kwargs = {
+def run_index(opt):
+    cache = get_cache(os.path.join(opt.path or os.getcwd(), "tmp", "cache"))
+    index = get_spatial_index(cache, crs=opt.crs, rebuild=opt.rebuild)
+    if opt.point:
+        features = index.query_point(*opt.point)
+    elif opt.bbox:
+        features = index.query_bbox(*opt.bbox)
+    else:
+        print(f"Spatial index of {len(index)} cached areas: {os.path.join(cache.path, INDEX_FILE_NAME)}")
+        return
+    if opt.geojson:
+        print(jsonlib.dumps({"type": "FeatureCollection", "features": features}))
+        return
+    for feature in features:
+        props = feature.get("properties") or {}
+        print((props.get("options") or {}).get("cad_num") or props.get("label"))
+
+
+def metrics_sinks(opt):
+    sinks = []
+    if opt.metrics_json:
+        sinks.append(JsonSummarySink(opt.metrics_json))
+    if opt.metrics_prom:
+        sinks.append(PrometheusTextSink(opt.metrics_prom))
+    return sinks
+
+
+def area_options(opt):
+    return {
         "media_path": opt.path,
         "with_proxy": opt.proxy,
-        "area_type": opt.area_type,
         "use_cache": not opt.refresh,
-        "coord_out": "EPSG:4326",
+        "coord_out": opt.crs,
         "proxy_url": opt.proxy_url,
+        "adapter": create_adapter(opt.adapter, http2=opt.http2),
     }
 
+
+def run_serve(opt):
+    # Imported here, the server is not needed by the other commands
+    from .server import serve
+
+    serve(opt.host, opt.port, opt.socket, **area_options(opt))
+
+
+def run_merge(opt):
+    from .shard import merge_shards
+
+    merge_shards(opt.output, list_file_name(opt.list), opt.merge, opt.format or DEFAULT_BATCH_FORMATS, opt.crs)
+
+
+def run_console(opt):
+    kwargs = {**area_options(opt), "area_type": opt.area_type or None}
+
     if opt.list:
-        handle_batch_processing(opt.list, opt.output, opt.delay, kwargs)
+        if opt.shards:
+            # Adapters can't be passed to other processes, every shard creates its own
+            del kwargs["adapter"]
+            kwargs["adapter_factory"] = functools.partial(create_adapter, opt.adapter, http2=opt.http2)
+        else:
+            kwargs["shard"] = opt.shard
+        handle_batch_processing(
+            opt.list,
+            opt.output,
+            opt.delay,
+            kwargs,
+            shards=opt.shards,
+            processes=opt.processes,
+            workers=opt.workers,
+            ordered=not opt.unordered,
+            rate=opt.rate,
+            formats=opt.format or DEFAULT_BATCH_FORMATS,
+            resume=opt.resume,
+            prefetch=opt.prefetch,
+            check_proxies=opt.check_proxies,
+            repeat=opt.retries,
+            metrics_sinks=metrics_sinks(opt),
+        )
     elif opt.code:
+        before = get_metrics().snapshot()
         get_by_code(opt.code, opt.output, opt.display, **kwargs)
+        snapshot = get_metrics().snapshot() - before
+        for sink in metrics_sinks(opt):
+            sink.emit(snapshot)
 
 
 def console():
     opt = getopts()
     if opt.version:
-        print(__version__)
+        print(get_version())
+        return
+    if opt.log:
+        configure_logging(opt.log)
+    if opt.command == "index":
+        run_index(opt)
+        return
+    if opt.command == "serve":
+        run_serve(opt)
+        return
+    if opt.list and opt.merge:
+        run_merge(opt)
         return
 
     def signal_handler(signalnum, frame):
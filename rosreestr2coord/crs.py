@@ -0,0 +1,168 @@
+import functools
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .utils import first_position, rings_to_wgs, transform_geometry
+
+WGS84 = "EPSG:4326"
+WEB_MERCATOR = "EPSG:3857"
+# CRS the nspd search API can return, anything else is reprojected on the client
+SERVER_CRS = (WEB_MERCATOR, WGS84)
+
+# WKT of the CRS the package works with out of the box, others need pyproj
+WKT = {
+    WGS84: (
+        'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],'
+        'AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],'
+        'UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+        'AUTHORITY["EPSG","4326"]]'
+    ),
+    WEB_MERCATOR: (
+        'PROJCS["WGS 84 / Pseudo-Mercator",GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,'
+        'AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],'
+        'UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]],'
+        'PROJECTION["Mercator_1SP"],PARAMETER["central_meridian",0],PARAMETER["scale_factor",1],'
+        'PARAMETER["false_easting",0],PARAMETER["false_northing",0],UNIT["metre",1,AUTHORITY["EPSG","9001"]],'
+        'AXIS["Easting",EAST],AXIS["Northing",NORTH],AUTHORITY["EPSG","3857"]]'
+    ),
+}
+
+ALIASES = {
+    "EPSG:900913": WEB_MERCATOR,
+    "EPSG:102100": WEB_MERCATOR,
+    "EPSG:102113": WEB_MERCATOR,
+    "CRS84": WGS84,
+    "OGC:CRS84": WGS84,
+}
+
+RingsTransformer = Callable[[List[list]], List[list]]
+
+_transformers: Dict[Tuple[str, str], RingsTransformer] = {
+    (WEB_MERCATOR, WGS84): rings_to_wgs,
+}
+_transformers_lock = threading.Lock()
+
+
+def normalize_crs(name: str) -> str:
+    """Bring ``urn:ogc:def:crs:EPSG::3857``, ``epsg:3857`` etc. to the ``EPSG:3857`` form."""
+    name = name.strip()
+    match = re.match(r"^urn:ogc:def:crs:(\w+):[\d.]*:(\w+)$", name, re.IGNORECASE)
+    if match:
+        name = f"{match.group(1)}:{match.group(2)}"
+    if re.match(r"^(epsg|ogc|crs)", name, re.IGNORECASE):
+        name = name.upper()
+    return ALIASES.get(name, name)
+
+
+def _crs_member(obj: Optional[dict]) -> Optional[str]:
+    if not isinstance(obj, dict):
+        return None
+    crs = obj.get("crs")
+    if isinstance(crs, dict):
+        return (crs.get("properties") or {}).get("name")
+    return None
+
+
+def epsg_code(name: str) -> Optional[int]:
+    """EPSG code of the CRS, None for other authorities."""
+    match = re.match(r"^EPSG:(\d+)$", normalize_crs(name))
+    return int(match.group(1)) if match else None
+
+
+def crs_wkt(name: str) -> Optional[str]:
+    """WKT definition of the CRS (built in for WGS 84 and Web-Mercator, pyproj for others), None if unknown."""
+    name = normalize_crs(name)
+    if name in WKT:
+        return WKT[name]
+    try:
+        from pyproj import CRS
+    except ImportError:
+        return None
+    try:
+        return CRS.from_user_input(name).to_wkt("WKT1_GDAL")
+    except (RuntimeError, ValueError):
+        return None
+
+
+def detect_crs(feature: dict, response: Optional[dict] = None) -> str:
+    """
+    Find out the CRS of a feature returned by the API.
+
+    The ``crs`` member of the geometry, the feature or the response is used when
+    present, otherwise the CRS is guessed from the coordinate range.
+    """
+    data = response.get("data") if isinstance(response, dict) else None
+    for obj in (feature.get("geometry"), feature, data, response):
+        name = _crs_member(obj)
+        if name:
+            return normalize_crs(name)
+    position = first_position(feature.get("geometry") or {})
+    if position and abs(position[0]) <= 180 and abs(position[1]) <= 90:
+        return WGS84
+    return WEB_MERCATOR
+
+
+def request_crs(coord_out: str) -> str:
+    """CRS to ask the API for: the target itself if the server supports it, Web-Mercator otherwise."""
+    target = normalize_crs(coord_out)
+    return target if target in SERVER_CRS else WEB_MERCATOR
+
+
+def validate_crs(name: str) -> str:
+    """Normalized name of an output CRS, ValueError if the features can't be transformed to it."""
+    name = normalize_crs(name)
+    try:
+        get_transformer(request_crs(name), name)
+    except (RuntimeError, ValueError) as er:
+        raise ValueError(f"Unsupported CRS {name}: {er}") from None
+    return name
+
+
+def register_transformer(src: str, dst: str, transformer: RingsTransformer) -> None:
+    """
+    Register a coordinate transformation.
+
+    ``transformer`` gets a list of rings (lists of ``[x, y]`` positions) and returns
+    the transformed rings in the same order.
+    """
+    with _transformers_lock:
+        _transformers[(normalize_crs(src), normalize_crs(dst))] = transformer
+    get_transformer.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def get_transformer(src: str, dst: str) -> RingsTransformer:
+    """Registered transformer for the pair or one built with pyproj (cached per pair)."""
+    src, dst = normalize_crs(src), normalize_crs(dst)
+    with _transformers_lock:
+        transformer = _transformers.get((src, dst))
+    if transformer:
+        return transformer
+    try:
+        from pyproj import Transformer
+    except ImportError:
+        raise ValueError(f"Transformation from {src} to {dst} requires pyproj (pip install pyproj)")
+    proj = Transformer.from_crs(src, dst, always_xy=True)
+
+    def transform(rings: List[list]) -> List[list]:
+        result = []
+        for ring in rings:
+            xs, ys = proj.transform([p[0] for p in ring], [p[1] for p in ring])
+            result.append([[x, y] for x, y in zip(xs, ys)])
+        return result
+
+    return transform
+
+
+def reproject(feature: dict, src: str, dst: str) -> dict:
+    """Reproject the feature geometry in place, existing ``crs`` members are updated to ``dst``."""
+    src, dst = normalize_crs(src), normalize_crs(dst)
+    geom = feature.get("geometry")
+    if not geom or src == dst:
+        return feature
+    transform_geometry(geom, get_transformer(src, dst))
+    for obj in (geom, feature):
+        if _crs_member(obj):
+            obj["crs"] = {"type": "name", "properties": {"name": dst}}
+    return feature
@@ -1,41 +1,52 @@
 import os
 import csv
-import json
+import importlib
+import io
+import zipfile
 import xml.etree.cElementTree as ET
+from abc import ABC, abstractmethod
+
+from . import jsonlib
+
+
+def output_path(output, file_name, file_format, out_path=""):
+    """Path of an output file, ``<output>/<out_path or file_format>/<file_name>.<file_format>``."""
+    return os.path.join(os.path.abspath(output), out_path or file_format, f"{file_name}.{file_format}")
 
 
 def make_output(output, file_name, file_format, out_path=""):
-    out_path = out_path or file_format
-    path = os.path.join(os.path.abspath(output), out_path)
+    file_path = output_path(output, file_name, file_format, out_path)
+    path = os.path.dirname(file_path)
     print(f"Creating directory: {path}")
     os.makedirs(path, exist_ok=True)
-    file_path = os.path.join(path, f"{file_name}.{file_format}")
     print(f"File will be saved to: {file_path}")
     return file_path
 
 
+def iter_positions(coords):
+    """Yield every position of (possibly nested) GeoJSON coordinates."""
+    if coords and isinstance(coords[0], (int, float)):
+        yield coords
+        return
+    for part in coords or []:
+        yield from iter_positions(part)
+
+
 def _write_csv_row(writer, area, header=False):
     try:
-        geometry = area.feature.get('geometry', {})
-        coords = geometry.get('coordinates', [])
-
-        transformed_coords = []
-        for geom in coords:
-            for poly in geom:
-                print(poly)
-                if isinstance(poly, list):
-                    poly[0], poly[1] = poly[1], poly[0]
-                    transformed_coords.append(poly)
         if header:
             writer.writerow(["longitude", "latitude"])
-
-        for coord in transformed_coords:
-            writer.writerow([coord[0], coord[1]])
-
+        feature = area.feature or {}
+        _write_csv_feature(writer, feature)
     except Exception as er:
         print(f"Error: {er}")
 
 
+def _write_csv_feature(writer, feature):
+    coords = (feature.get("geometry") or {}).get("coordinates", [])
+    writer.writerows(position[:2] for position in iter_positions(coords))
+
+
 def area_csv_output(output, area):
     path = make_output(output, area.file_name, "csv")
     print(f"Writing CSV to: {path}")
@@ -53,21 +64,21 @@ def batch_csv_output(output, areas, file_name):
     return path
 
 
-def batch_json_output(output, areas, file_name, with_attrs=True, crs_name="EPSG:4326"):
-    features = [a.to_geojson_poly(with_attrs, dumps=False) for a in areas if a.to_geojson_poly(with_attrs, dumps=False)]
+def batch_json_output(output, areas, file_name, with_attrs=True, crs_name="EPSG:4326", indent=False):
+    features = [a.to_geojson(dumps=False) for a in areas if a.feature]
     geojson = {
         "type": "FeatureCollection",
         "crs": {"type": "name", "properties": {"name": crs_name}},
         "features": features,
     }
     path = make_output(output, file_name, "geojson")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(geojson, f, ensure_ascii=False, indent=4)
+    with open(path, "wb") as f:
+        f.write(jsonlib.dumps_bytes(geojson, indent=indent))
     return path
 
 
 def area_json_output(output, area, with_attrs=True):
-    geojson = area.to_geojson_poly(with_attrs)
+    geojson = area.to_geojson()
     if geojson:
         path = make_output(output, area.file_name, "geojson")
         with open(path, "w", encoding="utf-8") as f:
@@ -75,6 +86,466 @@ def area_json_output(output, area, with_attrs=True):
     return geojson
 
 
+def codes_csv_output(output, codes, file_name):
+    path = make_output(output, file_name, "csv")
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["code"])
+        writer.writerows([code] for code in codes)
+    return path
+
+
+def _last_line_start(f, end, chunk_size=65536):
+    """Offset of the first byte after the last newline before ``end``."""
+    pos = end
+    while pos > 0:
+        size = min(chunk_size, pos)
+        pos -= size
+        f.seek(pos)
+        index = f.read(size).rfind(b"\n")
+        if index != -1:
+            return pos + index + 1
+    return 0
+
+
+def _truncate(path, size):
+    """Cut the file to ``size`` bytes if it is longer."""
+    with open(path, "rb+") as f:
+        if f.seek(0, os.SEEK_END) > size:
+            f.truncate(size)
+
+
+def _drop_torn_line(path):
+    """Drop the last line of the file if it has no newline (torn by a crash)."""
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        f.truncate(_last_line_start(f, end))
+
+
+class BatchWriter(ABC):
+    """
+    Base class of the batch writers: features are written as they arrive and nothing is kept in memory.
+
+    With ``append=True`` an existing output is continued (used to resume a batch). A
+    ``checkpoint`` (see :meth:`checkpoint`) taken by an earlier run cuts the continued
+    output back to that point, dropping the features written after it.
+    """
+
+    file_format = ""
+    out_path = ""
+
+    def __init__(self, output, file_name, crs_name="EPSG:4326", append=False, checkpoint=None):
+        self.path = make_output(output, file_name, self.file_format, self.out_path)
+        self.file_name = file_name
+        self.crs_name = crs_name
+        self.append = append
+        self.resume_at = checkpoint
+        self.count = 0
+        self._file = self.open()
+
+    def open(self):
+        return open(self.path, "w", encoding="utf-8", newline="")
+
+    def continues_existing(self):
+        """Whether the writer appends to an existing non-empty file."""
+        return self.append and os.path.exists(self.path) and os.path.getsize(self.path) > 0
+
+    def write(self, feature):
+        self.write_feature(feature)
+        self.count += 1
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def checkpoint(self):
+        """
+        JSON-serializable position of the output after the features written so far (flushed first).
+
+        A batch journals it with every written code, so on resume the output is cut back
+        to the last journaled code and a feature written right before a crash is not repeated.
+        """
+        return self._file.tell()
+
+    def rollback(self, checkpoint):
+        """Drop the features written after ``checkpoint`` and continue from there."""
+        self.release()
+        self.append = True
+        self.resume_at = checkpoint
+        self._file = self.open()
+
+    def _cut_to_checkpoint(self, path):
+        if self.resume_at is not None:
+            _truncate(path, self.resume_at)
+
+    @abstractmethod
+    def write_feature(self, feature):
+        pass
+
+    @abstractmethod
+    def merge(self, paths):
+        """
+        Append the features of finished outputs of the same format, e.g. of the shards of a batch.
+
+        The stored features are copied as they are, without decoding them.
+        """
+
+    def release(self):
+        """Close the files as they are, without finishing the output."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TextBatchWriter(BatchWriter):
+    """Batch writer of a text format storing one feature (or CSV row) per line."""
+
+    def merge(self, paths):
+        for path in paths:
+            for line in self.stored_lines(path):
+                self._file.write(line)
+                self.count += 1
+
+    @abstractmethod
+    def stored_lines(self, path):
+        """Features (rows for CSV) of a finished output, one line each."""
+
+
+class GeoJSONStreamWriter(TextBatchWriter):
+    """
+    FeatureCollection written incrementally: header first, one feature per line, footer on close.
+
+    Every feature is kept on its own line, so a continued file can be checked and
+    repaired after a crash by looking at its last line only.
+    """
+
+    file_format = "geojson"
+    footer = b"\n]}\n"
+
+    def open(self):
+        self._has_features = False
+        if self.continues_existing():
+            self._cut_to_checkpoint(self.path)
+            self._has_features = self._repair_tail()
+            return open(self.path, "a", encoding="utf-8", newline="")
+        f = super().open()
+        crs = jsonlib.dumps({"type": "name", "properties": {"name": self.crs_name}})
+        f.write(f'{{"type": "FeatureCollection", "crs": {crs}, "features": [\n')
+        return f
+
+    def _repair_tail(self):
+        """Drop the footer and a torn last feature of an existing file, return whether it has features."""
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            f.seek(max(end - len(self.footer), 0))
+            if f.read() == self.footer:
+                end -= len(self.footer)
+            start = _last_line_start(f, end)
+            f.seek(start)
+            line = f.read(end - start)
+            if line and not line.endswith(b"["):
+                try:
+                    jsonlib.loads(line)
+                except ValueError:
+                    end = start
+                    f.seek(max(end - 2, 0))
+                    if f.read(2) == b",\n":
+                        end -= 2
+            f.truncate(end)
+            f.seek(max(end - 2, 0))
+            tail = f.read(2)
+            return not (tail.endswith(b"[") or tail == b"[\n")
+
+    def write_feature(self, feature):
+        if self._has_features:
+            self._file.write(",\n")
+        self._file.write(jsonlib.dumps(feature))
+        self._has_features = True
+
+    def merge(self, paths):
+        for path in paths:
+            for line in self.stored_lines(path):
+                if self._has_features:
+                    self._file.write(",\n")
+                self._file.write(line)
+                self._has_features = True
+                self.count += 1
+
+    def stored_lines(self, path):
+        with open(path, encoding="utf-8", newline="") as f:
+            next(f, None)  # header
+            for line in f:
+                line = line.rstrip("\n").rstrip(",")
+                if line and line != "]}":
+                    yield line
+
+    def close(self):
+        if self._file is not None:
+            self._file.write(self.footer.decode())
+        super().close()
+
+
+class GeoJSONSeqWriter(TextBatchWriter):
+    """Newline-delimited GeoJSON (one feature per line), readable by GDAL as GeoJSONSeq."""
+
+    file_format = "geojsonl"
+    out_path = "geojsonseq"
+
+    def open(self):
+        if self.continues_existing():
+            self._cut_to_checkpoint(self.path)
+            # Drop a torn last line left by a crash
+            _drop_torn_line(self.path)
+            return open(self.path, "a", encoding="utf-8", newline="")
+        return super().open()
+
+    def write_feature(self, feature):
+        self._file.write(jsonlib.dumps(feature))
+        self._file.write("\n")
+
+    def stored_lines(self, path):
+        with open(path, encoding="utf-8", newline="") as f:
+            yield from (line for line in f if line.endswith("\n"))
+
+
+class CSVStreamWriter(TextBatchWriter):
+    """Vertices of all features as longitude/latitude rows."""
+
+    file_format = "csv"
+
+    def open(self):
+        if self.continues_existing():
+            self._cut_to_checkpoint(self.path)
+            # Drop a torn last row left by a crash
+            _drop_torn_line(self.path)
+            f = open(self.path, "a", encoding="utf-8", newline="")
+            self._writer = csv.writer(f)
+            return f
+        f = super().open()
+        self._writer = csv.writer(f)
+        self._writer.writerow(["longitude", "latitude"])
+        return f
+
+    def write_feature(self, feature):
+        _write_csv_feature(self._writer, feature)
+
+    def stored_lines(self, path):
+        with open(path, encoding="utf-8", newline="") as f:
+            next(f, None)  # header
+            yield from f
+
+
+KML_NAMESPACE = "http://www.opengis.net/kml/2.2"
+KML_STYLE = (
+    '<Style id="area"><LineStyle><color>ff0000ff</color></LineStyle>'
+    "<PolyStyle><fill>0</fill></PolyStyle></Style>"
+)
+
+
+def escape(text):
+    """Escape ``&``, ``<`` and ``>`` (as xml.sax.saxutils, which pulls in urllib.request on import)."""
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _kml_coordinates(positions):
+    return " ".join(f"{p[0]},{p[1]}" if len(p) == 2 else f"{p[0]},{p[1]},{p[2]}" for p in positions)
+
+
+def _kml_polygon(rings):
+    parts = ["<Polygon>"]
+    for j, ring in enumerate(rings):
+        boundary = "innerBoundaryIs" if j else "outerBoundaryIs"
+        coordinates = _kml_coordinates(ring)
+        parts.append(f"<{boundary}><LinearRing><coordinates>{coordinates}</coordinates></LinearRing></{boundary}>")
+    parts.append("</Polygon>")
+    return "".join(parts)
+
+
+def _kml_geometry(geom):
+    geom_type = geom.get("type")
+    coords = geom.get("coordinates")
+    if geom_type == "Polygon":
+        return _kml_polygon(coords)
+    if geom_type == "MultiPolygon":
+        return "<MultiGeometry>" + "".join(_kml_polygon(rings) for rings in coords) + "</MultiGeometry>"
+    if geom_type == "Point":
+        return f"<Point><coordinates>{_kml_coordinates([coords])}</coordinates></Point>"
+    if geom_type == "LineString":
+        return f"<LineString><coordinates>{_kml_coordinates(coords)}</coordinates></LineString>"
+    if geom_type in ("MultiPoint", "MultiLineString"):
+        single = geom_type[len("Multi"):]
+        return "<MultiGeometry>" + "".join(_kml_geometry({"type": single, "coordinates": c}) for c in coords) + (
+            "</MultiGeometry>"
+        )
+    if geom_type == "GeometryCollection":
+        return "<MultiGeometry>" + "".join(_kml_geometry(g) for g in geom.get("geometries", [])) + "</MultiGeometry>"
+    return ""
+
+
+def feature2placemark(feature):
+    """KML ``Placemark`` of a GeoJSON feature as a single line of text."""
+    attrs = feature.get("properties") or {}
+    name = attrs.get("label") or (attrs.get("options") or {}).get("cad_num") or ""
+    geometry = _kml_geometry(feature.get("geometry") or {})
+    return f"<Placemark><name>{escape(str(name))}</name><styleUrl>#area</styleUrl>{geometry}</Placemark>"
+
+
+def _placemarks(lines):
+    """Complete placemark lines of a KML document written by :class:`KMLStreamWriter`."""
+    return (line for line in lines if line.startswith("<Placemark") and line.endswith("</Placemark>\n"))
+
+
+class KMLStreamWriter(TextBatchWriter):
+    """
+    Single KML document written as text: header first, one ``Placemark`` per line, footer on close.
+
+    No element tree is built, so memory does not grow with the number of areas.
+    """
+
+    file_format = "kml"
+    footer = "</Document></kml>\n"
+
+    def header(self):
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<kml xmlns="{KML_NAMESPACE}"><Document><name>{escape(self.file_name)}</name>{KML_STYLE}\n'
+        )
+
+    def open(self):
+        if self.continues_existing():
+            self._cut_to_checkpoint(self.path)
+            self._repair_tail(self.path)
+            return open(self.path, "a", encoding="utf-8", newline="")
+        f = super().open()
+        f.write(self.header())
+        return f
+
+    def _repair_tail(self, path):
+        """Drop the footer and a torn last placemark of an existing document."""
+        footer = self.footer.encode()
+        with open(path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            f.seek(max(end - len(footer), 0))
+            if f.read() == footer:
+                end -= len(footer)
+            start = _last_line_start(f, end)
+            f.seek(start)
+            if f.read(end - start).strip():
+                # Every complete placemark ends with a newline
+                end = start
+            f.truncate(end)
+
+    def write_feature(self, feature):
+        self._file.write(feature2placemark(feature))
+        self._file.write("\n")
+
+    def stored_lines(self, path):
+        with open(path, encoding="utf-8", newline="") as f:
+            yield from _placemarks(f)
+
+    def close(self):
+        if self._file is not None:
+            self._file.write(self.footer)
+        super().close()
+
+
+class KMZStreamWriter(KMLStreamWriter):
+    """
+    :class:`KMLStreamWriter` whose document is zipped into the ``doc.kml`` entry of a KMZ archive on close.
+
+    Until then ``doc.kml`` is spooled as plain text to ``<path>.kml.part``, so the placemarks
+    flushed before a crash survive it: a spool left behind is repaired and continued. A
+    finished archive can't be appended to, its placemarks are copied to a new spool.
+    """
+
+    file_format = "kmz"
+
+    @property
+    def spool_path(self):
+        return self.path + ".kml.part"
+
+    def open(self):
+        if self.append and os.path.exists(self.spool_path) and os.path.getsize(self.spool_path):
+            # Left by an interrupted run, the archive (if any) is older than the spool
+            self._cut_to_checkpoint(self.spool_path)
+            self._repair_tail(self.spool_path)
+            return open(self.spool_path, "a", encoding="utf-8", newline="")
+        f = open(self.spool_path, "w", encoding="utf-8", newline="")
+        f.write(self.header())
+        if self.continues_existing():
+            try:
+                f.writelines(self.stored_lines(self.path))
+            except (zipfile.BadZipFile, KeyError, EOFError) as er:
+                print(f"Can't continue {self.path}, starting it over: {er}")
+        return f
+
+    def stored_lines(self, path):
+        with zipfile.ZipFile(path) as kmz, kmz.open("doc.kml") as doc:
+            yield from _placemarks(io.TextIOWrapper(doc, encoding="utf-8", newline=""))
+
+    def close(self):
+        if self._file is None:
+            return
+        super().close()
+        tmp_path = self.path + ".tmp"
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as kmz:
+            kmz.write(self.spool_path, "doc.kml")
+        os.replace(tmp_path, self.path)
+        os.remove(self.spool_path)
+
+
+BATCH_WRITERS = {
+    "geojson": GeoJSONStreamWriter,
+    "geojsonseq": GeoJSONSeqWriter,
+    "csv": CSVStreamWriter,
+    "kml": KMLStreamWriter,
+    "kmz": KMZStreamWriter,
+    # Imported on first use, the module depends on this one
+    "gpkg": ".formats:GeoPackageWriter",
+    "fgb": ".formats:FlatGeobufWriter",
+    "shp": ".formats:ShapefileWriter",
+}
+DEFAULT_BATCH_FORMATS = ("geojson", "csv")
+
+
+def get_batch_writer(file_format):
+    """Writer class of a batch output format."""
+    if file_format not in BATCH_WRITERS:
+        options = ", ".join(BATCH_WRITERS)
+        raise ValueError(f"Unknown output format {file_format!r}. Available options: {options}")
+    writer = BATCH_WRITERS[file_format]
+    if isinstance(writer, str):
+        module, _, name = writer.partition(":")
+        writer = BATCH_WRITERS[file_format] = getattr(importlib.import_module(module, __package__), name)
+    return writer
+
+
+def open_batch_writers(
+    output, file_name, formats=DEFAULT_BATCH_FORMATS, crs_name="EPSG:4326", append=False, checkpoints=None
+):
+    """Writers of ``formats``; continued outputs are cut back to ``checkpoints`` (by the writer's file format)."""
+    writers = []
+    try:
+        for file_format in formats:
+            writer_class = get_batch_writer(file_format)
+            checkpoint = (checkpoints or {}).get(writer_class.file_format)
+            writers.append(writer_class(output, file_name, crs_name=crs_name, append=append, checkpoint=checkpoint))
+    except Exception:
+        for writer in writers:
+            writer.close()
+        raise
+    return writers
+
+
 def coords2geojson(coords, geom_type, crs_name, attrs=None):
     if not coords:
         return False
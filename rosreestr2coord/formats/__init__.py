@@ -0,0 +1,11 @@
+"""
+Binary, spatially indexed batch outputs: GeoPackage, FlatGeobuf and Shapefile.
+
+Written with the standard library only and fed by the batch pipeline feature by feature,
+like the text writers of :mod:`rosreestr2coord.export`.
+"""
+from .flatgeobuf import FlatGeobufWriter
+from .geopackage import GeoPackageWriter
+from .shapefile import ShapefileWriter
+
+__all__ = ["FlatGeobufWriter", "GeoPackageWriter", "ShapefileWriter"]
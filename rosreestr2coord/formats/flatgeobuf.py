@@ -0,0 +1,414 @@
+import math
+import os
+import struct
+from array import array
+
+from .. import jsonlib
+from ..crs import epsg_code
+from ..export import BatchWriter
+from .wkb import GEOMETRY_TYPES, flat_xy, geometry_bounds, little_endian
+
+MAGIC = b"fgb\x03fgb\x00"
+NODE_SIZE = 16
+HILBERT_MAX = (1 << 16) - 1
+NODE_ITEM = struct.Struct("<4dQ")
+# Bounds of features without a geometry, they match no search
+EMPTY_BOX = (math.inf, math.inf, -math.inf, -math.inf)
+# Spooled feature: geometry type, bounds and size of the size-prefixed feature that follows
+SPOOL_RECORD = struct.Struct("<B4dI")
+
+# ColumnType of the FlatGeobuf schema
+COLUMN_STRING = 11
+COLUMN_JSON = 12
+COLUMNS = (("cad_num", COLUMN_STRING), ("label", COLUMN_STRING), ("properties", COLUMN_JSON))
+
+# Field kinds of the tables below: struct format of a scalar, "string", "vector:<format>", "table" or "tables"
+_SCALARS = "B?HiIQ"
+
+
+def _inline_size(kind):
+    return struct.calcsize(kind) if kind in _SCALARS else 4
+
+
+class _Builder:
+    """
+    Minimal FlatBuffers writer for size-prefixed buffers.
+
+    Tables are given as lists of ``(slot, kind, value)`` and laid out front to back,
+    children after their parent. Alignment is counted from the size prefix, as the
+    reference implementation does.
+    """
+
+    def __init__(self):
+        self.buf = bytearray(8)  # size prefix and root offset
+
+    def pad(self, align, extra=0):
+        self.buf.extend(bytes(-(len(self.buf) + extra) % align))
+
+    def finish(self, fields):
+        root = self.table(fields)
+        struct.pack_into("<I", self.buf, 4, root - 4)
+        self.pad(4)
+        struct.pack_into("<I", self.buf, 0, len(self.buf) - 4)
+        return bytes(self.buf)
+
+    def table(self, fields):
+        fields = sorted((f for f in fields if f[2] is not None), key=lambda f: -_inline_size(f[1]))
+        slots = max((f[0] for f in fields), default=-1) + 1
+        layout, size = [], 4
+        for slot, kind, value in fields:
+            field_size = _inline_size(kind)
+            size += -size % field_size
+            layout.append((slot, kind, value, size))
+            size += field_size
+        size += -size % 4
+
+        self.pad(2)
+        vtable = len(self.buf)
+        offsets = [0] * slots
+        for slot, _, _, offset in layout:
+            offsets[slot] = offset
+        self.buf += struct.pack(f"<HH{slots}H", 4 + 2 * slots, size, *offsets)
+
+        self.pad(max([_inline_size(f[1]) for f in fields] + [4]))
+        start = len(self.buf)
+        self.buf += bytes(size)
+        struct.pack_into("<i", self.buf, start, start - vtable)
+        children = []
+        for slot, kind, value, offset in layout:
+            if kind in _SCALARS:
+                struct.pack_into("<" + kind, self.buf, start + offset, value)
+            else:
+                children.append((start + offset, kind, value))
+        for position, kind, value in children:
+            struct.pack_into("<I", self.buf, position, self.child(kind, value) - position)
+        return start
+
+    def child(self, kind, value):
+        if kind == "table":
+            return self.table(value)
+        if kind == "string":
+            data = value.encode("utf-8")
+            self.pad(4)
+            start = len(self.buf)
+            self.buf += struct.pack("<I", len(data)) + data + b"\0"
+            return start
+        if kind == "tables":
+            self.pad(4)
+            start = len(self.buf)
+            self.buf += struct.pack("<I", len(value)) + bytes(4 * len(value))
+            for i, fields in enumerate(value):
+                position = start + 4 + 4 * i
+                struct.pack_into("<I", self.buf, position, self.table(fields) - position)
+            return start
+        # Vector of scalars, the elements are aligned to their size
+        item = kind[len("vector:"):]
+        if item == "B":
+            data, count = bytes(value), len(value)
+        else:
+            values = value if isinstance(value, array) else array(item, value)
+            data, count = little_endian(values), len(values)
+        item_size = struct.calcsize(item)
+        if item_size == 8:
+            self.pad(8, 4)
+        else:
+            self.pad(4)
+        start = len(self.buf)
+        self.buf += struct.pack("<I", count) + data
+        return start
+
+
+def _geometry_table(geom):
+    """Fields of the ``Geometry`` table of a GeoJSON geometry (2D)."""
+    geom_type = geom["type"]
+    coords = geom.get("coordinates")
+    fields = [(6, "B", GEOMETRY_TYPES[geom_type])]
+    if geom_type == "Point":
+        return fields + [(1, "vector:d", flat_xy([coords]))]
+    if geom_type in ("LineString", "MultiPoint"):
+        return fields + [(1, "vector:d", flat_xy(coords))]
+    if geom_type in ("Polygon", "MultiLineString"):
+        ends = array("I")
+        for ring in coords:
+            ends.append((ends[-1] if ends else 0) + len(ring))
+        xy = flat_xy(position for ring in coords for position in ring)
+        return fields + [(0, "vector:I", ends if len(ends) > 1 else None), (1, "vector:d", xy)]
+    if geom_type == "MultiPolygon":
+        parts = [{"type": "Polygon", "coordinates": polygon} for polygon in coords]
+    else:
+        parts = geom.get("geometries") or []
+    return fields + [(7, "tables", [_geometry_table(part) for part in parts])]
+
+
+def _properties(values):
+    data = bytearray()
+    for index, value in enumerate(values):
+        if value is not None:
+            encoded = value.encode("utf-8")
+            data += struct.pack("<HI", index, len(encoded)) + encoded
+    return data
+
+
+def encode_feature(feature):
+    """Size-prefixed FlatGeobuf ``Feature`` with the ``cad_num``, ``label`` and ``properties`` columns."""
+    props = feature.get("properties") or {}
+    cad_num = (props.get("options") or {}).get("cad_num") or props.get("label")
+    geom = feature.get("geometry")
+    fields = [(1, "vector:B", _properties((cad_num, props.get("label"), jsonlib.dumps(props))))]
+    if geom and geom.get("type") in GEOMETRY_TYPES:
+        fields.append((0, "table", _geometry_table(geom)))
+    return _Builder().finish(fields)
+
+
+def hilbert(x, y):
+    """Position of ``(x, y)`` (16 bit each) on the Hilbert curve, as in the FlatGeobuf reference code."""
+    a = x ^ y
+    b = 0xFFFF ^ a
+    c = 0xFFFF ^ (x | y)
+    d = x & (y ^ 0xFFFF)
+
+    A = a | (b >> 1)
+    B = (a >> 1) ^ a
+    C = ((c >> 1) ^ (b & (d >> 1))) ^ c
+    D = ((a & (c >> 1)) ^ (d >> 1)) ^ d
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 2)) ^ (b & (b >> 2))
+    B = (a & (b >> 2)) ^ (b & ((a ^ b) >> 2))
+    C ^= (a & (c >> 2)) ^ (b & (d >> 2))
+    D ^= (b & (c >> 2)) ^ ((a ^ b) & (d >> 2))
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 4)) ^ (b & (b >> 4))
+    B = (a & (b >> 4)) ^ (b & ((a ^ b) >> 4))
+    C ^= (a & (c >> 4)) ^ (b & (d >> 4))
+    D ^= (b & (c >> 4)) ^ ((a ^ b) & (d >> 4))
+
+    a, b, c, d = A, B, C, D
+    C ^= (a & (c >> 8)) ^ (b & (d >> 8))
+    D ^= (b & (c >> 8)) ^ ((a ^ b) & (d >> 8))
+
+    a = C ^ (C >> 1)
+    b = D ^ (D >> 1)
+
+    i0 = x ^ y
+    i1 = b | (0xFFFF ^ (i0 | a))
+    i0 = (i0 | (i0 << 8)) & 0x00FF00FF
+    i0 = (i0 | (i0 << 4)) & 0x0F0F0F0F
+    i0 = (i0 | (i0 << 2)) & 0x33333333
+    i0 = (i0 | (i0 << 1)) & 0x55555555
+    i1 = (i1 | (i1 << 8)) & 0x00FF00FF
+    i1 = (i1 | (i1 << 4)) & 0x0F0F0F0F
+    i1 = (i1 | (i1 << 2)) & 0x33333333
+    i1 = (i1 | (i1 << 1)) & 0x55555555
+    return (i1 << 1) | i0
+
+
+def level_bounds(count, node_size=NODE_SIZE):
+    """``(start, end)`` node indexes of every level of a packed R-tree, leaves first."""
+    level_counts = [count]
+    n = count
+    while True:
+        n = math.ceil(n / node_size)
+        level_counts.append(n)
+        if n == 1:
+            break
+    total = sum(level_counts)
+    bounds = []
+    for level_count in level_counts:
+        total -= level_count
+        bounds.append((total, total + level_count))
+    return bounds
+
+
+def packed_rtree(boxes, offsets, node_size=NODE_SIZE):
+    """
+    Nodes of a packed R-tree, root first, as serialized by FlatGeobuf.
+
+    ``boxes`` are the ``(minx, miny, maxx, maxy)`` of the leaves in their final (Hilbert) order
+    and ``offsets`` their byte offsets in the features section.
+    """
+    levels = level_bounds(len(boxes), node_size)
+    nodes = [None] * levels[0][1]
+    start = levels[0][0]
+    for i, (box, offset) in enumerate(zip(boxes, offsets)):
+        nodes[start + i] = (*box, offset)
+    for (pos, end), (parent, _) in zip(levels, levels[1:]):
+        while pos < end:
+            children = nodes[pos : min(pos + node_size, end)]
+            nodes[parent] = (
+                min(n[0] for n in children),
+                min(n[1] for n in children),
+                max(n[2] for n in children),
+                max(n[3] for n in children),
+                pos,
+            )
+            pos += node_size
+            parent += 1
+    return nodes
+
+
+def hilbert_order(boxes, extent):
+    """Indexes of ``boxes`` sorted by the Hilbert value of their centers, as FlatGeobuf does."""
+    minx, miny, maxx, maxy = extent
+    width, height = maxx - minx, maxy - miny
+
+    def value(i):
+        box = boxes[i]
+        if box[0] > box[2]:
+            return 0
+        x = math.floor(HILBERT_MAX * ((box[0] + box[2]) / 2 - minx) / width) if width else 0
+        y = math.floor(HILBERT_MAX * ((box[1] + box[3]) / 2 - miny) / height) if height else 0
+        return hilbert(x, y)
+
+    return sorted(range(len(boxes)), key=value, reverse=True)
+
+
+def _table_field(buf, table, slot, fmt, default):
+    vtable = table - struct.unpack_from("<i", buf, table)[0]
+    entry = 4 + 2 * slot
+    if entry >= struct.unpack_from("<H", buf, vtable)[0]:
+        return default
+    offset = struct.unpack_from("<H", buf, vtable + entry)[0]
+    return struct.unpack_from(fmt, buf, table + offset)[0] if offset else default
+
+
+class FlatGeobufWriter(BatchWriter):
+    """
+    FlatGeobuf with a packed Hilbert R-tree index.
+
+    The index goes before the features and needs them sorted, so the encoded features
+    are spooled to ``<path>.part`` as they arrive (only their bounds are kept in memory)
+    and the file is assembled on close. An existing file or spool is continued on resume.
+    """
+
+    file_format = "fgb"
+
+    def open(self):
+        self.spool_path = self.path + ".part"
+        self._types = set()
+        self._boxes = []
+        self._positions = array("Q")
+        if not self.append:
+            return open(self.spool_path, "wb")
+        if os.path.exists(self.spool_path):
+            self._cut_to_checkpoint(self.spool_path)
+            self._load_spool()
+        elif self.continues_existing():
+            self._spool_existing()
+        return open(self.spool_path, "ab")
+
+    def _load_spool(self):
+        """Read the bounds of the spooled features and drop a torn last one."""
+        with open(self.spool_path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            position = 0
+            while position + SPOOL_RECORD.size <= end:
+                f.seek(position)
+                geom_type, *box, size = SPOOL_RECORD.unpack(f.read(SPOOL_RECORD.size))
+                if position + SPOOL_RECORD.size + size > end:
+                    break
+                self._add(geom_type, box, position)
+                position += SPOOL_RECORD.size + size
+            f.truncate(position)
+
+    def _spool_existing(self):
+        # Copied aside first, a spool torn by a crash would be taken for the newer data
+        tmp_path = self.spool_path + ".tmp"
+        with open(tmp_path, "wb") as spool:
+            self._spool_file(self.path, spool)
+        os.replace(tmp_path, self.spool_path)
+
+    def _spool_file(self, path, spool):
+        """Copy the features of a finished file to the spool, in the order of its index; return their number."""
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC))[:3] != MAGIC[:3]:
+                raise ValueError(f"{path} is not a FlatGeobuf file")
+            (header_size,) = struct.unpack("<I", f.read(4))
+            header = f.read(header_size)
+            root = struct.unpack_from("<I", header)[0]
+            geom_type = _table_field(header, root, 2, "<B", 0)
+            count = _table_field(header, root, 8, "<Q", 0)
+            node_size = _table_field(header, root, 9, "<H", NODE_SIZE)
+            if not count or not node_size:
+                return 0
+            nodes = level_bounds(count, node_size)[0][1]
+            index = f.tell()
+            features = index + nodes * NODE_ITEM.size
+            f.seek(index + (nodes - count) * NODE_ITEM.size)
+            leaves = [NODE_ITEM.unpack(f.read(NODE_ITEM.size)) for _ in range(count)]
+            for *box, offset in leaves:
+                f.seek(features + offset)
+                (size,) = struct.unpack("<I", f.read(4))
+                data = struct.pack("<I", size) + f.read(size)
+                # A mixed file has no type in the header, so the spool stays mixed too
+                self._add(geom_type, box, spool.tell())
+                spool.write(SPOOL_RECORD.pack(geom_type, *box, len(data)) + data)
+            return count
+
+    def _add(self, geom_type, box, position):
+        self._types.add(geom_type)
+        self._boxes.append(tuple(box))
+        self._positions.append(position)
+
+    def write_feature(self, feature):
+        geom = feature.get("geometry")
+        box = geometry_bounds(geom) or EMPTY_BOX
+        geom_type = GEOMETRY_TYPES.get((geom or {}).get("type"), 0)
+        data = encode_feature(feature)
+        self._add(geom_type, box, self._file.tell())
+        self._file.write(SPOOL_RECORD.pack(geom_type, *box, len(data)) + data)
+
+    def merge(self, paths):
+        for path in paths:
+            self.count += self._spool_file(path, self._file)
+
+    def close(self):
+        if self._file is None:
+            return
+        super().close()
+        self._assemble()
+        os.remove(self.spool_path)
+
+    def _header(self, extent):
+        geom_type = next(iter(self._types)) if len(self._types) == 1 else 0
+        columns = [[(0, "string", name), (1, "B", column_type)] for name, column_type in COLUMNS]
+        code = epsg_code(self.crs_name)
+        crs = [(0, "string", "EPSG"), (1, "i", code)] if code else [(2, "string", self.crs_name)]
+        return _Builder().finish(
+            [
+                (0, "string", self.file_name),
+                (1, "vector:d", list(extent) if self._boxes else None),
+                (2, "B", geom_type),
+                (7, "tables", columns),
+                (8, "Q", len(self._boxes)),
+                (9, "H", NODE_SIZE if self._boxes else 0),
+                (10, "table", crs),
+            ]
+        )
+
+    def _assemble(self):
+        boxes = [b for b in self._boxes if b[0] <= b[2]]
+        extent = (
+            (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+            if boxes
+            else (0.0, 0.0, 0.0, 0.0)
+        )
+        order = hilbert_order(self._boxes, extent) if self._boxes else []
+        with open(self.spool_path, "rb") as spool, open(self.path, "wb") as f:
+            f.write(MAGIC)
+            f.write(self._header(extent))
+            sizes = []
+            for i in order:
+                spool.seek(self._positions[i] + SPOOL_RECORD.size - 4)
+                sizes.append(struct.unpack("<I", spool.read(4))[0])
+            offsets = array("Q", [0])
+            for size in sizes[:-1]:
+                offsets.append(offsets[-1] + size)
+            if order:
+                for node in packed_rtree([self._boxes[i] for i in order], offsets):
+                    f.write(NODE_ITEM.pack(*node))
+            for i in order:
+                spool.seek(self._positions[i])
+                size = SPOOL_RECORD.unpack(spool.read(SPOOL_RECORD.size))[-1]
+                f.write(spool.read(size))
@@ -0,0 +1,223 @@
+import os
+import sqlite3
+import struct
+
+from .. import jsonlib
+from ..crs import WGS84, crs_wkt, epsg_code
+from ..export import BatchWriter
+from .wkb import geometry_bounds, to_wkb, union_bounds
+
+APPLICATION_ID = 0x47504B47  # "GPKG"
+USER_VERSION = 10300
+TABLE = "areas"
+GEOMETRY_COLUMN = "geom"
+RTREE = f"rtree_{TABLE}_{GEOMETRY_COLUMN}"
+
+SCHEMA = f"""
+CREATE TABLE gpkg_spatial_ref_sys (
+    srs_name TEXT NOT NULL, srs_id INTEGER NOT NULL PRIMARY KEY, organization TEXT NOT NULL,
+    organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT
+);
+CREATE TABLE gpkg_contents (
+    table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE,
+    description TEXT DEFAULT '', last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+    min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE,
+    srs_id INTEGER REFERENCES gpkg_spatial_ref_sys(srs_id)
+);
+CREATE TABLE gpkg_geometry_columns (
+    table_name TEXT NOT NULL UNIQUE REFERENCES gpkg_contents(table_name), column_name TEXT NOT NULL,
+    geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL REFERENCES gpkg_spatial_ref_sys(srs_id),
+    z TINYINT NOT NULL, m TINYINT NOT NULL, PRIMARY KEY (table_name, column_name)
+);
+CREATE TABLE gpkg_extensions (
+    table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL, definition TEXT NOT NULL,
+    scope TEXT NOT NULL, UNIQUE (table_name, column_name, extension_name)
+);
+CREATE TABLE {TABLE} (
+    fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, {GEOMETRY_COLUMN} GEOMETRY,
+    cad_num TEXT, label TEXT, properties TEXT
+);
+CREATE VIRTUAL TABLE {RTREE} USING rtree(id, minx, maxx, miny, maxy);
+"""
+
+# Triggers of the gpkg_rtree_index extension, they keep the index in sync with the table
+_BOUNDS = ", ".join(f"{name}(NEW.{GEOMETRY_COLUMN})" for name in ("ST_MinX", "ST_MaxX", "ST_MinY", "ST_MaxY"))
+_NOT_EMPTY = f"NEW.{GEOMETRY_COLUMN} NOT NULL AND NOT ST_IsEmpty(NEW.{GEOMETRY_COLUMN})"
+_EMPTY = f"NEW.{GEOMETRY_COLUMN} IS NULL OR ST_IsEmpty(NEW.{GEOMETRY_COLUMN})"
+TRIGGERS = f"""
+CREATE TRIGGER {RTREE}_insert AFTER INSERT ON {TABLE} WHEN ({_NOT_EMPTY})
+BEGIN INSERT OR REPLACE INTO {RTREE} VALUES (NEW.fid, {_BOUNDS}); END;
+CREATE TRIGGER {RTREE}_update1 AFTER UPDATE OF {GEOMETRY_COLUMN} ON {TABLE}
+WHEN OLD.fid = NEW.fid AND ({_NOT_EMPTY})
+BEGIN INSERT OR REPLACE INTO {RTREE} VALUES (NEW.fid, {_BOUNDS}); END;
+CREATE TRIGGER {RTREE}_update2 AFTER UPDATE OF {GEOMETRY_COLUMN} ON {TABLE}
+WHEN OLD.fid = NEW.fid AND ({_EMPTY})
+BEGIN DELETE FROM {RTREE} WHERE id = OLD.fid; END;
+CREATE TRIGGER {RTREE}_update3 AFTER UPDATE ON {TABLE} WHEN OLD.fid != NEW.fid AND ({_NOT_EMPTY})
+BEGIN
+    DELETE FROM {RTREE} WHERE id = OLD.fid;
+    INSERT OR REPLACE INTO {RTREE} VALUES (NEW.fid, {_BOUNDS});
+END;
+CREATE TRIGGER {RTREE}_update4 AFTER UPDATE ON {TABLE} WHEN OLD.fid != NEW.fid AND ({_EMPTY})
+BEGIN DELETE FROM {RTREE} WHERE id IN (OLD.fid, NEW.fid); END;
+CREATE TRIGGER {RTREE}_delete AFTER DELETE ON {TABLE} WHEN OLD.{GEOMETRY_COLUMN} NOT NULL
+BEGIN DELETE FROM {RTREE} WHERE id = OLD.fid; END;
+"""
+
+# Little endian, envelope [minx, maxx, miny, maxy]
+_HEADER = struct.Struct("<2sBBi4d")
+_FLAGS = 0b00000011
+_EMPTY_FLAG = 0b00010000
+
+
+def geometry_blob(geom, srs_id, bounds=None):
+    """GeoPackage binary geometry (header with the envelope followed by WKB), None for an empty one."""
+    bounds = bounds or geometry_bounds(geom)
+    if bounds is None:
+        return None
+    minx, miny, maxx, maxy = bounds
+    return _HEADER.pack(b"GP", 0, _FLAGS, srs_id, minx, maxx, miny, maxy) + to_wkb(geom)
+
+
+def _envelope(blob, index):
+    # Blobs without an envelope (not written by this package) are left out of the index
+    if blob is None or len(blob) < _HEADER.size or (blob[3] >> 1) & 0b111 == 0:
+        return None
+    return _HEADER.unpack_from(blob)[4 + index]
+
+
+def _is_empty(blob):
+    return int(blob is None or bool(blob[3] & _EMPTY_FLAG))
+
+
+def _register_functions(conn):
+    """The ``ST_*`` functions called by the R-tree triggers."""
+    conn.create_function("ST_IsEmpty", 1, _is_empty, deterministic=True)
+    for index, name in enumerate(("ST_MinX", "ST_MaxX", "ST_MinY", "ST_MaxY")):
+        conn.create_function(name, 1, lambda blob, i=index: _envelope(blob, i), deterministic=True)
+
+
+class GeoPackageWriter(BatchWriter):
+    """
+    OGC GeoPackage with one ``areas`` table and its R-tree spatial index.
+
+    Geometries are stored as GeoPackage binaries, attributes as ``cad_num``, ``label``
+    and the JSON of all properties. The index is filled by the standard triggers of the
+    ``gpkg_rtree_index`` extension, the ``ST_*`` functions they need are registered on
+    the connection. Every :meth:`flush` commits (write-ahead log, so without an fsync),
+    the database is switched back to a single file on close.
+
+    The extent in ``gpkg_contents`` is kept from the exact bounds of the geometries, not
+    from the R-tree, which stores them as float32.
+    """
+
+    file_format = "gpkg"
+
+    def open(self):
+        if not self.continues_existing():
+            for path in (self.path, self.path + "-wal", self.path + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+        conn = sqlite3.connect(self.path)
+        _register_functions(conn)
+        has_table = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'gpkg_contents'").fetchone()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        if has_table:
+            self.srs_id = conn.execute(
+                "SELECT srs_id FROM gpkg_geometry_columns WHERE table_name = ?", (TABLE,)
+            ).fetchone()[0]
+            if self.resume_at is not None:
+                with conn:
+                    conn.execute(f"DELETE FROM {TABLE} WHERE fid > ?", (self.resume_at,))
+        else:
+            self._create(conn)
+        self.extent = self._stored_extent(conn)
+        return conn
+
+    @staticmethod
+    def _stored_extent(conn, after_fid=0):
+        """Bounds of the geometries stored after ``after_fid``, from the envelopes of their blobs."""
+        row = conn.execute(
+            f"SELECT min(ST_MinX({GEOMETRY_COLUMN})), min(ST_MinY({GEOMETRY_COLUMN})), "
+            f"max(ST_MaxX({GEOMETRY_COLUMN})), max(ST_MaxY({GEOMETRY_COLUMN})) FROM {TABLE} WHERE fid > ?",
+            (after_fid,),
+        ).fetchone()
+        return None if row[0] is None else row
+
+    def _create(self, conn):
+        self.srs_id = epsg_code(self.crs_name) or 0
+        with conn:
+            conn.execute(f"PRAGMA application_id = {APPLICATION_ID}")
+            conn.execute(f"PRAGMA user_version = {USER_VERSION}")
+            conn.executescript(SCHEMA + TRIGGERS)
+            srs = [
+                ("Undefined cartesian SRS", -1, "NONE", -1, "undefined"),
+                ("Undefined geographic SRS", 0, "NONE", 0, "undefined"),
+                ("WGS 84 geodetic", 4326, "EPSG", 4326, crs_wkt(WGS84)),
+            ]
+            if self.srs_id not in (0, 4326):
+                srs.append((self.crs_name, self.srs_id, "EPSG", self.srs_id, crs_wkt(self.crs_name) or "undefined"))
+            conn.executemany("INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, NULL)", srs)
+            conn.execute(
+                "INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) VALUES (?, 'features', ?, ?)",
+                (TABLE, self.file_name, self.srs_id),
+            )
+            conn.execute(
+                "INSERT INTO gpkg_geometry_columns VALUES (?, ?, 'GEOMETRY', ?, 0, 0)",
+                (TABLE, GEOMETRY_COLUMN, self.srs_id),
+            )
+            conn.execute(
+                "INSERT INTO gpkg_extensions VALUES (?, ?, 'gpkg_rtree_index', ?, 'write-only')",
+                (TABLE, GEOMETRY_COLUMN, "http://www.geopackage.org/spec120/#extension_rtree"),
+            )
+
+    def write_feature(self, feature):
+        props = feature.get("properties") or {}
+        cad_num = (props.get("options") or {}).get("cad_num") or props.get("label")
+        geom = feature.get("geometry")
+        bounds = geometry_bounds(geom)
+        self.extent = union_bounds(self.extent, bounds)
+        self._file.execute(
+            f"INSERT INTO {TABLE} ({GEOMETRY_COLUMN}, cad_num, label, properties) VALUES (?, ?, ?, ?)",
+            (geometry_blob(geom, self.srs_id, bounds), cad_num, props.get("label"), jsonlib.dumps(props)),
+        )
+
+    def flush(self):
+        if self._file is not None:
+            self._file.commit()
+
+    def checkpoint(self):
+        """The last ``fid`` of the table."""
+        return self._file.execute(f"SELECT coalesce(max(fid), 0) FROM {TABLE}").fetchone()[0]
+
+    def merge(self, paths):
+        """Copy the rows of finished GeoPackages written by this writer, the triggers index them."""
+        conn = self._file
+        conn.commit()
+        before = self.checkpoint()
+        columns = f"{GEOMETRY_COLUMN}, cad_num, label, properties"
+        for path in paths:
+            conn.execute("ATTACH DATABASE ? AS part", (path,))
+            try:
+                with conn:
+                    cursor = conn.execute(
+                        f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM part.{TABLE} ORDER BY fid"
+                    )
+                self.count += cursor.rowcount
+            finally:
+                conn.execute("DETACH DATABASE part")
+        self.extent = union_bounds(self.extent, self._stored_extent(conn, before))
+
+    def close(self):
+        if self._file is None:
+            return
+        conn = self._file
+        with conn:
+            conn.execute(
+                "UPDATE gpkg_contents SET (min_x, min_y, max_x, max_y) = (?, ?, ?, ?), "
+                "last_change = strftime('%Y-%m-%dT%H:%M:%fZ', 'now') WHERE table_name = ?",
+                (*(self.extent or (None,) * 4), TABLE),
+            )
+        conn.execute("PRAGMA journal_mode = DELETE")
+        super().close()
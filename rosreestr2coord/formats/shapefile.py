@@ -0,0 +1,242 @@
+import datetime
+import os
+import struct
+from array import array
+
+from ..crs import crs_wkt
+from ..export import BatchWriter
+from .wkb import flat_xy, geometry_bounds, little_endian, union_bounds
+
+SHAPE_NULL = 0
+SHAPE_POINT = 1
+SHAPE_POLYLINE = 3
+SHAPE_POLYGON = 5
+SHAPE_MULTIPOINT = 8
+SHAPE_TYPES = {
+    "Point": SHAPE_POINT,
+    "MultiPoint": SHAPE_MULTIPOINT,
+    "LineString": SHAPE_POLYLINE,
+    "MultiLineString": SHAPE_POLYLINE,
+    "Polygon": SHAPE_POLYGON,
+    "MultiPolygon": SHAPE_POLYGON,
+}
+
+HEADER_SIZE = 100
+# File code, five unused words, file length (big endian), version, shape type, bounds (little endian)
+_SHP_HEADER = struct.Struct(">7i")
+_SHP_BOUNDS = struct.Struct("<2i8d")
+_RECORD_HEADER = struct.Struct(">2i")
+
+# dBase III text columns and their widths in bytes
+DBF_FIELDS = (("cad_num", 40), ("label", 254))
+_DBF_HEADER = struct.Struct("<B3BIHH20x")
+_DBF_FIELD = struct.Struct("<11sc4xBB14x")
+
+
+def _signed_area(ring):
+    xy = flat_xy(ring)
+    xs, ys = xy[0::2], xy[1::2]
+    return sum(xs[i] * ys[i + 1] - xs[i + 1] * ys[i] for i in range(len(xs) - 1)) / 2
+
+
+def _shape_parts(geom):
+    """Parts (lists of positions) of a geometry; polygon rings are turned clockwise, holes counterclockwise."""
+    geom_type = geom["type"]
+    coords = geom["coordinates"]
+    if geom_type == "LineString":
+        return [coords]
+    if geom_type == "MultiLineString":
+        return list(coords)
+    polygons = [coords] if geom_type == "Polygon" else coords
+    parts = []
+    for polygon in polygons:
+        for j, ring in enumerate(polygon):
+            clockwise = _signed_area(ring) < 0
+            parts.append(ring if clockwise == (j == 0) else ring[::-1])
+    return parts
+
+
+def shape_record(geom, shape_type):
+    """Content of a shapefile record for a GeoJSON geometry, a null shape if it doesn't fit ``shape_type``."""
+    bounds = geometry_bounds(geom)
+    if bounds is None or SHAPE_TYPES.get(geom.get("type")) != shape_type:
+        return struct.pack("<i", SHAPE_NULL), None
+    if shape_type == SHAPE_POINT:
+        return struct.pack("<i2d", shape_type, *geom["coordinates"][:2]), bounds
+    if shape_type == SHAPE_MULTIPOINT:
+        points = geom["coordinates"]
+        return struct.pack("<i4di", shape_type, *bounds, len(points)) + little_endian(flat_xy(points)), bounds
+    parts = _shape_parts(geom)
+    starts = array("i")
+    xy = array("d")
+    for part in parts:
+        starts.append(len(xy) // 2)
+        xy.extend(flat_xy(part))
+    header = struct.pack("<i4d2i", shape_type, *bounds, len(parts), len(xy) // 2)
+    return header + little_endian(starts) + little_endian(xy), bounds
+
+
+def _dbf_value(value, width):
+    data = (value or "").encode("utf-8")[:width].decode("utf-8", "ignore").encode("utf-8")
+    return data.ljust(width, b" ")
+
+
+def _record_bounds(content):
+    """Shape type and bounds (None for a null shape) of the content of a record."""
+    shape_type = struct.unpack_from("<i", content)[0]
+    if shape_type == SHAPE_POINT:
+        x, y = struct.unpack_from("<2d", content, 4)
+        return shape_type, (x, y, x, y)
+    if shape_type == SHAPE_NULL:
+        return shape_type, None
+    return shape_type, struct.unpack_from("<4d", content, 4)
+
+
+class ShapefileWriter(BatchWriter):
+    """
+    ESRI Shapefile (``.shp``, ``.shx``, ``.dbf`` with UTF-8 ``.cpg`` and ``.prj``).
+
+    The shape type is taken from the first feature, features of other types are written
+    as null shapes. Headers are updated on close; on resume the number of records is
+    read from the ``.shx`` index, which is written last for every feature
+    (and cut to the checkpoint).
+    """
+
+    file_format = "shp"
+
+    def open(self):
+        base = os.path.splitext(self.path)[0]
+        self.paths = {ext: f"{base}.{ext}" for ext in ("shx", "dbf", "prj", "cpg")}
+        self.shape_type = None
+        self.bounds = None
+        self.records = 0
+        if self.continues_existing() and os.path.exists(self.paths["shx"]) and os.path.exists(self.paths["dbf"]):
+            shp = self._continue()
+        else:
+            shp = open(self.path, "wb+")
+            shp.write(bytes(HEADER_SIZE))
+            self._shx = open(self.paths["shx"], "wb+")
+            self._shx.write(bytes(HEADER_SIZE))
+            self._dbf = open(self.paths["dbf"], "wb+")
+            self._dbf.write(self._dbf_header())
+            for name, width in DBF_FIELDS:
+                self._dbf.write(_DBF_FIELD.pack(name.encode(), b"C", width, 0))
+            self._dbf.write(b"\r")
+            with open(self.paths["cpg"], "w", encoding="ascii") as f:
+                f.write("UTF-8")
+            wkt = crs_wkt(self.crs_name)
+            if wkt:
+                with open(self.paths["prj"], "w", encoding="ascii") as f:
+                    f.write(wkt)
+        return shp
+
+    def _continue(self):
+        """Open the existing files and drop the records after the last one in the index."""
+        shp = open(self.path, "rb+")
+        self._shx = open(self.paths["shx"], "rb+")
+        self._dbf = open(self.paths["dbf"], "rb+")
+        self.shape_type = _SHP_BOUNDS.unpack(self._read(shp, 28, _SHP_BOUNDS.size))[1] or None
+        self.records = (os.path.getsize(self.paths["shx"]) - HEADER_SIZE) // 8
+        if self.resume_at is not None:
+            self.records = min(self.records, self.resume_at)
+        self._shx.truncate(HEADER_SIZE + 8 * self.records)
+        shp_end = HEADER_SIZE
+        for i in range(self.records):
+            offset, length = _RECORD_HEADER.unpack(self._read(self._shx, HEADER_SIZE + 8 * i, 8))
+            shp_end = 2 * (offset + 4 + length)
+            shape_type, bounds = _record_bounds(self._read(shp, 2 * offset + 8, 36))
+            if self.shape_type is None and shape_type != SHAPE_NULL:
+                # The header is only written on close
+                self.shape_type = shape_type
+            if bounds is not None:
+                self._extend(bounds)
+        shp.truncate(shp_end)
+        header_size, record_size = struct.unpack("<HH", self._read(self._dbf, 8, 4))
+        self._dbf.truncate(header_size + record_size * self.records)
+        for f in (shp, self._shx, self._dbf):
+            f.seek(0, os.SEEK_END)
+        return shp
+
+    @staticmethod
+    def _read(f, offset, size):
+        f.seek(offset)
+        return f.read(size)
+
+    def _dbf_header(self):
+        today = datetime.date.today()
+        record_size = 1 + sum(width for _, width in DBF_FIELDS)
+        header_size = 32 + 32 * len(DBF_FIELDS) + 1
+        return _DBF_HEADER.pack(3, today.year - 1900, today.month, today.day, self.records, header_size, record_size)
+
+    def _extend(self, bounds):
+        self.bounds = union_bounds(self.bounds, tuple(bounds))
+
+    def write_feature(self, feature):
+        geom = feature.get("geometry") or {}
+        if self.shape_type is None:
+            self.shape_type = SHAPE_TYPES.get(geom.get("type"))
+        content, bounds = shape_record(geom, self.shape_type)
+        props = feature.get("properties") or {}
+        values = ((props.get("options") or {}).get("cad_num") or props.get("label"), props.get("label"))
+        dbf_record = b" " + b"".join(_dbf_value(v, width) for v, (_, width) in zip(values, DBF_FIELDS))
+        self._write_record(content, bounds, dbf_record)
+
+    def _write_record(self, content, bounds, dbf_record):
+        if bounds is not None:
+            self._extend(bounds)
+        self.records += 1
+        offset = self._file.tell() // 2
+        self._file.write(_RECORD_HEADER.pack(self.records, len(content) // 2) + content)
+        self._dbf.write(dbf_record)
+        self._shx.write(_RECORD_HEADER.pack(offset, len(content) // 2))
+
+    def merge(self, paths):
+        """Copy the records of finished shapefiles, a record of another shape type is written as a null shape."""
+        for path in paths:
+            base = os.path.splitext(path)[0]
+            with open(path, "rb") as shp, open(f"{base}.shx", "rb") as shx, open(f"{base}.dbf", "rb") as dbf:
+                header_size, record_size = struct.unpack("<HH", self._read(dbf, 8, 4))
+                for i in range((os.path.getsize(f"{base}.shx") - HEADER_SIZE) // 8):
+                    offset, length = _RECORD_HEADER.unpack(self._read(shx, HEADER_SIZE + 8 * i, 8))
+                    content = self._read(shp, 2 * offset + 8, 2 * length)
+                    shape_type, bounds = _record_bounds(content)
+                    if self.shape_type is None and shape_type != SHAPE_NULL:
+                        self.shape_type = shape_type
+                    if shape_type not in (SHAPE_NULL, self.shape_type):
+                        content, bounds = struct.pack("<i", SHAPE_NULL), None
+                    self._write_record(content, bounds, self._read(dbf, header_size + record_size * i, record_size))
+                    self.count += 1
+
+    def flush(self):
+        if self._file is not None:
+            for f in (self._file, self._dbf, self._shx):
+                f.flush()
+
+    def checkpoint(self):
+        """The number of records."""
+        return self.records
+
+    def release(self):
+        if self._file is not None:
+            self._dbf.close()
+            self._shx.close()
+        super().release()
+
+    def _write_header(self, f):
+        size = f.seek(0, os.SEEK_END)
+        f.seek(0)
+        f.write(_SHP_HEADER.pack(9994, 0, 0, 0, 0, 0, size // 2))
+        f.write(_SHP_BOUNDS.pack(1000, self.shape_type or SHAPE_NULL, *(self.bounds or (0, 0, 0, 0)), 0, 0, 0, 0))
+
+    def close(self):
+        if self._file is None:
+            return
+        self._write_header(self._file)
+        self._write_header(self._shx)
+        self._dbf.seek(0)
+        self._dbf.write(self._dbf_header()[:12])
+        self._dbf.seek(0, os.SEEK_END)
+        self._dbf.write(b"\x1a")
+        self._dbf.close()
+        self._shx.close()
+        super().close()
@@ -0,0 +1,84 @@
+import struct
+import sys
+from array import array
+from itertools import chain
+from typing import Optional, Tuple
+
+from ..export import iter_positions
+
+Bounds = Tuple[float, float, float, float]
+
+# Geometry type codes of WKB, also used by FlatGeobuf
+GEOMETRY_TYPES = {
+    "Point": 1,
+    "LineString": 2,
+    "Polygon": 3,
+    "MultiPoint": 4,
+    "MultiLineString": 5,
+    "MultiPolygon": 6,
+    "GeometryCollection": 7,
+}
+
+
+def little_endian(values: array) -> bytes:
+    """Raw little-endian bytes of a numeric array."""
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def flat_xy(positions) -> array:
+    """X and Y of the positions as one flat ``array('d')``, other dimensions are dropped."""
+    return array("d", chain.from_iterable((p[0], p[1]) for p in positions))
+
+
+def union_bounds(*bounds: Optional[Bounds]) -> Optional[Bounds]:
+    """Bounds covering all the given ones, None ones are skipped."""
+    parts = [b for b in bounds if b]
+    if not parts:
+        return None
+    return (
+        min(b[0] for b in parts),
+        min(b[1] for b in parts),
+        max(b[2] for b in parts),
+        max(b[3] for b in parts),
+    )
+
+
+def geometry_bounds(geom: Optional[dict]) -> Optional[Bounds]:
+    """``(minx, miny, maxx, maxy)`` of a GeoJSON geometry, None if it is empty."""
+    if not geom:
+        return None
+    if geom.get("type") == "GeometryCollection":
+        return union_bounds(*map(geometry_bounds, geom.get("geometries") or []))
+    xy = flat_xy(iter_positions(geom.get("coordinates")))
+    if not xy:
+        return None
+    xs, ys = xy[0::2], xy[1::2]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _wkb_points(positions) -> bytes:
+    positions = list(positions)
+    return struct.pack("<I", len(positions)) + little_endian(flat_xy(positions))
+
+
+def to_wkb(geom: dict) -> bytes:
+    """Little-endian 2D WKB of a GeoJSON geometry (Z values are dropped)."""
+    geom_type = geom["type"]
+    header = struct.pack("<BI", 1, GEOMETRY_TYPES[geom_type])
+    coords = geom.get("coordinates")
+    if geom_type == "Point":
+        return header + struct.pack("<2d", coords[0], coords[1])
+    if geom_type == "LineString":
+        return header + _wkb_points(coords)
+    if geom_type == "Polygon":
+        return header + struct.pack("<I", len(coords)) + b"".join(map(_wkb_points, coords))
+    if geom_type == "GeometryCollection":
+        parts = geom.get("geometries") or []
+        return header + struct.pack("<I", len(parts)) + b"".join(map(to_wkb, parts))
+    single = geom_type[len("Multi"):]
+    return header + struct.pack("<I", len(coords)) + b"".join(
+        to_wkb({"type": single, "coordinates": part}) for part in coords
+    )
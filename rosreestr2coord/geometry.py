@@ -0,0 +1,135 @@
+from array import array
+from itertools import chain
+from typing import List, Optional
+
+from .utils import GEOMETRY_DEPTH, _collect_rings, _numpy
+
+
+class CompactGeometry:
+    """
+    GeoJSON geometry kept as one flat ``array('d')`` of coordinates plus offsets.
+
+    About 8 bytes per coordinate instead of a list object per position. ``ring_offsets``
+    holds the start of every ring (in positions, with the total at the end) and, for
+    multi-polygons, ``part_offsets`` the first ring of every polygon. The nested lists
+    are rebuilt on demand by :meth:`to_geojson`, other members (e.g. ``crs``) are kept
+    in ``members`` so the same GeoJSON comes out.
+    """
+
+    __slots__ = ("type", "dims", "coords", "ring_offsets", "part_offsets", "members")
+
+    def __init__(
+        self,
+        geom_type: str,
+        dims: int,
+        coords: array,
+        ring_offsets: array,
+        part_offsets: Optional[array] = None,
+        members: Optional[dict] = None,
+    ):
+        self.type = geom_type
+        self.dims = dims
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.part_offsets = part_offsets
+        self.members = members
+
+    @classmethod
+    def from_geojson(cls, geom: dict) -> Optional["CompactGeometry"]:
+        """Pack a geometry, None if it can't be packed (collections, mixed dimensions)."""
+        geom_type = geom.get("type")
+        depth = GEOMETRY_DEPTH.get(geom_type)
+        coords = geom.get("coordinates")
+        if depth is None or coords is None:
+            return None
+        if depth == 0:
+            rings = [[coords]]
+        else:
+            rings = []
+            _collect_rings(coords, depth, rings)
+        dims = len(next(chain.from_iterable(rings), (0, 0)))
+        if any(len(p) != dims for p in chain.from_iterable(rings)):
+            return None
+        ring_offsets = array("L", [0])
+        for ring in rings:
+            ring_offsets.append(ring_offsets[-1] + len(ring))
+        part_offsets = None
+        if depth == 3:
+            part_offsets = array("L", [0])
+            for polygon in coords:
+                part_offsets.append(part_offsets[-1] + len(polygon))
+        flat = array("d", chain.from_iterable(chain.from_iterable(rings)))
+        members = None if list(geom) == ["type", "coordinates"] else dict(geom, coordinates=None)
+        return cls(geom_type, dims, flat, ring_offsets, part_offsets, members)
+
+    def rings(self) -> List[list]:
+        flat = self.coords.tolist()
+        dims = self.dims
+        offsets = self.ring_offsets
+        return [
+            [flat[i : i + dims] for i in range(offsets[r] * dims, offsets[r + 1] * dims, dims)]
+            for r in range(len(offsets) - 1)
+        ]
+
+    def to_geojson(self) -> dict:
+        rings = self.rings()
+        depth = GEOMETRY_DEPTH[self.type]
+        if depth == 0:
+            coordinates = rings[0][0]
+        elif depth == 1:
+            coordinates = rings[0]
+        elif depth == 2:
+            coordinates = rings
+        else:
+            parts = self.part_offsets
+            coordinates = [rings[parts[i] : parts[i + 1]] for i in range(len(parts) - 1)]
+        if self.members is None:
+            return {"type": self.type, "coordinates": coordinates}
+        return dict(self.members, coordinates=coordinates)
+
+    @property
+    def __geo_interface__(self) -> dict:
+        return self.to_geojson()
+
+    def as_numpy(self):
+        """Coordinates as a ``(n, dims)`` NumPy view of the buffer (no copy)."""
+        np = _numpy()
+        if np is None:
+            raise ImportError("numpy is not installed")
+        return np.frombuffer(self.coords, dtype=np.float64).reshape(-1, self.dims)
+
+    @property
+    def nbytes(self) -> int:
+        size = self.coords.itemsize * len(self.coords) + self.ring_offsets.itemsize * len(self.ring_offsets)
+        if self.part_offsets is not None:
+            size += self.part_offsets.itemsize * len(self.part_offsets)
+        return size
+
+
+class CompactFeature:
+    """GeoJSON feature with a :class:`CompactGeometry`, other members are kept as they are."""
+
+    __slots__ = ("geometry", "members")
+
+    def __init__(self, geometry, members: dict):
+        self.geometry = geometry
+        self.members = members
+
+    @classmethod
+    def from_geojson(cls, feature: dict) -> "CompactFeature":
+        geom = feature.get("geometry")
+        # Geometries that can't be packed are kept as dicts
+        compact = CompactGeometry.from_geojson(geom) if geom else None
+        return cls(compact or geom, dict(feature, geometry=None))
+
+    @property
+    def properties(self) -> Optional[dict]:
+        return self.members.get("properties")
+
+    def to_geojson(self) -> dict:
+        geom = self.geometry.to_geojson() if isinstance(self.geometry, CompactGeometry) else self.geometry
+        return dict(self.members, geometry=geom)
+
+    @property
+    def __geo_interface__(self) -> dict:
+        return self.to_geojson()
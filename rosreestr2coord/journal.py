@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .parser import STATUS_NO_COORD, STATUS_OK
+
+# Codes with these statuses are not requested again when a batch is resumed
+DONE_STATUSES = (STATUS_OK, STATUS_NO_COORD)
+
+
+class BatchJournal:
+    """
+    Append-only JSONL journal of per-code batch status (pending, ok, no_coord, error).
+
+    Every record is flushed right away, so the journal survives a crash or Ctrl+C
+    and ``--resume`` can skip the codes that are already done. Records of written codes
+    carry the checkpoints of the outputs (by file format): a resumed batch cuts the
+    outputs back to the last ones, dropping features written but not journaled.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.statuses: Dict[str, str] = {}
+        self.outputs: Dict[str, object] = {}
+        if resume:
+            self.statuses, self.outputs = self.load(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load(path: str) -> Tuple[Dict[str, str], Dict[str, object]]:
+        """Last known status of every code and the last output checkpoints; a torn last line is ignored."""
+        statuses, outputs = {}, {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "code" in record:
+                        statuses[record["code"]] = record["status"]
+                    outputs.update(record.get("outputs") or {})
+        except OSError:
+            pass
+        return statuses, outputs
+
+    def record(self, code: str, status: str, outputs: Optional[Dict[str, object]] = None) -> None:
+        """Record the status of ``code`` and, once it is written, the checkpoints of the outputs."""
+        self._write({"code": code, "status": status}, outputs)
+        with self._lock:
+            self.statuses[code] = status
+
+    def record_outputs(self, outputs: Dict[str, object]) -> None:
+        """Record the checkpoints of the outputs alone, e.g. of the outputs just opened."""
+        self._write({}, outputs)
+
+    def _write(self, record: dict, outputs: Optional[Dict[str, object]]) -> None:
+        record["time"] = round(time.time(), 3)
+        if outputs:
+            record["outputs"] = outputs
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if outputs:
+                self.outputs.update(outputs)
+            if self._file is not None:
+                self._file.write(line + "\n")
+                self._file.flush()
+
+    def is_done(self, code: str) -> bool:
+        return self.statuses.get(code) in DONE_STATUSES
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,62 @@
+"""
+JSON backend used for API responses, the cache and the GeoJSON outputs.
+
+orjson or ujson is used when installed (``pip install rosreestr2coord[orjson]``),
+the standard library otherwise. Output is compact and keeps non-ASCII characters.
+"""
+import json
+from typing import Any, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # optional
+    ujson = None
+
+BACKENDS = ("orjson", "ujson", "json")
+
+backend = "orjson" if orjson else "ujson" if ujson else "json"
+
+
+def set_backend(name: Optional[str] = None) -> str:
+    """Switch the backend (the best installed one by default), return its name."""
+    global backend
+    if name is None:
+        name = "orjson" if orjson else "ujson" if ujson else "json"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend {name!r}. Available options: {', '.join(BACKENDS)}")
+    if (name == "orjson" and orjson is None) or (name == "ujson" and ujson is None):
+        raise ValueError(f"JSON backend {name!r} is not installed")
+    backend = name
+    return name
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    if backend == "orjson":
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    if backend == "ujson":
+        return ujson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj: Any, indent: bool = False) -> bytes:
+    """Serialize ``obj`` to UTF-8 encoded JSON."""
+    if backend == "orjson":
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return dumps(obj, indent).encode("utf-8")
+
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    if backend == "orjson":
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode("utf-8")
+    if backend == "ujson":
+        return ujson.dumps(obj, ensure_ascii=False, indent=2 if indent else 0)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
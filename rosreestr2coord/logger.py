@@ -1,4 +1,16 @@
 import logging
 
-logging.basicConfig(filename="debug.log", level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+LOG_FORMAT = "%(asctime)s %(levelname)s:%(name)s:%(message)s"
+
+logger = logging.getLogger("rosreestr2coord")
+# Records go nowhere until the application configures logging, see configure_logging
+logger.addHandler(logging.NullHandler())
+
+
+def configure_logging(filename: str = "debug.log", level: int = logging.DEBUG) -> logging.Handler:
+    """Write the log of the package to ``filename`` (the ``--log`` option of the console)."""
+    handler = logging.FileHandler(filename, encoding="utf-8")
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    return handler
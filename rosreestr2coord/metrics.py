@@ -0,0 +1,258 @@
+"""
+Counters and latency histograms of the requests, areas and batches.
+
+Everything is recorded in one process-wide registry, :func:`get_metrics`. A batch
+takes a snapshot when it starts and reports the difference when it ends, so the
+registry itself keeps growing for the lifetime of the process.
+
+Requests are split into phases (``PHASES``): DNS lookup, TCP connect and TLS
+handshake of new connections, time to the first byte of the response and its
+download, then JSON parsing, reprojection of the feature and writing of the outputs.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+# Upper bounds in seconds, an observation above the last one falls into +Inf
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PHASES = ("dns", "connect", "tls", "ttfb", "download", "parse", "transform", "export")
+QUANTILES = (0.5, 0.9, 0.99)
+PROMETHEUS_PREFIX = "rosreestr2coord_"
+
+REQUESTS = "requests_total"
+REQUEST_SECONDS = "request_seconds"
+PHASE_SECONDS = "request_phase_seconds"
+AREAS = "areas_total"
+AREA_SECONDS = "area_seconds"
+CACHE = "cache_total"
+
+Labels = Tuple[Tuple[str, str], ...]
+Key = Tuple[str, Labels]
+
+
+def _key(name: str, labels: dict) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _label_text(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+
+
+def quantile(buckets: Sequence[float], counts: Sequence[int], q: float) -> float:
+    """Estimate of the ``q`` quantile from histogram counts, interpolated inside the bucket (as Prometheus does)."""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if seen + count >= rank and count:
+            if i == len(buckets):
+                # +Inf bucket: the best estimate is its lower bound
+                return buckets[-1]
+            lower = buckets[i - 1] if i else 0.0
+            return lower + (buckets[i] - lower) * (rank - seen) / count
+        seen += count
+    return buckets[-1]
+
+
+class MetricsSnapshot:
+    """
+    Copy of the registry values.
+
+    Snapshots can be subtracted to get the values of a period, or added to sum up processes.
+    """
+
+    def __init__(self, buckets: Sequence[float], counters: Dict[Key, float], histograms: Dict[Key, list]):
+        self.buckets = tuple(buckets)
+        self.counters = counters
+        # key -> [bucket counts (with +Inf last), sum, count]
+        self.histograms = histograms
+
+    def __add__(self, other: "MetricsSnapshot") -> "MetricsSnapshot":
+        """Values of both snapshots, e.g. of batches run by separate processes."""
+        counters = dict(self.counters)
+        for k, v in other.counters.items():
+            counters[k] = counters.get(k, 0) + v
+        histograms = {k: [list(counts), total, count] for k, (counts, total, count) in self.histograms.items()}
+        for k, (counts, total, count) in other.histograms.items():
+            values = histograms.get(k)
+            if values is None:
+                histograms[k] = [list(counts), total, count]
+            else:
+                histograms[k] = [[a + b for a, b in zip(values[0], counts)], values[1] + total, values[2] + count]
+        return MetricsSnapshot(self.buckets, counters, histograms)
+
+    def __sub__(self, other: "MetricsSnapshot") -> "MetricsSnapshot":
+        counters = {k: v - other.counters.get(k, 0) for k, v in self.counters.items()}
+        histograms = {}
+        for k, (counts, total, count) in self.histograms.items():
+            before = other.histograms.get(k)
+            if before is not None:
+                counts = [a - b for a, b in zip(counts, before[0])]
+                total, count = total - before[1], count - before[2]
+            histograms[k] = [counts, total, count]
+        return MetricsSnapshot(
+            self.buckets,
+            {k: v for k, v in counters.items() if v},
+            {k: v for k, v in histograms.items() if v[2]},
+        )
+
+    def counter(self, name: str, **labels) -> float:
+        return self.counters.get(_key(name, labels), 0)
+
+    def histogram(self, name: str, **labels) -> Optional[dict]:
+        """Count, sum, mean and quantiles of a histogram, None if nothing was observed."""
+        values = self.histograms.get(_key(name, labels))
+        if values is None:
+            return None
+        counts, total, count = values
+        summary = {"count": count, "sum": round(total, 6), "mean": round(total / count, 6)}
+        for q in QUANTILES:
+            summary["p%g" % (q * 100)] = round(quantile(self.buckets, counts, q), 6)
+        return summary
+
+    def phases(self) -> Dict[str, dict]:
+        """Summaries of the observed request phases, in the order of ``PHASES``."""
+        summaries = {phase: self.histogram(PHASE_SECONDS, phase=phase) for phase in PHASES}
+        return {phase: summary for phase, summary in summaries.items() if summary}
+
+    def to_dict(self) -> dict:
+        """JSON-serializable summary; series are named ``name{label="value"}``."""
+        return {
+            "counters": {name + _label_text(labels): value for (name, labels), value in sorted(self.counters.items())},
+            "histograms": {
+                name + _label_text(labels): self.histogram(name, **dict(labels))
+                for name, labels in sorted(self.histograms)
+            },
+        }
+
+    def to_prometheus(self, prefix: str = PROMETHEUS_PREFIX) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {prefix}{name} counter")
+            lines.append(f"{prefix}{name}{_label_text(labels)} {value:g}")
+        for (name, labels), (counts, total, count) in sorted(self.histograms.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {prefix}{name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip([*map(repr, self.buckets), "+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{prefix}{name}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{prefix}{name}_sum{_label_text(labels)} {total:.6f}")
+            lines.append(f"{prefix}{name}_count{_label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class Metrics:
+    """Thread-safe registry of labelled counters and histograms."""
+
+    def __init__(self, buckets: Sequence[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters: Dict[Key, float] = {}
+        self._histograms: Dict[Key, list] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            values = self._histograms.get(key)
+            if values is None:
+                values = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            values[0][bisect_left(self.buckets, seconds)] += 1
+            values[1] += seconds
+            values[2] += 1
+
+    def phase(self, phase: str, seconds: float) -> None:
+        self.observe(PHASE_SECONDS, seconds, phase=phase)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observe the duration of the block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> MetricsSnapshot:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: [list(counts), total, count] for k, (counts, total, count) in self._histograms.items()}
+        return MetricsSnapshot(self.buckets, counters, histograms)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Registry shared by the whole process."""
+    return _metrics
+
+
+class MetricsSink(ABC):
+    """Destination of the metrics of a batch."""
+
+    @abstractmethod
+    def emit(self, snapshot: MetricsSnapshot) -> None:
+        pass
+
+
+def _write_atomic(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class JsonSummarySink(MetricsSink):
+    """JSON summary written to ``path``, or to stdout if no path or ``-`` is given."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+
+    def emit(self, snapshot: MetricsSnapshot) -> None:
+        text = json.dumps(snapshot.to_dict(), ensure_ascii=False, indent=2)
+        if self.path in (None, "-"):
+            print(text, file=sys.stdout)
+        else:
+            _write_atomic(self.path, text + "\n")
+
+
+class PrometheusTextSink(MetricsSink):
+    """
+    Prometheus text file, e.g. for the textfile collector of node_exporter.
+
+    The file is replaced atomically, so a scrape never sees it half written.
+    """
+
+    def __init__(self, path: str, prefix: str = PROMETHEUS_PREFIX):
+        self.path = path
+        self.prefix = prefix
+
+    def emit(self, snapshot: MetricsSnapshot) -> None:
+        _write_atomic(self.path, snapshot.to_prometheus(self.prefix))
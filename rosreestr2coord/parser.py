@@ -1,25 +1,53 @@
 # coding: utf-8
-import json
 import logging
 import os
+import time
 import warnings
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import Dict, Optional, Union
 
+from . import jsonlib
+from .cache import ResponseCache, get_cache, make_cache_key
+from .crs import detect_crs, reproject, request_crs
 from .export import coords2kml
+from .geometry import CompactFeature
 from .logger import logger
+from .metrics import AREA_SECONDS, AREAS, CACHE, get_metrics
+from .request.base_adapter import RequestAdapter
 from .request.proxy_handling import ProxyHandling
+from .request.proxy_pool import ProxyPool, get_proxy_pool
+from .request.rate_limit import RateLimiter
 from .request.request import make_request
-from .utils import clear_code, code_to_filename, transform_to_wgs
+from .request.retry import RetryPolicy
+from .utils import (
+    AREA_TYPE_ADMINISTRATIVE,
+    AREA_TYPE_COMPLEX,
+    AREA_TYPE_DIVISION,
+    AREA_TYPE_OBJECT,
+    AREA_TYPE_TERRITORIAL_ZONE,
+    AREA_TYPE_ZONE,
+    clear_code,
+    code_to_filename,
+    guess_area_types,
+)
 
 TYPES = {
-    "Объекты недвижимости": 1,
-    "Кадастровое деление": 2,
-    "Административно-территориальное деление": 4,
-    "Зоны и территории": 5,
-    "Территориальные зоны": 7,
-    "Комплексы объектов": 15,
+    "Объекты недвижимости": AREA_TYPE_OBJECT,
+    "Кадастровое деление": AREA_TYPE_DIVISION,
+    "Административно-территориальное деление": AREA_TYPE_ADMINISTRATIVE,
+    "Зоны и территории": AREA_TYPE_ZONE,
+    "Территориальные зоны": AREA_TYPE_TERRITORIAL_ZONE,
+    "Комплексы объектов": AREA_TYPE_COMPLEX,
 }
 
+# Search endpoint of nspd, can be replaced per area (e.g. by a local mock server)
+BASE_URL = "https://nspd.gov.ru/api/geoportal/v2/search/geoportal"
+
+STATUS_PENDING = "pending"
+STATUS_OK = "ok"
+STATUS_NO_COORD = "no_coord"
+STATUS_ERROR = "error"
+
 
 class NoCoordinatesException(Exception):
     """Exception raised when no coordinates are found."""
@@ -28,6 +56,34 @@ class NoCoordinatesException(Exception):
 
 
 class Area:
+    __slots__ = (
+        "code",
+        "area_type",
+        "media_path",
+        "with_log",
+        "coord_out",
+        "with_proxy",
+        "use_cache",
+        "cache",
+        "rate_limiter",
+        "adapter",
+        "retry_policy",
+        "timeout",
+        "proxy_handler",
+        "proxy_url",
+        "logger",
+        "compact",
+        "base_url",
+        "file_name",
+        "status",
+        "exception",
+        "_feature",
+        "_pending",
+        "_tmp_path",
+    )
+
+    # Subclasses performing the lookup themselves (e.g. AsyncArea) switch this off
+    _fetch_on_init: bool = True
 
     def __init__(
         self,
@@ -38,10 +94,17 @@ class Area:
         coord_out: str = "EPSG:4326",
         with_proxy: bool = False,
         use_cache: bool = True,
-        proxy_handler: Optional[ProxyHandling] = None,
+        proxy_handler: Union[ProxyHandling, ProxyPool, None] = None,
         timeout: int = 5,
         logger: Optional[logging.Logger] = logger,
         proxy_url: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        adapter: Optional[RequestAdapter] = None,
+        lazy: bool = False,
+        retry_policy: Optional[RetryPolicy] = None,
+        compact: bool = False,
+        base_url: str = BASE_URL,
     ):
         self.code: str = code
         self.area_type: Optional[int] = area_type
@@ -50,61 +113,214 @@ class Area:
         self.coord_out: str = coord_out
         self.with_proxy: bool = with_proxy
         self.use_cache: bool = use_cache
+        self.cache: Optional[ResponseCache] = cache
+        self.rate_limiter: Optional[RateLimiter] = rate_limiter
+        self.adapter: Optional[RequestAdapter] = adapter
+        self.retry_policy: Optional[RetryPolicy] = retry_policy
         self.timeout: int = timeout
-        self.proxy_handler: Optional[ProxyHandling] = proxy_handler
+        self.proxy_handler: Union[ProxyHandling, ProxyPool, None] = proxy_handler
         self.proxy_url: Optional[str] = proxy_url
         self.logger: logging.Logger = logger or logging.getLogger(__name__)
+        self.compact: bool = compact
+        self.base_url: str = base_url
 
         self.file_name: str = code_to_filename(self.code)
-        self.feature: Optional[dict] = None
+        self._feature: Union[dict, CompactFeature, None] = None
+        self.status: str = STATUS_PENDING
+        self.exception: Optional[Exception] = None
+        # A lazy area does no I/O until the feature is requested
+        self._pending: bool = bool(self.code) and self._fetch_on_init
 
-        self.tmp_path: str = self.create_tmp()
+        self._tmp_path: Optional[str] = None if lazy else self.create_tmp()
 
-        if not self.code:
-            return
+        if not lazy:
+            self.load()
 
-        try:
-            geom = self.get_geometry()
-            if not geom:
-                self.log("Nothing found")
-        except Exception as er:
-            message = getattr(er, "reason", str(er))
-            self.log(message)
+    @property
+    def feature(self) -> Optional[dict]:
+        """
+        The found GeoJSON feature.
+
+        With ``compact=True`` the geometry is kept packed and a new dict is built on each access.
+        """
+        if self._pending:
+            self.load()
+        if isinstance(self._feature, CompactFeature):
+            return self._feature.to_geojson()
+        return self._feature
+
+    @feature.setter
+    def feature(self, value: Optional[dict]) -> None:
+        if self.compact and isinstance(value, dict):
+            value = CompactFeature.from_geojson(value)
+        self._feature = value
+
+    @property
+    def tmp_path(self) -> str:
+        if self._tmp_path is None:
+            self._tmp_path = self.create_tmp()
+        return self._tmp_path
+
+    def load(self, raise_errors: bool = False) -> Optional[dict]:
+        """
+        Fetch the geometry unless it was already done and return the found feature.
+
+        The outcome is kept in ``status`` (pending, ok, no_coord or error) and ``exception``.
+        """
+        if self._pending:
+            self._pending = False
+            start = time.perf_counter()
+            try:
+                geom = self.get_geometry()
+                self._set_result(geom)
+            except Exception as er:
+                self._set_error(er)
+                if raise_errors:
+                    raise
+            finally:
+                get_metrics().observe(AREA_SECONDS, time.perf_counter() - start)
+        return self.feature
+
+    def _set_result(self, geom: Optional[dict]) -> None:
+        self.status = STATUS_OK if geom else STATUS_NO_COORD
+        get_metrics().inc(AREAS, status=self.status)
+        if not geom:
+            self.log("Nothing found")
+
+    def _set_error(self, er: Exception) -> None:
+        self.status = STATUS_ERROR
+        self.exception = er
+        get_metrics().inc(AREAS, status=self.status)
+        message = getattr(er, "reason", str(er))
+        self.log(message)
 
     def create_tmp(self) -> str:
         tmp_path = os.path.join(self.media_path, "tmp")
         os.makedirs(tmp_path, exist_ok=True)
         return tmp_path
 
-    def _build_url(self, area_type: int) -> str:
-        base_url = "https://nspd.gov.ru/api/geoportal/v2/search/geoportal"
+    def search_url(self, area_type: int) -> str:
+        """URL of the nspd search for the code among the objects of ``area_type``."""
         params = [
             f"thematicSearchId={area_type}",
             f"query={self.code}",
-            f"CRS={self.coord_out}",
+            f"CRS={request_crs(self.coord_out)}",
         ]
-        return f"{base_url}?{'&'.join(params)}"
+        return f"{self.base_url}?{'&'.join(params)}"
 
-    def _query_with_area_type(self, area_type: int) -> Optional[dict]:
-        url = self._build_url(area_type)
-        resp = self.make_request(url)
+    def get_cache(self) -> ResponseCache:
+        if self.cache is None:
+            self.cache = get_cache(os.path.join(self.tmp_path, "cache"))
+        return self.cache
+
+    def get_proxy_pool(self) -> ProxyPool:
+        """Proxy pool shared by all areas using the same proxy file."""
+        if isinstance(self.proxy_handler, ProxyPool):
+            return self.proxy_handler
+        handler = self.proxy_handler or ProxyHandling(path=os.path.join(self.tmp_path, "proxy.txt"))
+        return get_proxy_pool(handler)
+
+    def _cache_key(self, area_type: int) -> str:
+        return make_cache_key(area_type, self.code, request_crs(self.coord_out))
+
+    def _get_cached_response(self, cache_key: str) -> Optional[dict]:
+        # With use_cache=False (--refresh) the cache is only bypassed for reading,
+        # the fresh response still replaces the stored one.
+        if not self.use_cache:
+            return None
+        resp = self.get_cache().get(cache_key)
+        get_metrics().inc(CACHE, result="miss" if resp is None else "hit")
+        return resp
+
+    def _cache_response(self, cache_key: str, resp: Optional[dict]) -> None:
+        if resp and resp.get("data", {}).get("features"):
+            self.get_cache().put(cache_key, resp)
+
+    def _parse_response(self, resp: Optional[dict]) -> Optional[dict]:
         if resp:
             features = resp.get("data", {}).get("features", [])
             if features:
-                feature = transform_to_wgs(features[0])
+                feature = features[0]
+                start = time.perf_counter()
+                # Reproject only if the server did not answer in the requested CRS
+                reproject(feature, detect_crs(feature, resp), self.coord_out)
+                get_metrics().phase("transform", time.perf_counter() - start)
                 if self._matches_criteria(feature):
-                    self.feature = feature
                     return feature
         return None
 
+    def _feature_from_response(self, resp: Optional[dict]) -> Optional[dict]:
+        feature = self._parse_response(resp)
+        if feature:
+            self.feature = feature
+        return feature
+
+    def _fetch_area_type(self, area_type: int) -> Optional[dict]:
+        """Feature found for ``area_type`` (from the cache or the API), without assigning it."""
+        cache_key = self._cache_key(area_type)
+        resp = self._get_cached_response(cache_key)
+        if resp is None:
+            url = self.search_url(area_type)
+            resp = self.make_request(url)
+            self._cache_response(cache_key, resp)
+        return self._parse_response(resp)
+
+    def _query_with_area_type(self, area_type: int) -> Optional[dict]:
+        feature = self._fetch_area_type(area_type)
+        if feature:
+            self.feature = feature
+        return feature
+
+    def _set_found_type(self, area_type: int, feature: Optional[dict]) -> Optional[dict]:
+        if feature:
+            self.area_type = area_type
+            self.feature = feature
+        return feature
+
+    def _query_candidate_types(self) -> Optional[dict]:
+        """
+        Query the types guessed from the code in parallel and keep the first match.
+
+        Requests that have not started yet are cancelled once a match is found.
+        If nothing is found and a request failed, its error is raised.
+        """
+        candidates = guess_area_types(self.code)
+        if len(candidates) == 1:
+            return self._set_found_type(candidates[0], self._fetch_area_type(candidates[0]))
+        executor = ThreadPoolExecutor(max_workers=len(candidates))
+        futures = {executor.submit(self._fetch_area_type, area_type): area_type for area_type in candidates}
+        error = None
+        try:
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        feature = future.result()
+                    except Exception as er:
+                        error = error or er
+                        continue
+                    if feature:
+                        return self._set_found_type(futures[future], feature)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if error:
+            raise error
+        return None
+
+    def _validate_area_type(self) -> None:
+        if self.area_type not in TYPES.values():
+            raise ValueError(
+                "Invalid area_type specified. Available options: "
+                + ", ".join([f"{k} - {v}" for k, v in TYPES.items()])
+            )
+
     def get_geometry(self) -> Optional[dict]:
         if self.area_type is not None:
-            if self.area_type not in TYPES.values():
-                raise ValueError(
-                    "Invalid area_type specified. Available options: "
-                    + ", ".join([f"{k} - {v}" for k, v in TYPES.items()])
-                )
+            self._validate_area_type()
             return self._query_with_area_type(self.area_type)
+        # Auto-detect: the found type is stored in area_type
+        return self._query_candidate_types()
 
     def _matches_criteria(self, feature: dict) -> bool:
         return True
@@ -114,38 +330,50 @@ class Area:
         return self.to_geojson(dumps=dumps)
 
     def to_geojson(self, dumps: bool = True) -> Union[str, dict, None]:
-        if self.feature:
-            return json.dumps(self.feature) if dumps else self.feature
+        feature = self.feature
+        if feature:
+            return jsonlib.dumps(feature) if dumps else feature
         return None
 
     def to_kml(self) -> str:
-        if not self.feature:
+        feature = self.feature
+        if not feature:
             raise NoCoordinatesException("No geometry feature available for conversion to KML.")
-        coords = [self.feature.get("geometry", {}).get("coordinates")]
-        attrs = self.feature.get("properties", {})
+        coords = [feature.get("geometry", {}).get("coordinates")]
+        attrs = feature.get("properties", {})
         return coords2kml(coords, attrs)
 
-    def _make_request(
+    def _request_options(
         self,
         url: str,
         method: str,
         body: Optional[Union[Dict, bytes]] = None,
     ) -> dict:
-        proxy_path = os.path.join(self.tmp_path, "proxy.txt")
-        effective_proxy_handler = self.proxy_handler or ProxyHandling(path=proxy_path)
-        self.logger.debug(f"Request URL: {url}")
+        """Keyword arguments for make_request / async_make_request."""
+        self.logger.debug("Request URL: %s", url)
         headers = {"Content-Type": "application/json"}
-        response = make_request(
+        return dict(
             url=url,
+            adapter=self.adapter,
             body=body,
             method=method,
             with_proxy=self.with_proxy,
-            proxy_handler=effective_proxy_handler,
+            proxy_handler=self.get_proxy_pool() if self.with_proxy else None,
             logger=self.logger,
             timeout=self.timeout,
             headers=headers,
             proxy_url=self.proxy_url,
+            rate_limiter=self.rate_limiter,
+            retry_policy=self.retry_policy,
         )
+
+    def _make_request(
+        self,
+        url: str,
+        method: str,
+        body: Optional[Union[Dict, bytes]] = None,
+    ) -> dict:
+        response = make_request(**self._request_options(url, method, body))
         return response
 
     def make_request(
@@ -0,0 +1,76 @@
+from collections import defaultdict
+from time import sleep
+from typing import Dict, Iterable, List, Optional
+
+from .cache import make_cache_key
+from .crs import request_crs
+from .parser import Area
+from .utils import AREA_TYPE_OBJECT, clear_code, quarter_of
+
+# Quarters with fewer requested parcels are cheaper to look up one by one
+DEFAULT_MIN_PARCELS = 3
+
+
+def group_by_quarter(codes: Iterable[str], min_parcels: int = DEFAULT_MIN_PARCELS) -> Dict[str, List[str]]:
+    """Parcel codes grouped by their cadastral quarter, only quarters with at least ``min_parcels`` codes."""
+    quarters = defaultdict(list)
+    names = {}
+    for code in codes:
+        quarter = quarter_of(code)
+        if quarter:
+            # Variants of the same quarter are grouped, the first one is used for the query
+            key = names.setdefault(clear_code(quarter), quarter)
+            quarters[key].append(code)
+    return {q: parcels for q, parcels in quarters.items() if len(parcels) >= min_parcels}
+
+
+def _feature_code(feature: dict) -> Optional[str]:
+    properties = feature.get("properties") or {}
+    return (properties.get("options") or {}).get("cad_num") or properties.get("label")
+
+
+def prefetch_quarter(quarter: str, parcels: List[str], logger=None, **kwargs) -> int:
+    """
+    Search the objects of ``quarter`` in one request and cache the found ``parcels``.
+
+    The cached entries are the ones a parcel lookup with ``area_type=1`` reads, so the
+    following ``Area`` calls are served locally. Return the number of cached parcels.
+    """
+    kwargs = dict(kwargs, area_type=AREA_TYPE_OBJECT, lazy=True, with_log=False, logger=logger)
+    area = Area(quarter, **kwargs)
+    resp = area.make_request(area.search_url(AREA_TYPE_OBJECT))
+    data = (resp or {}).get("data") or {}
+    wanted = {clear_code(code): code for code in parcels}
+    cache = area.get_cache()
+    crs = request_crs(area.coord_out)
+    seeded = 0
+    for feature in data.get("features") or []:
+        code = wanted.pop(clear_code(_feature_code(feature) or ""), None)
+        if code is None:
+            continue
+        entry = {"data": {"features": [feature]}}
+        if "crs" in data:
+            entry["data"]["crs"] = data["crs"]
+        cache.put(make_cache_key(AREA_TYPE_OBJECT, code, crs), entry)
+        seeded += 1
+    if logger:
+        logger.debug("Quarter %s: %i of %i parcels prefetched", quarter, seeded, len(parcels))
+    return seeded
+
+
+def prefetch_quarters(codes: Iterable[str], delay: float = 0, min_parcels: int = DEFAULT_MIN_PARCELS, **kwargs) -> int:
+    """
+    Prefetch the parcels of ``codes`` quarter by quarter (see :func:`prefetch_quarter`).
+
+    A failed quarter is skipped, its parcels are then requested one by one as usual.
+    Return the number of parcels served from the prefetched quarters.
+    """
+    seeded = 0
+    for i, (quarter, parcels) in enumerate(group_by_quarter(codes, min_parcels).items()):
+        if i and delay:
+            sleep(delay)
+        try:
+            seeded += prefetch_quarter(quarter, parcels, **kwargs)
+        except Exception as er:
+            print("Quarter %s prefetch failed: %s" % (quarter, er))
+    return seeded
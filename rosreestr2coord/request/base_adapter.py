@@ -1,13 +1,18 @@
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Optional, Union
+from typing import Any, Dict, Optional, Union
 
+from .. import jsonlib
+from ..metrics import REQUEST_SECONDS, REQUESTS, get_metrics
 from .exceptions import (
     HTTPBadRequestException,
     HTTPErrorException,
     HTTPForbiddenException,
+    HTTPTooManyRequestsException,
     RequestException,
 )
 from .helpers import get_rosreestr_headers, is_error_response
+from .retry import parse_retry_after
 
 
 class RequestAdapter(ABC):
@@ -34,30 +39,99 @@ class RequestAdapter(ABC):
         body: Optional[Union[Dict, bytes]] = None,
     ) -> bytes:
         """Performs the HTTP request."""
-        default_headers = get_rosreestr_headers()
-        headers = {**default_headers, **(headers or {})}
-
+        headers = self.prepare_headers(headers)
+        start = time.perf_counter()
+        status = "error"
         try:
             response = self._make_request(url, proxy, timeout, headers, method, body)
-            is_error = is_error_response(url, response)
-            if is_error:
-                raise RequestException(is_error)
-            return response
+            result = self.check_response(url, self._parse_timed(response))
+            status = "ok"
+            return result
         except self.get_specific_http_error() as er:
-            if hasattr(er, "code") and er.code == 403:
-                raise HTTPForbiddenException(f"HTTP 403 Forbidden: {er.reason}") from er
-            elif self.is_specific_error(er):
-                raise HTTPBadRequestException("HTTP 400 Bad Request") from er
-            else:
-                raise HTTPErrorException(f"HTTP Error: {str(er)}") from er
+            status = str(self.get_status_code(er) or status)
+            raise self.translate_http_error(er) from er
+        except RequestException:
+            raise
         except Exception as er:
             self.handle_exception(er, logger)
             raise
+        finally:
+            self._record_request(start, status)
+
+    @staticmethod
+    def prepare_headers(headers: Optional[dict]) -> dict:
+        default_headers = get_rosreestr_headers()
+        return {**default_headers, **(headers or {})}
+
+    @staticmethod
+    def parse_response(response: Any) -> Any:
+        """Decode a raw JSON body returned by ``_make_request``, this is the only place a response is parsed."""
+        if isinstance(response, (bytes, bytearray, memoryview, str)):
+            return jsonlib.loads(response)
+        return response
+
+    def _parse_timed(self, response: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return self.parse_response(response)
+        finally:
+            get_metrics().phase("parse", time.perf_counter() - start)
+
+    @staticmethod
+    def _record_request(start: float, status: str) -> None:
+        """Count the request by outcome (ok, HTTP status code or error) and observe its duration."""
+        metrics = get_metrics()
+        metrics.inc(REQUESTS, status=status)
+        metrics.observe(REQUEST_SECONDS, time.perf_counter() - start)
+
+    @staticmethod
+    def check_response(url: str, response: Any) -> Any:
+        is_error = is_error_response(url, response)
+        if is_error:
+            raise RequestException(is_error)
+        return response
+
+    def get_status_code(self, er: Exception) -> Optional[int]:
+        return getattr(er, "code", None)
+
+    def get_response_header(self, er: Exception, name: str) -> Optional[str]:
+        headers = getattr(er, "headers", None)
+        return headers.get(name) if headers is not None else None
+
+    def translate_http_error(self, er: Exception) -> RequestException:
+        status = self.get_status_code(er)
+        if status == 403:
+            error = HTTPForbiddenException(f"HTTP 403 Forbidden: {getattr(er, 'reason', er)}")
+        elif status == 429:
+            error = HTTPTooManyRequestsException("HTTP 429 Too Many Requests")
+        elif self.is_specific_error(er):
+            return HTTPBadRequestException("HTTP 400 Bad Request")
+        else:
+            error = HTTPErrorException(f"HTTP Error: {str(er)}")
+        # Honoured by the retry policy
+        error.retry_after = parse_retry_after(self.get_response_header(er, "Retry-After"))
+        error.transient = status in (403, 429) or (status or 0) >= 500
+        return error
+
+    def stats(self) -> Dict[str, int]:
+        """Connection statistics, e.g. how many connections were opened and reused."""
+        return {}
+
+    def close(self) -> None:
+        """Releases pooled connections."""
+        pass
 
     def handle_exception(self, er: Exception, logger: Optional[object]) -> None:
         if logger:
             logger.error(f"Request failed: {er}")
-        raise RequestException(er)
+        error = RequestException(er)
+        # Honoured by the retry policy
+        error.transient = self.is_transient_error(er)
+        raise error from er
+
+    def is_transient_error(self, er: Exception) -> bool:
+        """Whether a request failure (not an HTTP error response) may go away on a retry: timeouts, lost connections."""
+        return isinstance(er, OSError)
 
     @abstractmethod
     def get_specific_http_error(self):
@@ -67,3 +141,53 @@ class RequestAdapter(ABC):
     def is_specific_error(self, er: Exception) -> bool:
         """Determines if the exception is a specific error that should be propagated."""
         pass
+
+
+class AsyncRequestAdapter(RequestAdapter):
+    """Adapter performing requests as coroutines: ``perform_request`` has to be awaited."""
+
+    @abstractmethod
+    async def _make_request(
+        self,
+        url: str,
+        proxy: Optional[str],
+        timeout: int,
+        headers: dict,
+        method: str = "GET",
+        body: Optional[Union[Dict, bytes]] = None,
+    ) -> bytes:
+        pass
+
+    async def perform_request(
+        self,
+        url: str,
+        proxy: Optional[str],
+        logger: Optional[object],
+        timeout: int,
+        headers: Optional[dict] = None,
+        method: str = "GET",
+        body: Optional[Union[Dict, bytes]] = None,
+    ) -> bytes:
+        """Performs the HTTP request."""
+        headers = self.prepare_headers(headers)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = await self._make_request(url, proxy, timeout, headers, method, body)
+            result = self.check_response(url, self._parse_timed(response))
+            status = "ok"
+            return result
+        except self.get_specific_http_error() as er:
+            status = str(self.get_status_code(er) or status)
+            raise self.translate_http_error(er) from er
+        except RequestException:
+            raise
+        except Exception as er:
+            self.handle_exception(er, logger)
+            raise
+        finally:
+            self._record_request(start, status)
+
+    async def aclose(self) -> None:
+        """Releases pooled connections."""
+        pass
@@ -16,3 +16,7 @@ class HTTPErrorException(RequestException):
 
 class HTTPForbiddenException(RequestException):
     pass
+
+
+class HTTPTooManyRequestsException(RequestException):
+    pass
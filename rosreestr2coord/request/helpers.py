@@ -1,21 +1,26 @@
-import json
-from typing import Dict, Union
+from typing import Any, Dict, Union
+
+from .. import jsonlib
 
 USER_AGENT = "Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/64.0.3282.186 \
     Safari/537.36"
 
 
-def is_error_response(url: str, response: bytes) -> Union[bool, str]:
-    is_error = False
-    try:
-        data = json.loads(response)
-        error = data.get("error")
-        if error:
-            message = error.get("message")
-            is_error = message if message else "error"
-    except Exception:
-        pass
-    return is_error
+def is_error_response(url: str, response: Any) -> Union[bool, str]:
+    """Error message of an API response (parsed, or raw JSON), False if it is not an error."""
+    data = response
+    if isinstance(response, (bytes, bytearray, str)):
+        try:
+            data = jsonlib.loads(response)
+        except ValueError:
+            return False
+    if not isinstance(data, dict):
+        return False
+    error = data.get("error")
+    if not error:
+        return False
+    message = error.get("message") if isinstance(error, dict) else None
+    return message if message else "error"
 
 
 def get_rosreestr_headers() -> Dict[str, str]:
@@ -1,27 +1,194 @@
-from typing import Optional
+import ssl
+import threading
+import time
+from typing import Dict, Optional, Union
 
 import httpx
 
-from .base_adapter import RequestAdapter
+from .. import jsonlib
+from ..metrics import get_metrics
+from .base_adapter import AsyncRequestAdapter, RequestAdapter
 
+MAX_CONNECTIONS = 100
+
+# httpcore trace events observed as request phases, DNS is part of connect_tcp
+TRACE_PHASES = {
+    "connection.connect_tcp": "connect",
+    "connection.start_tls": "tls",
+    "proxy.start_tls": "tls",
+    "http11.receive_response_body": "download",
+    "http2.receive_response_body": "download",
+}
+
+
+def _create_ssl_context() -> ssl.SSLContext:
+    context = ssl._create_unverified_context()
+    context.set_ciphers("ALL:@SECLEVEL=1")
+    return context
+
+
+def _proxy_url(proxy: Optional[str]) -> Optional[str]:
+    if not proxy:
+        return None
+    return proxy if "://" in proxy else f"http://{proxy}"
+
+
+def _request_kwargs(headers: dict, timeout: int, body: Optional[Union[Dict, bytes]]) -> dict:
+    kwargs = {"headers": headers, "timeout": timeout}
+    if isinstance(body, dict):
+        kwargs["content"] = jsonlib.dumps_bytes(body)
+        kwargs["headers"] = {"Content-Type": "application/json", **headers}
+    elif body:
+        kwargs["content"] = body
+    return kwargs
+
+
+class _PhaseTrace:
+    """
+    ``trace`` request extension of httpcore observing the connection phases.
+
+    The time to first byte runs from sending the request headers to receiving the response headers.
+    """
+
+    def __init__(self):
+        self._started = {}
+
+    def __call__(self, event: str, info: dict) -> None:
+        self.record(event)
+
+    def record(self, event: str) -> None:
+        name, _, stage = event.rpartition(".")
+        now = time.perf_counter()
+        if stage == "started":
+            self._started[name] = now
+        elif stage == "complete":
+            if name in TRACE_PHASES:
+                get_metrics().phase(TRACE_PHASES[name], now - self._started.pop(name, now))
+            elif name.endswith(".receive_response_headers"):
+                sent = self._started.pop(name.replace("receive_response", "send_request"), now)
+                get_metrics().phase("ttfb", now - sent)
+
+
+class _AsyncPhaseTrace(_PhaseTrace):
+    async def __call__(self, event: str, info: dict) -> None:
+        self.record(event)
+
+
+class _HttpxMixin:
+    def _client_options(self, proxy: Optional[str]) -> dict:
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        return {
+            "proxy": _proxy_url(proxy),
+            "verify": self.ssl_context,
+            "http2": self.http2,
+            "limits": limits,
+            "follow_redirects": True,
+        }
+
+    def get_specific_http_error(self):
+        return httpx.HTTPStatusError
+
+    def get_status_code(self, er: Exception) -> Optional[int]:
+        response = getattr(er, "response", None)
+        return response.status_code if response is not None else None
+
+    def get_response_header(self, er: Exception, name: str) -> Optional[str]:
+        response = getattr(er, "response", None)
+        return response.headers.get(name) if response is not None else None
+
+    def is_specific_error(self, er: Exception) -> bool:
+        """Checks if the HTTP status code is 400."""
+        return self.get_status_code(er) == 400
+
+    def is_transient_error(self, er: Exception) -> bool:
+        return isinstance(er, (httpx.TransportError, OSError))
+
+
+class HttpxAdapter(_HttpxMixin, RequestAdapter):
+    """
+    Adapter built on httpx.
+
+    One long-lived ``httpx.Client`` (and so one connection pool) is kept per proxy.
+    HTTP/2 requires the ``h2`` package (``pip install httpx[http2]``).
+    """
+
+    def __init__(self, http2: bool = False, max_connections: int = MAX_CONNECTIONS):
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.ssl_context = _create_ssl_context()
+        self._clients: Dict[str, httpx.Client] = {}
+        self._lock = threading.Lock()
+
+    def _get_client(self, proxy: Optional[str]) -> httpx.Client:
+        key = proxy or ""
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = httpx.Client(**self._client_options(proxy))
+                self._clients[key] = client
+            return client
 
-class HttpxAdapter(RequestAdapter):
     def _make_request(
         self,
         url: str,
         proxy: Optional[str],
-        headers: dict,
         timeout: int,
+        headers: dict,
+        method: str = "GET",
+        body: Optional[Union[Dict, bytes]] = None,
     ) -> bytes:
-        proxies = {"http://": f"http://{proxy}", "https://": f"http://{proxy}"} if proxy else None
-        with httpx.Client(proxies=proxies, verify=False, timeout=timeout) as client:
-            response = client.get(url, headers=headers)
-            response.raise_for_status()
-            return response.content
+        client = self._get_client(proxy)
+        kwargs = _request_kwargs(headers, timeout, body)
+        response = client.request(method, url, extensions={"trace": _PhaseTrace()}, **kwargs)
+        response.raise_for_status()
+        return response.content
 
-    def get_specific_http_error(self):
-        return httpx.HTTPStatusError
+    def close(self) -> None:
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
 
-    def is_specific_error(self, er: Exception) -> bool:
-        """Checks if the HTTP status code is 400."""
-        return hasattr(er, "response") and er.response.status_code == 400
+
+class AsyncHttpxAdapter(_HttpxMixin, AsyncRequestAdapter):
+    """
+    Asyncio counterpart of :class:`HttpxAdapter` built on ``httpx.AsyncClient``.
+
+    The clients are bound to the event loop they were first used in.
+    """
+
+    def __init__(self, http2: bool = False, max_connections: int = MAX_CONNECTIONS):
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.ssl_context = _create_ssl_context()
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _get_client(self, proxy: Optional[str]) -> httpx.AsyncClient:
+        key = proxy or ""
+        client = self._clients.get(key)
+        if client is None:
+            client = httpx.AsyncClient(**self._client_options(proxy))
+            self._clients[key] = client
+        return client
+
+    async def _make_request(
+        self,
+        url: str,
+        proxy: Optional[str],
+        timeout: int,
+        headers: dict,
+        method: str = "GET",
+        body: Optional[Union[Dict, bytes]] = None,
+    ) -> bytes:
+        client = self._get_client(proxy)
+        kwargs = _request_kwargs(headers, timeout, body)
+        response = await client.request(method, url, extensions={"trace": _AsyncPhaseTrace()}, **kwargs)
+        response.raise_for_status()
+        return response.content
+
+    async def aclose(self) -> None:
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
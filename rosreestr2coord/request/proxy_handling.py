@@ -1,9 +1,6 @@
 import os
 import re
 import time
-import urllib.error
-import urllib.parse
-import urllib.request
 from urllib.parse import urlparse
 
 from .helpers import USER_AGENT
@@ -47,15 +44,17 @@ class ProxyHandling:
         self.dump_proxies(found[:20])  # 20 top proxies
 
     def _free_proxies(self, url="https://free-proxy-list.net/"):
+        # Imported here, urllib.request is slow to import and only needed to refresh the list
+        import urllib.request
+
         # Downloading without proxy
         opener = urllib.request.build_opener(urllib.request.ProxyHandler())
-        urllib.request.install_opener(opener)
         request = urllib.request.Request(url)
         request.add_header("user-agent", self.user_agent)
         parsed_uri = urlparse(url)
         host = "{uri.scheme}://{uri.netloc}/".format(uri=parsed_uri)
         request.add_header("referer", host)
-        f = urllib.request.urlopen(request)
+        f = opener.open(request)
         pattern = r"\d*\.\d*\.\d*\.\d*\</td><td>\d*"
         s = f.read().decode("utf-8")
         found = [i.replace("</td><td>", ":") + "\n" for i in re.findall(pattern, s)]
@@ -0,0 +1,227 @@
+import atexit
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from .proxy_handling import ProxyHandling
+
+DEFAULT_COOLDOWN = 30.0
+MAX_COOLDOWN = 600.0
+# Latency assumed for proxies that have not answered yet
+DEFAULT_LATENCY = 1.0
+LATENCY_SMOOTHING = 0.3
+
+_pools: Dict[str, "ProxyPool"] = {}
+_pools_lock = threading.Lock()
+
+
+class ProxyStats:
+    """Health of a single proxy."""
+
+    __slots__ = ("proxy", "successes", "failures", "consecutive_failures", "latency", "cooldown_until")
+
+    def __init__(self, proxy: str):
+        self.proxy = proxy
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency: Optional[float] = None
+        self.cooldown_until = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        # Laplace smoothing: a new proxy starts at 0.5 instead of 0 or 1
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    @property
+    def score(self) -> float:
+        """Selection weight: success rate per second of latency."""
+        latency = self.latency if self.latency is not None else DEFAULT_LATENCY
+        return self.success_rate / (latency + 0.1)
+
+
+class ProxyPool:
+    """
+    In-memory pool of proxies shared by all requests of a process.
+
+    Proxies are picked at random weighted by their score (success rate and latency),
+    a failing proxy is put on an exponentially growing cool-down and is dropped after
+    ``max_failures`` failures in a row. The list is read from ``handler`` (which
+    downloads a fresh one when the file is old or empty) only when the pool runs dry,
+    and the surviving proxies are written back at most every ``save_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        handler: ProxyHandling,
+        cooldown: float = DEFAULT_COOLDOWN,
+        max_failures: int = 3,
+        save_interval: float = 60.0,
+        refresh_interval: float = 60.0,
+        rng: Optional[random.Random] = None,
+    ):
+        self.handler = handler
+        self.cooldown = cooldown
+        self.max_failures = max_failures
+        self.save_interval = save_interval
+        self.refresh_interval = refresh_interval
+        self._rng = rng or random.Random()
+        self._stats: Dict[str, ProxyStats] = {}
+        self._dead = set()
+        self._lock = threading.RLock()
+        # Held while the list is loaded (maybe downloaded), the pool stays usable meanwhile
+        self._refresh_lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._refreshed_at = 0.0
+
+    def proxies(self) -> List[str]:
+        """Known proxies, best first."""
+        with self._lock:
+            return [s.proxy for s in sorted(self._stats.values(), key=lambda s: s.score, reverse=True)]
+
+    def stats(self, proxy: str) -> Optional[ProxyStats]:
+        with self._lock:
+            return self._stats.get(proxy)
+
+    def add(self, proxies: Iterable[str]) -> None:
+        with self._lock:
+            for proxy in proxies:
+                proxy = proxy.strip()
+                if proxy and proxy not in self._stats and proxy not in self._dead:
+                    self._stats[proxy] = ProxyStats(proxy)
+
+    def refresh(self) -> None:
+        """Merge the proxies of the file (downloaded again by the handler if needed) into the pool."""
+        with self._refresh_lock:
+            self._refresh()
+
+    def _refresh(self) -> None:
+        self.save(force=True)
+        proxies = self.handler.load_proxies()
+        with self._lock:
+            self.add(proxies)
+            self._loaded = True
+            self._refreshed_at = time.monotonic()
+
+    def _refresh_since(self, refreshed_at: float) -> None:
+        """Refresh unless another thread did it since ``refreshed_at`` while this one was waiting."""
+        with self._refresh_lock:
+            if self._refreshed_at == refreshed_at:
+                self._refresh()
+
+    def acquire(self, exclude: Iterable[str] = ()) -> Optional[str]:
+        """Pick a proxy that is not cooling down, or return None if there is none."""
+        exclude = set(exclude)
+        with self._lock:
+            candidates = self._available(exclude)
+            refreshed_at = self._refreshed_at
+            stale = not self._loaded or (not candidates and time.monotonic() - refreshed_at >= self.refresh_interval)
+        if stale:
+            self._refresh_since(refreshed_at)
+        with self._lock:
+            if stale:
+                candidates = self._available(exclude)
+            if not candidates:
+                return None
+            return self._rng.choices(candidates, weights=[s.score for s in candidates])[0].proxy
+
+    def _available(self, exclude: set) -> List[ProxyStats]:
+        now = time.monotonic()
+        return [s for s in self._stats.values() if s.cooldown_until <= now and s.proxy not in exclude]
+
+    def report_success(self, proxy: str, latency: float) -> None:
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is None:
+                return
+            stats.successes += 1
+            stats.consecutive_failures = 0
+            stats.cooldown_until = 0.0
+            if stats.latency is None:
+                stats.latency = latency
+            else:
+                stats.latency += LATENCY_SMOOTHING * (latency - stats.latency)
+            self._changed()
+
+    def report_failure(self, proxy: str) -> None:
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is None:
+                return
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= self.max_failures:
+                del self._stats[proxy]
+                self._dead.add(proxy)
+            else:
+                cooldown = min(self.cooldown * 2 ** (stats.consecutive_failures - 1), MAX_COOLDOWN)
+                stats.cooldown_until = time.monotonic() + cooldown
+            self._changed()
+
+    def _changed(self) -> None:
+        self._dirty = True
+        self.save()
+
+    def save(self, force: bool = False) -> None:
+        """Write the surviving proxies (best first) to the handler file if the pool changed."""
+        with self._lock:
+            if not self._dirty or (not force and time.monotonic() - self._saved_at < self.save_interval):
+                return
+            self.handler.dump_proxies(f"{proxy}\n" for proxy in self.proxies())
+            self._dirty = False
+            self._saved_at = time.monotonic()
+
+    def health_check(self, url: str, adapter, timeout: float = 5, workers: int = 10, logger=None) -> int:
+        """
+        Request ``url`` through every proxy concurrently and score them, return the number of working ones.
+
+        Failing proxies go on cool-down (dropped with ``max_failures=1``), so a batch doesn't start with them.
+        """
+        if not self._loaded:
+            self._refresh_since(0.0)
+
+        def check(proxy: str) -> bool:
+            start = time.monotonic()
+            try:
+                adapter.perform_request(url, proxy, logger, timeout)
+            except Exception as er:
+                if logger:
+                    logger.debug("Proxy %s failed the health check: %s", proxy, er)
+                self.report_failure(proxy)
+                return False
+            self.report_success(proxy, time.monotonic() - start)
+            return True
+
+        proxies = self.proxies()
+        if not proxies:
+            return 0
+        with ThreadPoolExecutor(max_workers=min(workers, len(proxies))) as executor:
+            return sum(executor.map(check, proxies))
+
+
+def _save_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        try:
+            pool.save(force=True)
+        except OSError:
+            pass
+
+
+def get_proxy_pool(handler: ProxyHandling, **kwargs) -> ProxyPool:
+    """Return the process-wide pool for the proxy file of ``handler`` so all batch workers share it."""
+    path = os.path.abspath(handler.path)
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            if not _pools:
+                atexit.register(_save_pools)
+            pool = ProxyPool(handler, **kwargs)
+            _pools[path] = pool
+        return pool
@@ -0,0 +1,78 @@
+import threading
+import time
+from typing import Dict, Optional
+
+DIRECT = ""  # bucket key for requests made without a proxy
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled with ``rate`` tokens per second up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return the number of seconds the caller has to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """
+    Rate limiter shared by all workers of a batch.
+
+    ``rate`` limits the total number of requests per second, ``per_proxy_rate``
+    limits each proxy (and the direct connection) separately.
+    """
+
+    def __init__(self, rate: Optional[float] = None, per_proxy_rate: Optional[float] = None, burst: float = 1):
+        self.global_bucket: Optional[TokenBucket] = TokenBucket(rate, burst) if rate else None
+        self.per_proxy_rate = per_proxy_rate
+        self.burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _proxy_bucket(self, proxy: Optional[str]) -> Optional[TokenBucket]:
+        if not self.per_proxy_rate:
+            return None
+        key = proxy or DIRECT
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.per_proxy_rate, 1)
+                self._buckets[key] = bucket
+            return bucket
+
+    def reserve(self, proxy: Optional[str] = None) -> float:
+        """Take tokens for a request and return how long to wait before sending it (for asyncio callers)."""
+        wait = 0.0
+        bucket = self._proxy_bucket(proxy)
+        if bucket:
+            wait = bucket.reserve()
+        if self.global_bucket:
+            wait = max(wait, self.global_bucket.reserve())
+        return wait
+
+    def acquire(self, proxy: Optional[str] = None) -> None:
+        bucket = self._proxy_bucket(proxy)
+        if bucket:
+            bucket.acquire()
+        if self.global_bucket:
+            self.global_bucket.acquire()
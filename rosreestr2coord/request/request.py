@@ -1,42 +1,145 @@
-from typing import Dict, Optional, Union
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Union
 
-from .base_adapter import RequestAdapter
-from .exceptions import HTTPBadRequestException, HTTPErrorException, TimeoutException
+from .base_adapter import AsyncRequestAdapter, RequestAdapter
+from .exceptions import HTTPBadRequestException, TimeoutException
 from .proxy_handling import ProxyHandling
+from .proxy_pool import ProxyPool, get_proxy_pool
+from .rate_limit import RateLimiter
+from .retry import DEFAULT_RETRY_POLICY, NO_RETRY_POLICY, RetryPolicy
 from .urlib_adapter import UrllibAdapter
 
-proxy_handling = ProxyHandling()
-request_adapter = UrllibAdapter()
+ADAPTERS = ("urllib", "httpx")
+
+# Shared objects created on first use rather than at import
+_shared: Dict[str, object] = {}
+_shared_lock = threading.Lock()
+_SHARED_FACTORIES = {"request_adapter": UrllibAdapter, "proxy_handling": ProxyHandling}
+
+
+def _get_shared(name: str) -> object:
+    shared = _shared.get(name)
+    if shared is not None:
+        return shared
+    with _shared_lock:
+        if name not in _shared:
+            _shared[name] = _SHARED_FACTORIES[name]()
+        return _shared[name]
+
+
+def __getattr__(name: str) -> object:
+    # ``request_adapter`` and ``proxy_handling`` stay importable from this module
+    if name in _SHARED_FACTORIES:
+        return _get_shared(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_request_adapter() -> RequestAdapter:
+    """Adapter of the requests made without one, shared by the process and created on first use."""
+    return _get_shared("request_adapter")
+
+
+def create_adapter(name: str = "urllib", http2: bool = False, is_async: bool = False) -> RequestAdapter:
+    """Create a request adapter by name. The httpx adapters need the optional ``httpx`` dependency."""
+    if name == "httpx":
+        from .httpx_adapter import AsyncHttpxAdapter, HttpxAdapter
+
+        return AsyncHttpxAdapter(http2=http2) if is_async else HttpxAdapter(http2=http2)
+    if name == "urllib" and not is_async:
+        if http2:
+            raise ValueError("HTTP/2 is only supported by the httpx adapter")
+        return UrllibAdapter()
+    raise ValueError(f"Unknown adapter {name!r}. Available options: {', '.join(ADAPTERS)}")
 
 
 def make_request(
     url: str,
-    adapter: RequestAdapter = request_adapter,
+    adapter: Optional[RequestAdapter] = None,
     with_proxy: bool = False,
-    proxy_handler: Optional[ProxyHandling] = None,
+    proxy_handler: Union[ProxyHandling, ProxyPool, None] = None,
     logger: Optional[object] = None,
     timeout: int = 5,
     proxy_url: Optional[str] = None,
     headers: Optional[dict] = None,
     method: str = "GET",
     body: Union[Dict, bytes, None] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
 ) -> Union[bytes, None]:
+    """
+    Perform a request directly, through ``proxy_url`` or through the proxy pool.
+
+    Failed attempts are retried according to ``retry_policy``. Without a policy requests
+    through proxies are tried 3 times with backoff and direct requests are tried once.
+    """
     if not url:
         raise ValueError("The URL is not set")
+    adapter = adapter or get_request_adapter()
+    if isinstance(adapter, AsyncRequestAdapter):
+        raise TypeError("Asynchronous adapters have to be used with async_make_request")
 
     if proxy_url is not None:
         # Use a specified proxy
-        return make_request_with_specified_proxy(url, proxy_url, logger, adapter, timeout, headers, method, body)
+        return make_request_with_specified_proxy(
+            url, proxy_url, logger, adapter, timeout, headers, method, body, rate_limiter, retry_policy
+        )
     elif with_proxy:
         # Use a pool of proxies
-        proxy_handler = proxy_handler if proxy_handler else ProxyHandling()
-        return make_request_with_proxy(url, proxy_handler, logger, adapter, timeout, headers, method, body)
+        proxy_handler = proxy_handler if proxy_handler is not None else ProxyHandling()
+        return make_request_with_proxy(
+            url, proxy_handler, logger, adapter, timeout, headers, method, body, rate_limiter, retry_policy
+        )
     else:
         # Make a direct request without proxies
+        def perform(proxy: Optional[str]) -> bytes:
+            return adapter.perform_request(url, proxy, logger, timeout, headers, method, body)
+
+        return _request_with_retries(perform, None, retry_policy or NO_RETRY_POLICY, logger, rate_limiter, wrap=False)
+
+
+def _request_with_retries(
+    perform: Callable[[Optional[str]], bytes],
+    proxy: Optional[str],
+    policy: RetryPolicy,
+    logger: Optional[object],
+    rate_limiter: Optional[RateLimiter] = None,
+    wrap: bool = True,
+) -> bytes:
+    """
+    Call ``perform`` until it succeeds or the policy gives up.
+
+    An error the policy doesn't retry is raised right away. The last error is raised
+    as TimeoutException (``wrap=True``) or as is.
+    """
+    error = None
+    for attempt in range(1, policy.tries + 1):
+        policy.before_attempt()
+        if rate_limiter:
+            rate_limiter.acquire(proxy)
         try:
-            return adapter.perform_request(url, None, logger, timeout, headers, method, body)
+            response = perform(proxy)
         except Exception as er:
-            raise er
+            policy.record(er)
+            if not policy.is_retryable(er):
+                if logger:
+                    logger.error(f"Request failed, not retried: {er}")
+                raise
+            error = er
+            if logger:
+                via = f" with proxy {proxy}" if proxy else ""
+                logger.error(f"Attempt {attempt}{via} failed: {er}")
+            if attempt < policy.tries:
+                delay = policy.delay(attempt, er)
+                if logger:
+                    logger.debug("Retrying in %.1fs... (Attempt %i of %i)", delay, attempt + 1, policy.tries)
+                time.sleep(delay)
+            continue
+        policy.record()
+        return response
+    if not wrap:
+        raise error
+    raise TimeoutException(f"Failed to make request after {policy.tries} attempts") from error
 
 
 def make_request_with_specified_proxy(
@@ -48,70 +151,152 @@ def make_request_with_specified_proxy(
     headers: Optional[dict] = None,
     method: str = "GET",
     body: Union[Dict, bytes, None] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
 ) -> bytes:
-    tries = 3
-    for attempt in range(1, tries + 1):
-        try:
-            return adapter.perform_request(url, proxy, logger, timeout, headers, method, body)
-        except HTTPBadRequestException as er:
-            # Specific error; do not retry
-            if logger:
-                logger.error(f"HTTP 400 Bad Request: {er}")
-            raise
-        except (HTTPErrorException, Exception) as er:
-            if logger:
-                logger.error(f"Attempt {attempt} failed: {er}")
-            if attempt == tries:
-                raise TimeoutException(f"Failed to make request after {tries} attempts") from er
-            else:
-                if logger:
-                    logger.debug(f"Retrying... (Attempt {attempt + 1} of {tries})")
+    def perform(proxy: Optional[str]) -> bytes:
+        return adapter.perform_request(url, proxy, logger, timeout, headers, method, body)
+
+    return _request_with_retries(perform, proxy, retry_policy or DEFAULT_RETRY_POLICY, logger, rate_limiter)
+
+
+def _proxy_pool(url_proxy: Union[ProxyHandling, ProxyPool]) -> ProxyPool:
+    return url_proxy if isinstance(url_proxy, ProxyPool) else get_proxy_pool(url_proxy)
 
 
 def make_request_with_proxy(
     url: str,
-    url_proxy: ProxyHandling,
+    url_proxy: Union[ProxyHandling, ProxyPool],
     logger: Optional[object],
     adapter: RequestAdapter,
     timeout: int,
     headers: Optional[dict] = None,
     method: str = "GET",
     body: Union[Dict, bytes, None] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
 ) -> bytes:
-    tries_per_proxy = 3
     tries_for_proxies = 20
+    policy = retry_policy or DEFAULT_RETRY_POLICY
+    pool = _proxy_pool(url_proxy)
+    tried = set()
+
+    def perform(proxy: Optional[str]) -> bytes:
+        start = time.monotonic()
+        response = adapter.perform_request(url, proxy, logger, timeout, headers, method, body)
+        pool.report_success(proxy, time.monotonic() - start)
+        return response
 
     for _ in range(tries_for_proxies):
-        proxies = url_proxy.load_proxies()
-        if not proxies:
+        proxy = pool.acquire(exclude=tried)
+        if proxy is None:
             break
-        proxy = proxies.pop().strip()
+        tried.add(proxy)
 
         if logger:
-            logger.debug(f"Using proxy {proxy}")
+            logger.debug("Using proxy %s", proxy)
+        try:
+            return _request_with_retries(perform, proxy, policy, logger, rate_limiter)
+        except HTTPBadRequestException:
+            # The request itself is wrong, another proxy won't help
+            raise
+        except Exception as er:
+            # A bad proxy fails in any way (captive pages, 407, non-HTTP replies), so cool it down,
+            # the pool drops it after repeated failures
+            pool.report_failure(proxy)
+            if logger:
+                logger.debug("Proxy %s failed: %s", proxy, er)
+    if logger:
+        logger.error("Unable to make request via any proxy")
+    raise TimeoutException("Failed to make request after using all proxies")
+
+
+async def async_make_request(
+    url: str,
+    adapter: AsyncRequestAdapter,
+    with_proxy: bool = False,
+    proxy_handler: Union[ProxyHandling, ProxyPool, None] = None,
+    logger: Optional[object] = None,
+    timeout: int = 5,
+    proxy_url: Optional[str] = None,
+    headers: Optional[dict] = None,
+    method: str = "GET",
+    body: Union[Dict, bytes, None] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+) -> Union[bytes, None]:
+    """Coroutine counterpart of :func:`make_request` for asynchronous adapters."""
+    # Imported here so that the synchronous code paths do not pay for asyncio
+    import asyncio
+
+    if not url:
+        raise ValueError("The URL is not set")
+    policy = retry_policy or DEFAULT_RETRY_POLICY
+
+    async def perform(proxy: Optional[str]) -> bytes:
+        if rate_limiter:
+            await asyncio.sleep(rate_limiter.reserve(proxy))
+        return await adapter.perform_request(url, proxy, logger, timeout, headers, method, body)
 
-        for attempt in range(1, tries_per_proxy + 1):
+    if proxy_url is not None:
+        return await _async_request_with_retries(perform, proxy_url, policy, logger)
+    elif with_proxy:
+        pool = _proxy_pool(proxy_handler if proxy_handler is not None else ProxyHandling())
+        tried = set()
+        for _ in range(20):
+            proxy = pool.acquire(exclude=tried)
+            if proxy is None:
+                break
+            tried.add(proxy)
+            start = time.monotonic()
             try:
-                return adapter.perform_request(url, proxy, logger, timeout, headers, method, body)
-            except HTTPBadRequestException as er:
-                # Specific error; do not retry
-                if logger:
-                    logger.error(f"HTTP 400 Bad Request: {er}")
+                response = await _async_request_with_retries(perform, proxy, policy, logger)
+            except HTTPBadRequestException:
                 raise
-            except (HTTPErrorException, Exception) as er:
+            except Exception as er:
+                pool.report_failure(proxy)
                 if logger:
-                    logger.error(f"Attempt {attempt} with proxy {proxy} failed: {er}")
-                if attempt == tries_per_proxy:
-                    # Remove the non-working proxy after failed attempts
-                    proxies_remaining = url_proxy.get_proxies()
-                    if proxy in proxies_remaining:
-                        proxies_remaining.remove(proxy)
-                        url_proxy.dump_proxies(proxies_remaining)
-                    if logger:
-                        logger.debug(f"Removing proxy {proxy} after {tries_per_proxy} failed attempts")
-                else:
-                    if logger:
-                        logger.debug(f"Retrying with proxy {proxy}... (Attempt {attempt + 1} of {tries_per_proxy})")
-    if logger:
-        logger.error("Unable to make request via any proxy")
-    raise TimeoutException("Failed to make request after using all proxies")
+                    logger.debug("Proxy %s failed: %s", proxy, er)
+                continue
+            pool.report_success(proxy, time.monotonic() - start)
+            return response
+        if logger:
+            logger.error("Unable to make request via any proxy")
+        raise TimeoutException("Failed to make request after using all proxies")
+    else:
+        return await _async_request_with_retries(perform, None, retry_policy or NO_RETRY_POLICY, logger, wrap=False)
+
+
+async def _async_request_with_retries(
+    perform: Callable[[Optional[str]], Awaitable[bytes]],
+    proxy: Optional[str],
+    policy: RetryPolicy,
+    logger: Optional[object],
+    wrap: bool = True,
+) -> bytes:
+    """Asynchronous :func:`_request_with_retries`, waiting does not block the event loop."""
+    import asyncio
+
+    error = None
+    for attempt in range(1, policy.tries + 1):
+        if policy.breaker:
+            await asyncio.sleep(policy.breaker.remaining())
+        try:
+            response = await perform(proxy)
+        except Exception as er:
+            policy.record(er)
+            if not policy.is_retryable(er):
+                if logger:
+                    logger.error(f"Request failed, not retried: {er}")
+                raise
+            error = er
+            if logger:
+                logger.error(f"Attempt {attempt} with proxy {proxy} failed: {er}")
+            if attempt < policy.tries:
+                await asyncio.sleep(policy.delay(attempt, er))
+            continue
+        policy.record()
+        return response
+    if not wrap:
+        raise error
+    raise TimeoutException(f"Failed to make request after {policy.tries} attempts") from error
@@ -0,0 +1,149 @@
+import email.utils
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+from .exceptions import HTTPForbiddenException, HTTPTooManyRequestsException
+
+# Errors meaning that the endpoint is blocking us rather than failing
+BLOCKING_ERRORS = (HTTPForbiddenException, HTTPTooManyRequestsException)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a ``Retry-After`` header (delay in seconds or an HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - time.time(), 0.0)
+
+
+def retry_after(error: Optional[BaseException]) -> Optional[float]:
+    """``Retry-After`` delay carried by a request error, if any."""
+    return getattr(error, "retry_after", None)
+
+
+class CircuitBreaker:
+    """
+    Pause all requests when the endpoint starts blocking.
+
+    After ``threshold`` blocking errors (403/429) in a row the circuit opens for
+    ``cooldown`` seconds (or the server ``Retry-After`` if longer), every caller of
+    :meth:`wait` sleeps until then. Each consecutive trip doubles the pause up to
+    ``max_cooldown``, a successful request closes the circuit and resets it.
+    """
+
+    def __init__(
+        self,
+        threshold: int = 5,
+        cooldown: float = 60.0,
+        max_cooldown: float = 900.0,
+        on_open: Optional[Callable[[float], None]] = None,
+    ):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.on_open = on_open
+        self.trips = 0
+        self._failures = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.remaining() > 0
+
+    def remaining(self) -> float:
+        """Seconds left before requests may be sent again."""
+        with self._lock:
+            return max(self._open_until - time.monotonic(), 0.0)
+
+    def wait(self) -> None:
+        pause = self.remaining()
+        while pause > 0:
+            time.sleep(pause)
+            pause = self.remaining()
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self.trips = 0
+
+    def record_failure(self, error: BaseException) -> None:
+        if not isinstance(error, BLOCKING_ERRORS):
+            return
+        with self._lock:
+            self._failures += 1
+            if self._failures < self.threshold:
+                return
+            self._failures = 0
+            self.trips += 1
+            pause = min(self.cooldown * 2 ** (self.trips - 1), self.max_cooldown)
+            pause = max(pause, retry_after(error) or 0)
+            self._open_until = max(self._open_until, time.monotonic() + pause)
+        if self.on_open:
+            self.on_open(pause)
+
+
+class RetryPolicy:
+    """
+    How many times a request is tried and how long to wait in between.
+
+    Delays grow exponentially from ``base_delay`` up to ``max_delay`` with full
+    jitter (a random delay up to the backoff), a ``Retry-After`` sent with
+    429/503 responses takes precedence. An optional shared ``breaker`` pauses
+    every request using the policy while the endpoint is blocking.
+    """
+
+    def __init__(
+        self,
+        tries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        multiplier: float = 2.0,
+        jitter: bool = True,
+        breaker: Optional[CircuitBreaker] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        self.tries = tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.breaker = breaker
+        self._rng = rng or random.Random()
+
+    def is_retryable(self, error: BaseException) -> bool:
+        """Whether ``error`` may go away on a retry: timeouts and connection failures, 403, 429 and 5xx."""
+        return isinstance(error, BLOCKING_ERRORS) or getattr(error, "transient", False)
+
+    def delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """Seconds to wait after the failed ``attempt`` (counted from 1)."""
+        server_delay = retry_after(error)
+        if server_delay is not None:
+            return min(server_delay, self.max_delay)
+        backoff = min(self.base_delay * self.multiplier ** (attempt - 1), self.max_delay)
+        return self._rng.uniform(0, backoff) if self.jitter else backoff
+
+    def before_attempt(self) -> None:
+        if self.breaker:
+            self.breaker.wait()
+
+    def record(self, error: Optional[BaseException] = None) -> None:
+        if self.breaker:
+            if error is None:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure(error)
+
+
+# Used for requests through proxies when no policy is given
+DEFAULT_RETRY_POLICY = RetryPolicy()
+# Direct requests are tried once unless a policy is given
+NO_RETRY_POLICY = RetryPolicy(tries=1)
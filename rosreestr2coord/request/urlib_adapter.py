@@ -1,15 +1,116 @@
-import json
+import base64
+import http.client
+import socket
 import ssl
+import threading
+import time
 import urllib.error
-import urllib.request
-from typing import Dict, Optional, Union
-from urllib.request import Request, urlopen
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import unquote, urljoin, urlsplit
 
+from .. import jsonlib
+from ..metrics import get_metrics
 from .base_adapter import RequestAdapter
-from .exceptions import HTTPBadRequestException, HTTPForbiddenException
+from .exceptions import HTTPErrorException
+
+MAX_IDLE_PER_HOST = 10
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+# Errors raised when a pooled keep-alive connection was closed by the server in the meantime
+STALE_CONNECTION_ERRORS = (ConnectionResetError, BrokenPipeError, http.client.BadStatusLine)
+
+PoolKey = Tuple[str, str, int, str]
+
+
+def parse_proxy(proxy: str) -> Tuple[str, int, Optional[str]]:
+    """Split ``[scheme://][user:password@]host:port`` into host, port and a Proxy-Authorization value."""
+    if "://" not in proxy:
+        proxy = f"http://{proxy}"
+    parts = urlsplit(proxy)
+    auth = None
+    if parts.username:
+        credentials = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+        auth = "Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+    return parts.hostname, parts.port or 80, auth
+
+
+def _timed_create_connection(
+    address: Tuple[str, int], timeout: Optional[float], source_address: Optional[Tuple[str, int]]
+) -> socket.socket:
+    """``socket.create_connection`` observing the DNS lookup and the TCP connect as separate phases."""
+    metrics = get_metrics()
+    start = time.perf_counter()
+    addresses = socket.getaddrinfo(address[0], address[1], 0, socket.SOCK_STREAM)
+    resolved = time.perf_counter()
+    metrics.phase("dns", resolved - start)
+    error = None
+    for *_, sockaddr in addresses:
+        try:
+            sock = socket.create_connection(sockaddr[:2], timeout, source_address)
+        except OSError as er:
+            error = er
+            continue
+        metrics.phase("connect", time.perf_counter() - resolved)
+        return sock
+    raise error
+
+
+class ConnectionPool:
+    """Thread-safe pool of idle keep-alive connections grouped by (scheme, host, port, proxy)."""
+
+    def __init__(self, max_idle_per_host: int = MAX_IDLE_PER_HOST):
+        self.max_idle_per_host = max_idle_per_host
+        self.opened = 0
+        self.reused = 0
+        self._idle: Dict[PoolKey, List[http.client.HTTPConnection]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def acquire(
+        self, key: PoolKey, factory: Callable[[], http.client.HTTPConnection]
+    ) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.reused += 1
+                return idle.pop(), True
+            self.opened += 1
+        return factory(), False
+
+    def release(self, key: PoolKey, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle[key]
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            connections = [conn for idle in self._idle.values() for conn in idle]
+            self._idle.clear()
+        for conn in connections:
+            conn.close()
 
 
 class UrllibAdapter(RequestAdapter):
+    """
+    Adapter built on the standard library HTTP client.
+
+    TLS settings are created once per adapter and connections are kept alive
+    and reused across requests to the same host through the same proxy.
+    """
+
+    def __init__(self, max_idle_per_host: int = MAX_IDLE_PER_HOST):
+        self.ssl_context = self._create_ssl_context()
+        self.pool = ConnectionPool(max_idle_per_host)
+
+    @staticmethod
+    def _create_ssl_context() -> ssl.SSLContext:
+        context = ssl._create_unverified_context()
+        context.set_ciphers("ALL:@SECLEVEL=1")
+        return context
+
     def _make_request(
         self,
         url: str,
@@ -19,33 +120,118 @@ class UrllibAdapter(RequestAdapter):
         method: str = "GET",
         body: Optional[Union[Dict, bytes]] = None,
     ) -> bytes:
-        """Performs an HTTP request using urllib with optional proxy settings."""
-        if proxy:
-            proxy_handler = urllib.request.ProxyHandler({"http": proxy, "https": proxy})
-            opener = urllib.request.build_opener(proxy_handler)
-            urllib.request.install_opener(opener)
-
+        """Performs an HTTP request over a pooled connection with optional proxy settings."""
         if body and isinstance(body, dict):
-            body = json.dumps(body).encode("utf-8")
+            body = jsonlib.dumps_bytes(body)
 
-        request = Request(url, data=body, headers=headers, method=method)
-        context = ssl._create_unverified_context()
-        context.set_ciphers("ALL:@SECLEVEL=1")
+        for _ in range(MAX_REDIRECTS + 1):
+            status, reason, response_headers, data = self._send(url, proxy, timeout, headers, method, body)
+            location = response_headers.get("location")
+            if status not in REDIRECT_CODES or not location:
+                break
+            url = urljoin(url, location)
+            if status == 303 or (status in (301, 302) and method == "POST"):
+                method, body = "GET", None
+        else:
+            raise HTTPErrorException(f"Too many redirects (more than {MAX_REDIRECTS}): {url}")
 
-        try:
-            with urlopen(request, context=context, timeout=timeout) as response:
-                encoding = response.headers.get_content_charset() or "utf-8"
-                data = response.read().decode(encoding)
-
-                return json.loads(data)
-
-        except urllib.error.HTTPError as e:
-            if e.code == 403:
-                raise HTTPForbiddenException(f"HTTP 403 Forbidden: {e.reason}") from e
-            elif e.code == 400:
-                raise HTTPBadRequestException("HTTP 400 Bad Request") from e
-        except Exception as er:
-            raise
+        if status >= 400:
+            # Mapped to the request exceptions (403, 429, 400...) by translate_http_error
+            raise urllib.error.HTTPError(url, status, reason, response_headers, None)
+
+        # The raw body is parsed once by perform_request
+        encoding = response_headers.get_content_charset() or "utf-8"
+        return data if encoding.lower() in ("utf-8", "utf8") else data.decode(encoding)
+
+    def _send(
+        self,
+        url: str,
+        proxy: Optional[str],
+        timeout: int,
+        headers: dict,
+        method: str,
+        body: Optional[bytes],
+    ) -> Tuple[int, str, http.client.HTTPMessage, bytes]:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port, proxy or "")
+        target = parts.path or "/"
+        if parts.query:
+            target = f"{target}?{parts.query}"
+
+        request_headers = dict(headers)
+        if proxy and parts.scheme != "https":
+            # Plain HTTP goes through the proxy with an absolute URI instead of a CONNECT tunnel
+            target = url
+            _, _, proxy_auth = parse_proxy(proxy)
+            if proxy_auth:
+                request_headers["Proxy-Authorization"] = proxy_auth
+
+        def connect() -> http.client.HTTPConnection:
+            return self._new_connection(parts.scheme, parts.hostname, port, proxy)
+
+        metrics = get_metrics()
+        for attempt in range(2):
+            conn, reused = self.pool.acquire(key, connect)
+            try:
+                conn.timeout = timeout
+                if conn.sock:
+                    conn.sock.settimeout(timeout)
+                else:
+                    self._connect(conn)
+                start = time.perf_counter()
+                conn.request(method, target, body=body, headers=request_headers)
+                response = conn.getresponse()
+                received = time.perf_counter()
+                data = response.read()
+                metrics.phase("ttfb", received - start)
+                metrics.phase("download", time.perf_counter() - received)
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                if reused and not attempt:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self.pool.release(key, conn)
+            return response.status, response.reason, response.headers, data
+
+    @staticmethod
+    def _connect(conn: http.client.HTTPConnection) -> None:
+        """Open a new connection; for HTTPS the TLS handshake (and proxy tunnel) is timed after the TCP connect."""
+        connected = []
+
+        def create_connection(*args) -> socket.socket:
+            sock = _timed_create_connection(*args)
+            connected.append(time.perf_counter())
+            return sock
+
+        conn._create_connection = create_connection
+        conn.connect()
+        if connected and isinstance(conn, http.client.HTTPSConnection):
+            get_metrics().phase("tls", time.perf_counter() - connected[0])
+
+    def _new_connection(self, scheme: str, host: str, port: int, proxy: Optional[str]) -> http.client.HTTPConnection:
+        if proxy:
+            proxy_host, proxy_port, proxy_auth = parse_proxy(proxy)
+            if scheme != "https":
+                return http.client.HTTPConnection(proxy_host, proxy_port)
+            conn = http.client.HTTPSConnection(proxy_host, proxy_port, context=self.ssl_context)
+            conn.set_tunnel(host, port, headers={"Proxy-Authorization": proxy_auth} if proxy_auth else None)
+            return conn
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, context=self.ssl_context)
+        return http.client.HTTPConnection(host, port)
+
+    def stats(self) -> Dict[str, int]:
+        return {"opened": self.pool.opened, "reused": self.pool.reused}
+
+    def close(self) -> None:
+        self.pool.close()
 
     def get_specific_http_error(self):
         """Returns the urllib HTTPError class."""
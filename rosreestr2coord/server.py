@@ -0,0 +1,251 @@
+"""
+Long-running lookup service (``rosreestr2coord serve``).
+
+One process keeps the HTTP connections, the proxy pool with its scores and the
+response cache warm across lookups. The JSON API is served over TCP or a unix socket:
+
+    GET /area?code=38:06:144003:4723[&type=1][&crs=EPSG:3857][&refresh=1]
+        {"code": ..., "status": "ok", "area_type": 1, "feature": {...}, "error": null}
+        with HTTP 200, 404 when nothing is found, 400 for an unknown type or CRS, 502 when the lookup failed
+    GET /health     uptime, number of lookups and connection statistics
+    GET /metrics    request metrics in the Prometheus text format
+
+Concurrent lookups of the same code (and type, CRS) are coalesced into one.
+"""
+import os
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Hashable, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from . import jsonlib
+from .crs import validate_crs
+from .metrics import get_metrics
+from .parser import STATUS_NO_COORD, STATUS_OK, TYPES, Area
+from .request.base_adapter import RequestAdapter
+from .request.retry import CircuitBreaker, RetryPolicy
+from .request.urlib_adapter import UrllibAdapter
+from .utils import clear_code
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+LOOKUPS = "service_lookups_total"
+
+HTTP_STATUSES = {STATUS_OK: 200, STATUS_NO_COORD: 404}
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time.
+
+    Callers arriving while the call for their key is in flight wait for it and get
+    the same result (or exception) instead of starting another one.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], object]) -> Tuple[object, bool]:
+        """Result of ``fn`` and whether it was shared with a call already in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result(), True
+        try:
+            result = fn()
+        except BaseException as er:
+            call.set_exception(er)
+            raise
+        else:
+            call.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result, False
+
+
+class LookupService:
+    """
+    Area lookups sharing one adapter, retry policy (with its circuit breaker), proxy pool and cache.
+
+    ``area_options`` are passed to every :class:`Area` (e.g. ``media_path``, ``coord_out``,
+    ``with_proxy``, ``use_cache``).
+    """
+
+    def __init__(
+        self, adapter: Optional[RequestAdapter] = None, retry_policy: Optional[RetryPolicy] = None, **area_options
+    ):
+        self.adapter = adapter or UrllibAdapter()
+        self.retry_policy = retry_policy or RetryPolicy(breaker=CircuitBreaker())
+        self.area_options = area_options
+        self.flight = SingleFlight()
+        self.started = time.time()
+
+    def lookup(
+        self, code: str, area_type: Optional[int] = None, crs: Optional[str] = None, refresh: bool = False
+    ) -> dict:
+        """Result of the lookup as a JSON-serializable dict, see the module docstring."""
+        options = dict(self.area_options, adapter=self.adapter, retry_policy=self.retry_policy, with_log=False)
+        if crs:
+            options["coord_out"] = crs
+        if refresh:
+            options["use_cache"] = False
+        key = (clear_code(code), area_type, options.get("coord_out"), refresh)
+        result, shared = self.flight.do(key, lambda: self._lookup(code, area_type, options))
+        get_metrics().inc(LOOKUPS, coalesced=shared)
+        return result
+
+    @staticmethod
+    def _lookup(code: str, area_type: Optional[int], options: dict) -> dict:
+        area = Area(code, area_type=area_type, **options)
+        return {
+            "code": code,
+            "status": area.status,
+            "area_type": area.area_type,
+            "feature": area.feature,
+            "error": str(area.exception) if area.exception else None,
+        }
+
+    def health(self) -> dict:
+        snapshot = get_metrics().snapshot()
+        return {
+            "status": "ok",
+            "uptime": round(time.time() - self.started, 1),
+            "lookups": snapshot.counter(LOOKUPS, coalesced=False),
+            "coalesced": snapshot.counter(LOOKUPS, coalesced=True),
+            "connections": self.adapter.stats(),
+        }
+
+    def close(self) -> None:
+        self.adapter.close()
+
+
+def _parse_area_type(value: Optional[str]) -> Optional[int]:
+    """Area type of the query, None (or 0) to detect it by the code."""
+    if not value or value == "0":
+        return None
+    area_type = int(value)
+    if area_type not in TYPES.values():
+        raise ValueError(f"Unknown area type {area_type}")
+    return area_type
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, avoid the delayed ACK stall
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(parts.query).items()}
+        service = self.server.service
+        if parts.path == "/area":
+            code = query.get("code", "").strip()
+            crs = query.get("crs")
+            try:
+                area_type = _parse_area_type(query.get("type"))
+                if crs:
+                    crs = validate_crs(crs)
+            except ValueError as er:
+                self.reply_json(400, {"error": str(er)})
+                return
+            if not code:
+                self.reply_json(400, {"error": "The code is not set"})
+                return
+            result = service.lookup(code, area_type, crs, query.get("refresh") in ("1", "true"))
+            self.reply_json(HTTP_STATUSES.get(result["status"], 502), result)
+        elif parts.path == "/health":
+            self.reply_json(200, service.health())
+        elif parts.path == "/metrics":
+            self.reply(200, get_metrics().snapshot().to_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self.reply_json(404, {"error": f"Unknown path {parts.path}"})
+
+    def reply_json(self, status: int, data: dict) -> None:
+        self.reply(status, jsonlib.dumps_bytes(data), "application/json")
+
+    def reply(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.service_logger(format % args)
+
+
+class UnixLookupHandler(LookupHandler):
+    # TCP_NODELAY does not apply to unix sockets
+    disable_nagle_algorithm = False
+
+
+class LookupServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service: LookupService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.service = service
+        self.service_logger = _quiet
+        super().__init__((host, port), LookupHandler)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class UnixLookupServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, service: LookupService, path: str):
+        self.service = service
+        self.service_logger = _quiet
+        if os.path.exists(path):
+            # Left by a previous run that did not shut down cleanly
+            os.unlink(path)
+        super().__init__(path, UnixLookupHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def _quiet(message: str) -> None:
+    pass
+
+
+def create_server(
+    service: LookupService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix_socket: Optional[str] = None
+) -> socketserver.BaseServer:
+    """HTTP server of the service on ``host:port``, or on a unix socket if ``unix_socket`` is given."""
+    if unix_socket:
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix sockets are not supported on this platform")
+        return UnixLookupServer(service, unix_socket)
+    return LookupServer(service, host, port)
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix_socket: Optional[str] = None, **service_options):
+    """Run the lookup service until interrupted (Ctrl+C)."""
+    service = LookupService(**service_options)
+    server = create_server(service, host, port, unix_socket)
+    server.service_logger = print
+    where = unix_socket or server.url
+    print(f"Serving area lookups on {where} (GET /area?code=..., /health, /metrics), press Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
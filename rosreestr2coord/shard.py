@@ -0,0 +1,201 @@
+"""
+Batches split into shards run by separate processes or machines, and the merge of their outputs.
+
+A code belongs to the shard ``crc32(clear_code(code)) % count``, so every process given
+the same list and ``--shard i/N`` takes its own part of it, with no coordination and
+whatever the order of the lines. Variants of one code fall into the same shard and are
+still requested once.
+
+Shard ``i`` of ``N`` writes its outputs, journal and list of codes without coordinates
+under the name ``<file_name>.part-i-of-N``, and takes its own subset of the proxy list.
+:func:`merge_shards` then appends the stored features of the parts to the final outputs
+without decoding them; the merged features are grouped by shard.
+"""
+import multiprocessing
+import os
+import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, List, Optional, Sequence
+
+from .batch import batch_parser, clean_codes
+from .export import DEFAULT_BATCH_FORMATS, get_batch_writer, make_output, output_path
+from .journal import BatchJournal
+from .metrics import MetricsSink, MetricsSnapshot, get_metrics
+from .request.base_adapter import RequestAdapter
+from .request.proxy_handling import ProxyHandling
+from .request.proxy_pool import ProxyPool, get_proxy_pool
+from .utils import clear_code
+
+
+class Shard:
+    """Shard ``index`` (from 1) of ``count``."""
+
+    def __init__(self, index: int, count: int):
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"Invalid shard {index}/{count}, expected 1 <= i <= N")
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, spec: str) -> "Shard":
+        """Shard of an ``i/N`` string, e.g. ``2/4``."""
+        try:
+            index, count = (int(part) for part in spec.split("/"))
+        except ValueError:
+            raise ValueError(f"Invalid shard {spec!r}, expected i/N, e.g. 2/4") from None
+        return cls(index, count)
+
+    def contains(self, key: str) -> bool:
+        return zlib.crc32(key.encode("utf-8")) % self.count == self.index - 1
+
+    def contains_code(self, code: str) -> bool:
+        return self.contains(clear_code(code))
+
+    @property
+    def suffix(self) -> str:
+        return f"part-{self.index}-of-{self.count}"
+
+    def file_name(self, file_name: str) -> str:
+        """Name of the outputs of the shard."""
+        return f"{file_name}.{self.suffix}"
+
+    def proxy_pool(self, media_path: Optional[str] = None) -> ProxyPool:
+        """Pool of the proxies of the shard from the list ``Area`` uses by default (under ``media_path``)."""
+        tmp_path = os.path.join(media_path or os.getcwd(), "tmp")
+        os.makedirs(tmp_path, exist_ok=True)
+        return get_proxy_pool(ShardProxyHandling(ProxyHandling(path=os.path.join(tmp_path, "proxy.txt")), self))
+
+    def __eq__(self, other):
+        return isinstance(other, Shard) and (self.index, self.count) == (other.index, other.count)
+
+    def __repr__(self):
+        return f"Shard({self.index}/{self.count})"
+
+
+def shards(count: int) -> List[Shard]:
+    return [Shard(index, count) for index in range(1, count + 1)]
+
+
+class ShardProxyHandling(ProxyHandling):
+    """
+    Proxies of the shared list that fall into a shard, so shards running at once do not share proxies.
+
+    The list is still read (and downloaded when it is old) through ``source``, the
+    surviving proxies of the shard are written to a file of its own next to it.
+    """
+
+    def __init__(self, source: ProxyHandling, shard: Shard):
+        root, ext = os.path.splitext(source.path)
+        super().__init__(path=f"{root}.{shard.suffix}{ext}", user_agent=source.user_agent)
+        self.source = source
+        self.shard = shard
+
+    def load_proxies(self):
+        return [proxy for proxy in self.source.load_proxies() if self.shard.contains(proxy.strip())]
+
+    def get_proxies(self):
+        return [proxy for proxy in self.source.get_proxies() if self.shard.contains(proxy.strip())]
+
+
+def _concat(paths: Iterable[str], path: str, skip_lines: int = 0) -> None:
+    """Write the files one after another to ``path``, skipping the first lines of all but the first one."""
+    with open(path, "wb") as out:
+        for i, part in enumerate(paths):
+            with open(part, "rb") as f:
+                for _ in range(skip_lines if i else 0):
+                    f.readline()
+                shutil.copyfileobj(f, out)
+
+
+def merge_shards(
+    output: str,
+    file_name: str,
+    count: int,
+    formats: Sequence[str] = DEFAULT_BATCH_FORMATS,
+    crs_name: str = "EPSG:4326",
+) -> List[str]:
+    """
+    Merge the outputs of the ``count`` shards of the batch ``file_name`` into its final outputs.
+
+    The journals and the lists of codes without coordinates are merged too, so the merged
+    batch can be resumed as a whole. The parts are kept. Return the paths of the outputs.
+    """
+    names = [shard.file_name(file_name) for shard in shards(count)]
+    paths = []
+    checkpoints = {}
+    for file_format in formats:
+        writer_class = get_batch_writer(file_format)
+        parts = [output_path(output, name, writer_class.file_format, writer_class.out_path) for name in names]
+        missing = [part for part in parts if not os.path.exists(part)]
+        if missing:
+            raise FileNotFoundError(f"Shard outputs are missing: {', '.join(missing)}")
+        with writer_class(output, file_name, crs_name=crs_name) as writer:
+            writer.merge(parts)
+            writer.flush()
+            checkpoints[writer.file_format] = writer.checkpoint()
+        print(f"Merged {len(parts)} shards: {writer.path}")
+        paths.append(writer.path)
+
+    journals = [os.path.join(output, f"{name}.journal.jsonl") for name in names]
+    journal_path = os.path.join(output, f"{file_name}.journal.jsonl")
+    _concat([p for p in journals if os.path.exists(p)], journal_path)
+    # The checkpoints of the parts don't apply to the merged outputs
+    with BatchJournal(journal_path, resume=True) as journal:
+        journal.record_outputs(checkpoints)
+    no_coord = [output_path(output, f"{name}_no_coord", "csv") for name in names]
+    no_coord = [p for p in no_coord if os.path.exists(p)]
+    if no_coord:
+        _concat(no_coord, make_output(output, f"{file_name}_no_coord", "csv"), skip_lines=1)
+    return paths
+
+
+def _run_shard(
+    codes: List[str],
+    shard: Shard,
+    adapter_factory: Optional[Callable[[], RequestAdapter]],
+    options: dict,
+) -> MetricsSnapshot:
+    if adapter_factory is not None:
+        options["adapter"] = adapter_factory()
+    before = get_metrics().snapshot()
+    batch_parser(codes, shard=shard, **options)
+    # The process may have run another shard before
+    return get_metrics().snapshot() - before
+
+
+def run_shards(
+    codes: Iterable[str],
+    count: int,
+    processes: Optional[int] = None,
+    file_name: str = "example",
+    output: str = os.path.join("output"),
+    formats: Sequence[str] = DEFAULT_BATCH_FORMATS,
+    adapter_factory: Optional[Callable[[], RequestAdapter]] = None,
+    metrics_sinks: Optional[Sequence[MetricsSink]] = None,
+    **batch_options,
+) -> List[str]:
+    """
+    Run the batch as ``count`` shards in local processes (at most ``processes`` at a time), then merge them.
+
+    ``batch_options`` are passed to :func:`batch_parser` of every shard and must be picklable;
+    adapters are not, so every process creates its own with ``adapter_factory``. ``delay``
+    and ``rate`` apply to every shard. The metrics of all shards are summed for ``metrics_sinks``.
+    Return the paths of the merged outputs.
+    """
+    codes = clean_codes(codes)
+    options = dict(batch_options, file_name=file_name, output=output, formats=formats)
+    # Spawned rather than forked: the parent may already run threads (pools, connections)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes or count, mp_context=context) as executor:
+        futures = [
+            executor.submit(_run_shard, [c for c in codes if shard.contains_code(c)], shard, adapter_factory, options)
+            for shard in shards(count)
+        ]
+        snapshots = [future.result() for future in futures]
+
+    if metrics_sinks:
+        snapshot = sum(snapshots[1:], snapshots[0])
+        for sink in metrics_sinks:
+            sink.emit(snapshot)
+    return merge_shards(output, file_name, count, formats, batch_options.get("coord_out", "EPSG:4326"))
@@ -0,0 +1,205 @@
+import math
+import os
+import threading
+from array import array
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from . import jsonlib
+from .cache import ResponseCache
+from .crs import WGS84, detect_crs, normalize_crs, reproject
+from .utils import GEOMETRY_DEPTH, _collect_rings
+
+DEFAULT_NODE_SIZE = 16
+INDEX_FILE_NAME = "spatial_index.json"
+INDEX_VERSION = 1
+
+Bounds = Tuple[float, float, float, float]
+
+
+def feature_bounds(feature: dict) -> Optional[Bounds]:
+    """``(minx, miny, maxx, maxy)`` of the feature geometry, None if it has no coordinates."""
+    rings = _feature_rings(feature)
+    xs = [p[0] for ring in rings for p in ring]
+    if not xs:
+        return None
+    ys = [p[1] for ring in rings for p in ring]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _feature_rings(feature: dict) -> List[list]:
+    geom = feature.get("geometry") or {}
+    depth = GEOMETRY_DEPTH.get(geom.get("type"))
+    coords = geom.get("coordinates")
+    if depth is None or not coords:
+        return []
+    if depth == 0:
+        return [[coords]]
+    rings: List[list] = []
+    _collect_rings(coords, depth, rings)
+    return rings
+
+
+def _polygons(geom: dict) -> List[list]:
+    if geom.get("type") == "Polygon":
+        return [geom.get("coordinates") or []]
+    if geom.get("type") == "MultiPolygon":
+        return geom.get("coordinates") or []
+    return []
+
+
+def contains_point(feature: dict, x: float, y: float) -> bool:
+    """Whether a (multi)polygon feature contains the point (even-odd rule, so holes are excluded)."""
+    for polygon in _polygons(feature.get("geometry") or {}):
+        inside = False
+        for ring in polygon:
+            for i in range(len(ring) - 1):
+                (x1, y1), (x2, y2) = ring[i][:2], ring[i + 1][:2]
+                if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                    inside = not inside
+        if inside:
+            return True
+    return False
+
+
+def _intersects(boxes: array, i: int, minx: float, miny: float, maxx: float, maxy: float) -> bool:
+    j = 4 * i
+    return boxes[j] <= maxx and boxes[j + 1] <= maxy and boxes[j + 2] >= minx and boxes[j + 3] >= miny
+
+
+def _union(boxes: List[Bounds]) -> Bounds:
+    return (
+        min(b[0] for b in boxes),
+        min(b[1] for b in boxes),
+        max(b[2] for b in boxes),
+        max(b[3] for b in boxes),
+    )
+
+
+def _flat(boxes: List[Bounds]) -> array:
+    return array("d", (v for box in boxes for v in box))
+
+
+def _str_pack(boxes: List[Bounds], node_size: int) -> List[int]:
+    """Order of ``boxes`` after Sort-Tile-Recursive: vertical slices by x, then runs of ``node_size`` by y."""
+    if not boxes:
+        return []
+    nodes = math.ceil(len(boxes) / node_size)
+    slice_size = node_size * math.ceil(math.sqrt(nodes))
+    by_x = sorted(range(len(boxes)), key=lambda i: boxes[i][0] + boxes[i][2])
+    order = []
+    for start in range(0, len(by_x), slice_size):
+        order.extend(sorted(by_x[start : start + slice_size], key=lambda i: boxes[i][1] + boxes[i][3]))
+    return order
+
+
+class SpatialIndex:
+    """
+    Static R-tree over GeoJSON features, the leaves are packed with Sort-Tile-Recursive.
+
+    Levels are kept as flat ``array('d')`` of bounds, leaves first; node ``i`` of a level
+    covers the children ``i * node_size`` to ``(i + 1) * node_size - 1`` of the level
+    below, and the leaves are the features themselves, in the packed order.
+    Features without coordinates are not indexed.
+    """
+
+    def __init__(self, features: Iterable[dict], node_size: int = DEFAULT_NODE_SIZE, crs: str = WGS84):
+        self.node_size = node_size
+        self.crs = normalize_crs(crs)
+        indexed = [(f, b) for f, b in ((f, feature_bounds(f)) for f in features) if b is not None]
+        order = _str_pack([b for _, b in indexed], node_size)
+        self.features: List[dict] = [indexed[i][0] for i in order]
+        boxes = [indexed[i][1] for i in order]
+        self.levels: List[array] = [_flat(boxes)]
+        while len(boxes) > 1:
+            boxes = [_union(boxes[i : i + node_size]) for i in range(0, len(boxes), node_size)]
+            self.levels.append(_flat(boxes))
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def _search(self, minx: float, miny: float, maxx: float, maxy: float) -> Iterator[int]:
+        if not self.features:
+            return
+        stack = [(len(self.levels) - 1, 0)]
+        while stack:
+            level, i = stack.pop()
+            if not _intersects(self.levels[level], i, minx, miny, maxx, maxy):
+                continue
+            if level == 0:
+                yield i
+                continue
+            children = len(self.levels[level - 1]) // 4
+            start = i * self.node_size
+            stack.extend((level - 1, j) for j in range(min(start + self.node_size, children) - 1, start - 1, -1))
+
+    def query_bbox(self, minx: float, miny: float, maxx: float, maxy: float) -> List[dict]:
+        """Features whose bounds intersect the box."""
+        return [self.features[i] for i in self._search(minx, miny, maxx, maxy)]
+
+    def query_point(self, x: float, y: float) -> List[dict]:
+        """(Multi)polygon features that contain the point, e.g. ``query_point(lon, lat)``."""
+        return [self.features[i] for i in self._search(x, y, x, y) if contains_point(self.features[i], x, y)]
+
+    @classmethod
+    def from_cache(cls, cache: ResponseCache, crs: str = WGS84, **kwargs) -> "SpatialIndex":
+        """Index of the features of all cached responses, reprojected to ``crs``; duplicates are kept once."""
+        seen = set()
+        features = []
+        for resp in cache.responses():
+            for feature in (resp.get("data") or {}).get("features") or []:
+                props = feature.get("properties") or {}
+                key = (props.get("options") or {}).get("cad_num") or props.get("label")
+                if key is not None:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                features.append(reproject(feature, detect_crs(feature, resp), crs))
+        return cls(features, crs=crs, **kwargs)
+
+    def save(self, path: str) -> None:
+        data = {
+            "version": INDEX_VERSION,
+            "crs": self.crs,
+            "node_size": self.node_size,
+            "levels": [level.tolist() for level in self.levels],
+            "features": self.features,
+        }
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(jsonlib.dumps_bytes(data))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SpatialIndex":
+        with open(path, "rb") as f:
+            data = jsonlib.loads(f.read())
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported spatial index version: {data.get('version')}")
+        index = cls.__new__(cls)
+        index.crs = data["crs"]
+        index.node_size = data["node_size"]
+        index.levels = [array("d", level) for level in data["levels"]]
+        index.features = data["features"]
+        return index
+
+
+def get_spatial_index(cache: ResponseCache, crs: str = WGS84, rebuild: bool = False) -> SpatialIndex:
+    """
+    Index of the cache, stored next to its entries as ``spatial_index.json``.
+
+    The stored index is reused while no entry has been added or removed since it was
+    saved, otherwise it is built again from the cache and saved.
+    """
+    path = os.path.join(cache.path, INDEX_FILE_NAME)
+    if not rebuild:
+        try:
+            if os.path.getmtime(path) >= cache.last_modified():
+                index = SpatialIndex.load(path)
+                if index.crs == normalize_crs(crs):
+                    return index
+        except (OSError, ValueError, KeyError):
+            pass
+    index = SpatialIndex.from_cache(cache, crs=crs)
+    os.makedirs(cache.path, exist_ok=True)
+    index.save(path)
+    return index
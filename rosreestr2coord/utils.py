@@ -1,14 +1,52 @@
 import math
 import re
-from typing import List
+from itertools import chain
+from typing import Callable, Iterator, List, Optional
+
+_np = False  # not imported yet
+
+EARTH_RADIUS = 6378137.0
+DEG = math.pi / 180.0
+# Below this number of vertices numpy call overhead outweighs the vectorization gain
+NUMPY_MIN_VERTICES = 256
+
+
+def _numpy():
+    """numpy, imported on first use as it takes tens of milliseconds; None if it is not installed."""
+    global _np
+    if _np is False:
+        try:
+            import numpy
+        except ImportError:  # numpy is optional, the pure-Python path is used instead
+            numpy = None
+        _np = numpy
+    return _np
+
+
+def __getattr__(name: str):
+    # ``np`` stays importable from this module without importing numpy with it
+    if name == "np":
+        return _numpy()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Nesting level of coordinate lists whose items are points
+GEOMETRY_DEPTH = {
+    "Point": 0,
+    "MultiPoint": 1,
+    "LineString": 1,
+    "MultiLineString": 2,
+    "Polygon": 2,
+    "MultiPolygon": 3,
+}
 
 
 def y2lat(y: float) -> float:
-    return (2 * math.atan(math.exp(y / 6378137)) - math.pi / 2) / (math.pi / 180)
+    return (2 * math.atan(math.exp(y / EARTH_RADIUS)) - math.pi / 2) / DEG
 
 
 def x2lon(x: float) -> float:
-    return x / (math.pi / 180.0) / 6378137.0
+    return x / DEG / EARTH_RADIUS
 
 
 def xy2lonlat(x: float, y: float) -> List[float]:
@@ -19,18 +57,108 @@ def code_to_filename(code: str) -> str:
     return code.replace(":", "_").replace("/", "-")
 
 
-def transform_to_wgs(geojson: dict) -> dict:
-    def process_coords(coords):
-        return [xy2lonlat(x, y) for x, y in coords]
+def _rings_to_wgs_python(rings: List[list]) -> List[List[List[float]]]:
+    atan, exp, half_pi = math.atan, math.exp, math.pi / 2
+    return [
+        [[p[0] / DEG / EARTH_RADIUS, (2 * atan(exp(p[1] / EARTH_RADIUS)) - half_pi) / DEG] for p in ring]
+        for ring in rings
+    ]
+
+
+def _rings_to_wgs_numpy(rings: List[list]) -> List[List[List[float]]]:
+    np = _numpy()
+    count = sum(len(ring) for ring in rings)
+    points = np.fromiter(chain.from_iterable(chain.from_iterable(rings)), dtype=float, count=count * 2).reshape(-1, 2)
+    lonlat = np.empty_like(points)
+    lonlat[:, 0] = points[:, 0] / DEG / EARTH_RADIUS
+    lonlat[:, 1] = (2 * np.arctan(np.exp(points[:, 1] / EARTH_RADIUS)) - math.pi / 2) / DEG
+    flat = lonlat.tolist()
+    result = []
+    start = 0
+    for ring in rings:
+        result.append(flat[start : start + len(ring)])
+        start += len(ring)
+    return result
+
+
+def rings_to_wgs(rings: List[list], use_numpy: Optional[bool] = None) -> List[List[List[float]]]:
+    """
+    Transform lists of Web-Mercator points to WGS84 in one batch.
+
+    ``use_numpy=None`` picks the numpy path when it is installed and the rings
+    hold at least ``NUMPY_MIN_VERTICES`` points.
+    """
+    if use_numpy is None:
+        use_numpy = sum(len(ring) for ring in rings) >= NUMPY_MIN_VERTICES and _numpy() is not None
+    if not rings:
+        return []
+    if use_numpy:
+        if _numpy() is None:
+            raise ImportError("numpy is not installed")
+        return _rings_to_wgs_numpy([[p[:2] for p in ring] for ring in rings] if _has_z(rings) else rings)
+    return _rings_to_wgs_python(rings)
+
+
+def _has_z(rings: List[list]) -> bool:
+    # GeoJSON positions of one geometry share their dimension, so the first one is enough
+    return any(len(ring[0]) != 2 for ring in rings if ring)
 
-    result = geojson.copy()
-    geom = result["geometry"]
 
-    if geom["type"] == "Polygon":
-        geom["coordinates"] = [process_coords(ring) for ring in geom["coordinates"]]
-    elif geom["type"] == "MultiPolygon":
-        geom["coordinates"] = [[process_coords(ring) for ring in poly] for poly in geom["coordinates"]]
+def _collect_rings(coords: list, depth: int, rings: List[list]) -> None:
+    if depth == 1:
+        rings.append(coords)
+    else:
+        for part in coords:
+            _collect_rings(part, depth - 1, rings)
 
+
+def _replace_rings(coords: list, depth: int, rings: Iterator[list]) -> list:
+    if depth == 1:
+        return next(rings)
+    return [_replace_rings(part, depth - 1, rings) for part in coords]
+
+
+def transform_geometry(geom: dict, transform_rings: Callable[[List[list]], List[list]]) -> dict:
+    """Replace the coordinates of a GeoJSON geometry in place with ``transform_rings`` applied to all its rings."""
+    geom_type = geom.get("type")
+    if geom_type == "GeometryCollection":
+        for part in geom.get("geometries", []):
+            transform_geometry(part, transform_rings)
+        return geom
+    depth = GEOMETRY_DEPTH.get(geom_type)
+    coords = geom.get("coordinates")
+    if depth is None or not coords:
+        return geom
+    if depth == 0:
+        geom["coordinates"] = transform_rings([[coords]])[0][0]
+        return geom
+    rings: List[list] = []
+    _collect_rings(coords, depth, rings)
+    geom["coordinates"] = _replace_rings(coords, depth, iter(transform_rings(rings)))
+    return geom
+
+
+def first_position(geom: dict) -> Optional[list]:
+    if geom.get("type") == "GeometryCollection":
+        for part in geom.get("geometries", []):
+            position = first_position(part)
+            if position:
+                return position
+        return None
+    coords = geom.get("coordinates")
+    while isinstance(coords, list) and coords and isinstance(coords[0], list):
+        coords = coords[0]
+    return coords or None
+
+
+def transform_geometry_to_wgs(geom: dict, use_numpy: Optional[bool] = None) -> dict:
+    """Transform the coordinates of a GeoJSON geometry from EPSG:3857 to EPSG:4326 in place."""
+    return transform_geometry(geom, lambda rings: rings_to_wgs(rings, use_numpy))
+
+
+def transform_to_wgs(geojson: dict, use_numpy: Optional[bool] = None) -> dict:
+    result = geojson.copy()
+    transform_geometry_to_wgs(result["geometry"], use_numpy)
     return result
 
 
@@ -52,3 +180,49 @@ def clear_code(code: str) -> str:
                 parts.append("0")
         return ":".join(parts)
     return code
+
+
+# thematicSearchId values, named by parser.TYPES
+AREA_TYPE_OBJECT = 1
+AREA_TYPE_DIVISION = 2
+AREA_TYPE_ADMINISTRATIVE = 4
+AREA_TYPE_ZONE = 5
+AREA_TYPE_TERRITORIAL_ZONE = 7
+AREA_TYPE_COMPLEX = 15
+ALL_AREA_TYPES = (
+    AREA_TYPE_OBJECT,
+    AREA_TYPE_DIVISION,
+    AREA_TYPE_ZONE,
+    AREA_TYPE_TERRITORIAL_ZONE,
+    AREA_TYPE_COMPLEX,
+    AREA_TYPE_ADMINISTRATIVE,
+)
+
+
+def guess_area_types(code: str) -> List[int]:
+    """
+    Likely area types of a code, most probable first.
+
+    ``38:06:144003:4723`` is a real estate object (or a complex), ``38:06:144003``,
+    ``38:06`` and ``38`` are cadastral division units, ``38:06-6.123`` is a zone
+    registry number. Codes of an unknown shape get every type.
+    """
+    code = clear_code(code.strip())
+    zone = re.match(r"^\d+:\d+-(\d+)\.\d+", code)
+    if zone:
+        if zone.group(1) == "7":
+            return [AREA_TYPE_TERRITORIAL_ZONE, AREA_TYPE_ZONE]
+        return [AREA_TYPE_ZONE, AREA_TYPE_TERRITORIAL_ZONE]
+    if re.match(r"^\d+(:\d+){3}$", code):
+        return [AREA_TYPE_OBJECT, AREA_TYPE_COMPLEX]
+    if re.match(r"^\d+(:\d+){0,2}$", code):
+        return [AREA_TYPE_DIVISION]
+    return list(ALL_AREA_TYPES)
+
+
+def quarter_of(code: str) -> Optional[str]:
+    """Cadastral quarter of a parcel code (``38:06:144003:4723`` >> ``38:06:144003``), None for other codes."""
+    code = code.strip()
+    if re.match(r"^\d+(:\d+){3}$", code):
+        return code.rsplit(":", 1)[0]
+    return None
@@ -1,11 +1,32 @@
+import copy
+
 import pytest
 
 import rosreestr2coord.parser
 
+from .mock_server import MockNspdServer
 
-@pytest.fixture(scope="module")
-def area():
-    return rosreestr2coord.parser.Area("38:06:144003:4723")
+
+def square(x, y, size=1.0, hole=False):
+    """Rings of a square polygon (counterclockwise), with a hole in the middle if ``hole``."""
+    rings = [[[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]]
+    if hole:
+        d = size / 4
+        rings.append([[x + d, y + d], [x + 3 * d, y + d], [x + 3 * d, y + 3 * d], [x + d, y + 3 * d], [x + d, y + d]])
+    return rings
+
+
+# 1 km in EPSG:3857 near Irkutsk
+MERCATOR_SQUARE = square(11647000.0, 6843000.0, 1000.0)
+
+
+def make_feature(code=None, coordinates=MERCATOR_SQUARE, geometry_type="Polygon"):
+    """Feature labelled with ``code`` as nspd returns them, without geometry if ``coordinates`` is None."""
+    return {
+        "type": "Feature",
+        "properties": {"label": code, "options": {"cad_num": code}} if code else {},
+        "geometry": {"type": geometry_type, "coordinates": copy.deepcopy(coordinates)} if coordinates else None,
+    }
 
 
 @pytest.fixture(scope="module")
@@ -24,7 +45,15 @@ def area_coords():
     return _coords
 
 
-@pytest.fixture(scope="module")
-def area_geometry(area_coords):
-    _geom = '"geometry": {"type": "MultiPolygon", "coordinates": ' f"{area_coords}" "}"
-    return _geom
+@pytest.fixture
+def nspd_server():
+    with MockNspdServer() as server:
+        yield server
+
+
+@pytest.fixture
+def area(tmp_path, nspd_server):
+    """The recorded parcel, served by the mock server."""
+    return rosreestr2coord.parser.Area(
+        "38:06:144003:4723", area_type=1, media_path=str(tmp_path), base_url=nspd_server.url
+    )
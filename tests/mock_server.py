@@ -0,0 +1,193 @@
+"""
+Local stand-in for the nspd search API, used by the tests and the benchmarks.
+
+Replays the responses recorded in ``tests/responses`` for
+``/api/geoportal/v2/search/geoportal`` and, for other codes, clones the first of
+them with the code replaced and the geometry shifted, so any list of codes can be
+served. Latency, random errors and bursts of 403 can be configured::
+
+    with MockNspdServer(latency=0.05, error_rate=0.1) as server:
+        area = Area("38:06:144003:4723", base_url=server.url)
+"""
+import copy
+import glob
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+RESPONSES_PATH = os.path.join(os.path.dirname(__file__), "responses")
+SEARCH_PATH = "/api/geoportal/v2/search/geoportal"
+
+
+def load_responses(path=RESPONSES_PATH):
+    """Recorded responses by the code of their first feature."""
+    responses = {}
+    for file_path in sorted(glob.glob(os.path.join(path, "*.json"))):
+        with open(file_path, encoding="utf-8") as f:
+            data = json.load(f)
+        features = data["data"]["features"]
+        responses[features[0]["properties"]["label"]] = data
+    return responses
+
+
+def _shift(coords, dx, dy):
+    if coords and isinstance(coords[0], (int, float)):
+        return [coords[0] + dx, coords[1] + dy, *coords[2:]]
+    return [_shift(c, dx, dy) for c in coords]
+
+
+def synthesize_response(template, code):
+    """Copy of a recorded response for another code, moved by up to a few kilometres."""
+    data = copy.deepcopy(template)
+    feature = data["data"]["features"][0]
+    props = feature["properties"]
+    props["label"] = props["descr"] = code
+    props.setdefault("options", {})["cad_num"] = code
+    seed = zlib.crc32(code.encode("utf-8"))
+    geom = feature["geometry"]
+    geom["coordinates"] = _shift(geom["coordinates"], seed % 5000, (seed >> 16) % 5000)
+    return data
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, avoid the delayed ACK stall
+    disable_nagle_algorithm = True
+    timeout = 5
+
+    def do_GET(self):
+        self.server.mock.handle(self)
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, data=None, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8") if data is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockNspdServer:
+    """
+    Threaded HTTP server answering like the nspd search API.
+
+    ``latency`` is a delay in seconds or a ``(min, max)`` range. A request fails with
+    ``error_status`` with probability ``error_rate``; with ``forbidden_every`` set, every
+    ``forbidden_every`` requests the following ``forbidden_burst`` ones get a 403 (with
+    ``Retry-After: retry_after`` when given). Codes without a recorded response are
+    synthesized, or not found if ``synthesize`` is False (as are codes in ``missing``).
+    """
+
+    def __init__(
+        self,
+        responses=None,
+        synthesize=True,
+        missing=(),
+        latency=0.0,
+        error_rate=0.0,
+        error_status=503,
+        forbidden_every=0,
+        forbidden_burst=0,
+        retry_after=None,
+        seed=0,
+    ):
+        self.responses = load_responses() if responses is None else responses
+        self.template = next(iter(self.responses.values()), None)
+        self.synthesize = synthesize
+        self.missing = set(missing)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.forbidden_every = forbidden_every
+        self.forbidden_burst = forbidden_burst
+        self.retry_after = retry_after
+        self.statuses = Counter()
+        self.log = []
+        self._count = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}{SEARCH_PATH}"
+
+    @property
+    def requests(self):
+        return sum(self.statuses.values())
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def response_for(self, code):
+        if code in self.missing:
+            return None
+        if code in self.responses:
+            return self.responses[code]
+        if self.synthesize and self.template is not None:
+            return synthesize_response(self.template, code)
+        return None
+
+    def _outcome(self):
+        """Status to answer with (None for a normal response) and the latency to simulate."""
+        with self._lock:
+            number = self._count
+            self._count += 1
+            latency = self.latency
+            if isinstance(latency, tuple):
+                latency = self._rng.uniform(*latency)
+            if self.forbidden_every and number % self.forbidden_every >= self.forbidden_every - self.forbidden_burst:
+                return 403, latency
+            if self.error_rate and self._rng.random() < self.error_rate:
+                return self.error_status, latency
+            return None, latency
+
+    def handle(self, request):
+        parts = urlsplit(request.path)
+        query = parse_qs(parts.query)
+        code = (query.get("query") or [""])[0]
+        status, latency = self._outcome()
+        if latency:
+            time.sleep(latency)
+        if parts.path != SEARCH_PATH:
+            status = 404
+        headers = {"Retry-After": str(self.retry_after)} if status == 403 and self.retry_after is not None else None
+        data = None
+        if status is None:
+            status = 200
+            data = self.response_for(code) or {"data": {"type": "FeatureCollection", "features": []}}
+        with self._lock:
+            self.statuses[status] += 1
+            self.log.append((code, status))
+        request.reply(status, data, headers)
@@ -2,35 +2,96 @@ import json
 
 import pytest
 
+from rosreestr2coord.parser import STATUS_ERROR, STATUS_OK, STATUS_PENDING, Area
+from rosreestr2coord.request.exceptions import RequestException
 
-def test_multipolygon_with_holes(area, area_coords):
-    _coords = area.xy
-    assert len(_coords[0][0]) == 4
-    assert _coords[0][0][0] == area_coords[0][0][0]
+from .conftest import make_feature
 
 
-def test_to_geojson(area):
-    _json = area.to_geojson()
+def test_polygon_coordinates(area, area_coords):
+    geometry = area.to_geojson(dumps=False)["geometry"]
+    assert geometry["type"] == "Polygon"
+    ring = geometry["coordinates"][0]
+    assert len(ring) == len(area_coords[0][0])
+    assert ring[0] == pytest.approx(area_coords[0][0][0], abs=1e-6)
+
+
+def test_to_geojson(area, area_coords):
+    _json = json.loads(area.to_geojson())
 
     # Проверяем, что в Area есть все необходимые атрибуты
-    assert all(
-        [k in ('type', 'features', 'crs') for k in [*json.loads(_json).keys()]])
+    assert {"type", "geometry", "properties"} <= set(_json)
+    assert _json["type"] == "Feature"
+    assert _json["properties"]["options"]["cad_num"] == "38:06:144003:4723"
 
-    # Проверяем, что геометрия в Area содержит точку Point
-    assert '{"type": "Point", "coordinates": ' \
-           '[104.63528551235628, 52.26652631032228]}' in _json
+    # Проверяем, что геометрия в Area пересчитана в WGS 84
+    assert _json["geometry"]["crs"]["properties"]["name"] == "EPSG:4326"
+    assert _json["geometry"]["coordinates"][0][3] == pytest.approx(area_coords[0][0][3], abs=1e-6)
 
 
-def test_to_geojson_poly(area, area_geometry):
-    _poly = area.to_geojson_poly()
+def test_to_geojson_poly(area):
+    with pytest.deprecated_call():
+        _poly = area.to_geojson_poly()
 
-    # Проверяем, что в Area есть все необходимые атрибуты
-    assert all(
-        [k in ('type', 'properties', 'geometry', 'crs')
-         for k in [*json.loads(_poly).keys()]])
+    # Проверяем, что устаревший метод возвращает тот же объект
+    assert _poly == area.to_geojson()
+
+
+class OfflineArea(Area):
+    requests = 0
+
+    def make_request(self, url, method="GET", body=None):
+        OfflineArea.requests += 1
+        if "query=0:0:0:0" in url:
+            raise RequestException("boom")
+        return {"data": {"features": [make_feature("38:06:144003:4723")]}}
+
+
+def test_lazy_area_does_no_io(tmp_path):
+    OfflineArea.requests = 0
+    area = OfflineArea("38:06:144003:4723", area_type=1, media_path=str(tmp_path), lazy=True, use_cache=False)
+    assert area.status == STATUS_PENDING
+    assert OfflineArea.requests == 0
+    assert not (tmp_path / "tmp").exists()
+
+    assert json.loads(area.to_geojson())["properties"]["label"] == "38:06:144003:4723"
+    assert area.status == STATUS_OK
+    area.to_geojson()
+    assert OfflineArea.requests == 1
+
+
+def test_lazy_area_reports_errors(tmp_path):
+    area = OfflineArea("0:0:0:0", area_type=1, media_path=str(tmp_path), lazy=True, with_log=False)
+    assert area.feature is None
+    assert area.status == STATUS_ERROR
+    assert isinstance(area.exception, RequestException)
+    # The outcome does not shadow the logging method
+    area.error("logged")
+
+    with pytest.raises(RequestException):
+        OfflineArea("0:0:0:0", area_type=1, media_path=str(tmp_path), lazy=True, with_log=False).load(True)
+
+
+class ComplexOnlyArea(Area):
+    def make_request(self, url, method="GET", body=None):
+        if "thematicSearchId=15" in url:
+            return {"data": {"features": [make_feature(self.code)]}}
+        return {"data": {"features": []}}
+
+
+def test_area_type_is_detected(tmp_path):
+    area = ComplexOnlyArea("38:06:144003:4723", media_path=str(tmp_path), use_cache=False)
+    assert area.status == STATUS_OK
+    assert area.area_type == 15
+
+    missing = ComplexOnlyArea("38:06:144003", media_path=str(tmp_path), use_cache=False)
+    assert missing.feature is None
+    assert missing.area_type is None
 
-    # Проверяем, что геометрия в Area содержит точку Point
-    assert area_geometry in _poly
 
-# area.get_coord() # [[[area1_xy], [hole1_xy], [hole2_xy]], [[area2_xyl]]]
-# area.get_attrs()
+def test_compact_area(tmp_path):
+    area = OfflineArea("38:06:144003:4723", area_type=1, media_path=str(tmp_path), use_cache=False, compact=True)
+    plain = OfflineArea("38:06:144003:4723", area_type=1, media_path=str(tmp_path), use_cache=False)
+    assert area.to_geojson() == plain.to_geojson()
+    assert area.to_kml() is not None
+    assert not hasattr(Area(lazy=True), "__dict__")
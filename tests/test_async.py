@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from rosreestr2coord.async_parser import AsyncArea, fetch_many
+from rosreestr2coord.request.base_adapter import AsyncRequestAdapter, RequestAdapter
+
+from .conftest import make_feature
+
+
+def fake_response(url):
+    code = url.split("query=")[1].split("&")[0]
+    return {"data": {"features": [make_feature(code)]}}
+
+
+class FakeAdapter(RequestAdapter):
+    def __init__(self):
+        self.urls = []
+
+    def _make_request(self, url, proxy, timeout, headers, method="GET", body=None):
+        self.urls.append(url)
+        return fake_response(url)
+
+    def get_specific_http_error(self):
+        return OSError
+
+    def is_specific_error(self, er):
+        return False
+
+
+class FakeAsyncAdapter(AsyncRequestAdapter):
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _make_request(self, url, proxy, timeout, headers, method="GET", body=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return fake_response(url)
+
+    def get_specific_http_error(self):
+        return OSError
+
+    def is_specific_error(self, er):
+        return False
+
+
+def test_async_area_does_no_io_on_init(tmp_path):
+    adapter = FakeAdapter()
+    area = AsyncArea("38:06:144003:4723", area_type=1, media_path=str(tmp_path), adapter=adapter)
+    assert area.feature is None
+    assert adapter.urls == []
+
+
+def test_async_area_fetch_with_sync_adapter(tmp_path):
+    adapter = FakeAdapter()
+    area = asyncio.run(
+        AsyncArea.fetch("38:06:144003:4723", 1, media_path=str(tmp_path), adapter=adapter, use_cache=False)
+    )
+    assert len(adapter.urls) == 1
+    assert area.feature["properties"]["label"] == "38:06:144003:4723"
+    # Same post-processing as Area: coordinates are transformed to WGS84
+    assert area.feature["geometry"]["coordinates"][0][1][0] == pytest.approx(104.63, abs=0.01)
+
+
+def test_fetch_many_bounds_concurrency(tmp_path):
+    adapter = FakeAsyncAdapter()
+    codes = [f"38:06:144003:{i}" for i in range(1, 21)]
+
+    async def collect():
+        return [
+            area
+            async for area in fetch_many(
+                codes, area_type=1, concurrency=5, media_path=str(tmp_path), adapter=adapter, use_cache=False
+            )
+        ]
+
+    areas = asyncio.run(collect())
+    assert sorted(area.code for area in areas) == sorted(codes)
+    assert all(area.feature for area in areas)
+    assert adapter.max_in_flight == 5
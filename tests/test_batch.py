@@ -0,0 +1,293 @@
+import json
+import logging
+import os
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import rosreestr2coord.parser
+from rosreestr2coord.batch import batch_parser
+from rosreestr2coord.request.exceptions import RequestException
+from rosreestr2coord.request.rate_limit import RateLimiter, TokenBucket
+
+from .conftest import MERCATOR_SQUARE, make_feature
+
+
+@pytest.fixture
+def fake_request(monkeypatch):
+    requested = []
+
+    def make_request(url, **kwargs):
+        code = parse_qs(urlparse(url).query)["query"][0]
+        requested.append(code)
+        if code.endswith(":0"):
+            return {"data": {"features": []}}
+        return {"data": {"features": [make_feature(code)]}}
+
+    monkeypatch.setattr(rosreestr2coord.parser, "make_request", make_request)
+    return requested
+
+
+def read_features(output, file_name):
+    with open(os.path.join(output, "geojson", f"{file_name}.geojson"), encoding="utf-8") as f:
+        return json.load(f)["features"]
+
+
+@pytest.mark.parametrize("workers,ordered", [(1, True), (4, True), (4, False)])
+def test_batch_parser(tmp_path, fake_request, workers, ordered):
+    codes = [f"38:06:144003:{i}\n" for i in range(20)]
+    output = str(tmp_path / "output")
+    batch_parser(
+        codes,
+        output=output,
+        file_name="list",
+        delay=0,
+        workers=workers,
+        ordered=ordered,
+        area_type=1,
+        media_path=str(tmp_path),
+    )
+    features = read_features(output, "list")
+    labels = [f["properties"]["label"] for f in features]
+    expected = [c.strip() for c in codes if not c.strip().endswith(":0")]
+    assert sorted(labels) == sorted(expected)
+    if ordered:
+        assert labels == expected
+
+
+def test_token_bucket_paces_requests():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_rate_limiter_keeps_separate_proxy_buckets():
+    limiter = RateLimiter(per_proxy_rate=1)
+    start = time.monotonic()
+    for proxy in ("a:1", "b:2", "c:3", None):
+        limiter.acquire(proxy)
+    assert time.monotonic() - start < 0.5
+
+
+def test_batch_parser_streams_outputs(tmp_path, fake_request):
+    codes = ["38:06:144003:1", "38:06:144003:0", "38:06:144003:2"]
+    output = str(tmp_path / "output")
+    areas = []
+    batch_parser(
+        codes,
+        output=output,
+        file_name="list",
+        delay=0,
+        formats=["geojson", "geojsonseq", "csv"],
+        areas=areas,
+        area_type=1,
+        media_path=str(tmp_path),
+    )
+    assert len(read_features(output, "list")) == 2
+    with open(os.path.join(output, "geojsonseq", "list.geojsonl"), encoding="utf-8") as f:
+        assert [json.loads(line)["properties"]["label"] for line in f] == ["38:06:144003:1", "38:06:144003:2"]
+    with open(os.path.join(output, "csv", "list.csv"), encoding="utf-8") as f:
+        rows = f.read().splitlines()
+    assert rows[0] == "longitude,latitude"
+    assert len(rows) == 1 + 2 * len(MERCATOR_SQUARE[0])
+    with open(os.path.join(output, "csv", "list_no_coord.csv"), encoding="utf-8") as f:
+        assert f.read().splitlines() == ["code", "38:06:144003:0"]
+    assert [a.code for a in areas] == codes
+
+
+def test_batch_parser_resume(tmp_path, fake_request):
+    output = str(tmp_path / "output")
+    options = dict(output=output, file_name="list", delay=0, area_type=1, media_path=str(tmp_path), use_cache=False)
+    batch_parser(["38:06:144003:1", "38:06:144003:0"], formats=["geojson", "geojsonseq"], **options)
+
+    # Simulate a crash in the middle of writing the next feature
+    path = os.path.join(output, "geojson", "list.geojson")
+    with open(path, "rb+") as f:
+        f.seek(-len(b"\n]}\n"), os.SEEK_END)
+        f.truncate()
+        f.write(b',\n{"type": "Feat')
+
+    fake_request.clear()
+    codes = ["38:06:144003:1", "38:06:144003:0", "38:06:144003:2"]
+    batch_parser(codes, formats=["geojson", "geojsonseq"], resume=True, **options)
+
+    assert fake_request == ["38:06:144003:2"]
+    assert [f["properties"]["label"] for f in read_features(output, "list")] == ["38:06:144003:1", "38:06:144003:2"]
+    with open(os.path.join(output, "geojsonseq", "list.geojsonl"), encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+    with open(os.path.join(output, "csv", "list_no_coord.csv"), encoding="utf-8") as f:
+        assert f.read().splitlines() == ["code", "38:06:144003:0"]
+
+
+def count_features(output, formats):
+    import sqlite3
+    import struct
+    import zipfile
+
+    from rosreestr2coord.formats.flatgeobuf import _table_field
+
+    counts = {}
+    for file_format in formats:
+        path = os.path.join(output, file_format, f"list.{file_format}")
+        if file_format == "geojson":
+            counts[file_format] = len(read_features(output, "list"))
+        elif file_format == "geojsonseq":
+            with open(os.path.join(output, file_format, "list.geojsonl"), encoding="utf-8") as f:
+                counts[file_format] = len([json.loads(line) for line in f])
+        elif file_format == "csv":
+            with open(path, encoding="utf-8") as f:
+                rows = f.read().splitlines()[1:]
+            assert all(len(row.split(",")) == 2 for row in rows)
+            counts[file_format] = len(rows) / len(MERCATOR_SQUARE[0])
+        elif file_format == "kml":
+            with open(path, encoding="utf-8") as f:
+                counts[file_format] = f.read().count("<Placemark>")
+        elif file_format == "kmz":
+            with zipfile.ZipFile(path) as kmz:
+                counts[file_format] = kmz.read("doc.kml").decode().count("<Placemark>")
+        elif file_format == "gpkg":
+            conn = sqlite3.connect(path)
+            counts[file_format] = conn.execute("SELECT count(*) FROM rtree_areas_geom").fetchone()[0]
+            conn.close()
+        elif file_format == "fgb":
+            with open(path, "rb") as f:
+                data = f.read()
+            header = data[12 : 12 + struct.unpack_from("<I", data, 8)[0]]
+            counts[file_format] = _table_field(header, struct.unpack_from("<I", header)[0], 8, "<Q", 0)
+        elif file_format == "shp":
+            counts[file_format] = (os.path.getsize(os.path.join(output, "shp", "list.shx")) - 100) // 8
+    return counts
+
+
+@pytest.mark.parametrize("killed", [False, True])
+def test_batch_parser_resume_drops_unjournaled_features(tmp_path, fake_request, monkeypatch, killed):
+    from rosreestr2coord.export import BatchWriter, get_batch_writer
+    from rosreestr2coord.journal import BatchJournal
+
+    formats = ["geojson", "geojsonseq", "csv", "kml", "kmz", "gpkg", "fgb", "shp"]
+    output = str(tmp_path / "output")
+    options = dict(output=output, file_name="list", delay=0, area_type=1, media_path=str(tmp_path), use_cache=False)
+    record = BatchJournal.record
+
+    def record_until_crash(journal, code, status, outputs=None):
+        if code == "38:06:144003:2" and outputs:
+            raise KeyboardInterrupt
+        record(journal, code, status, outputs)
+
+    with monkeypatch.context() as m:
+        m.setattr(BatchJournal, "record", record_until_crash)
+        if killed:
+            # Nothing is finished or rolled back
+            m.setattr(BatchWriter, "rollback", lambda writer, checkpoint: None)
+            for file_format in formats:
+                m.setattr(get_batch_writer(file_format), "close", BatchWriter.release)
+        with pytest.raises(KeyboardInterrupt):
+            batch_parser(["38:06:144003:1", "38:06:144003:2"], formats=formats, **options)
+    if killed:
+        # A row torn by the crash
+        with open(os.path.join(output, "csv", "list.csv"), "a", encoding="utf-8") as f:
+            f.write("104.0,5")
+
+    fake_request.clear()
+    codes = ["38:06:144003:1", "38:06:144003:2", "38:06:144003:3"]
+    batch_parser(codes, formats=formats, resume=True, **options)
+    assert fake_request == codes[1:]
+    assert count_features(output, formats) == dict.fromkeys(formats, 3)
+    assert [f["properties"]["label"] for f in read_features(output, "list")] == codes
+
+
+def test_batch_parser_deduplicates_codes(tmp_path, fake_request):
+    codes = ["38:06:144003:1", "38:06:0144003:01", "38:06:144003:2", "38:06:144003:1"]
+    output = str(tmp_path / "output")
+    areas = []
+    batch_parser(codes, output=output, file_name="list", delay=0, areas=areas, area_type=1, media_path=str(tmp_path))
+    assert fake_request == ["38:06:144003:1", "38:06:144003:2"]
+    assert len(read_features(output, "list")) == 4
+    assert len(areas) == 4
+
+
+def test_batch_parser_prefetches_quarters(tmp_path, monkeypatch):
+    requested = []
+    batch_logger = logging.getLogger("batch")
+
+    def make_request(url, **kwargs):
+        code = parse_qs(urlparse(url).query)["query"][0]
+        requested.append(code)
+        assert kwargs["logger"] is batch_logger
+        if code == "38:06:144003":
+            return {"data": {"features": [make_feature(f"38:06:144003:{i}") for i in range(1, 4)]}}
+        return {"data": {"features": [make_feature(code)]}}
+
+    monkeypatch.setattr(rosreestr2coord.parser, "make_request", make_request)
+    codes = ["38:06:144003:1", "38:06:144003:2", "38:06:144003:3", "38:06:144003:5", "38:06:144004:1"]
+    output = str(tmp_path / "output")
+    options = dict(delay=0, prefetch=True, area_type=1, media_path=str(tmp_path), logger=batch_logger)
+    batch_parser(codes, output=output, file_name="list", **options)
+    assert requested == ["38:06:144003", "38:06:144003:5", "38:06:144004:1"]
+    assert [f["properties"]["label"] for f in read_features(output, "list")] == codes
+
+
+def test_batch_parser_requeues_failed_codes(tmp_path, monkeypatch):
+    requested = []
+
+    def make_request(url, **kwargs):
+        code = parse_qs(urlparse(url).query)["query"][0]
+        requested.append(code)
+        if code == "38:06:144003:1" and requested.count(code) == 1:
+            error = RequestException("HTTP 503")
+            error.transient = True
+            raise error
+        return {"data": {"features": [make_feature(code)]}}
+
+    monkeypatch.setattr(rosreestr2coord.parser, "make_request", make_request)
+    codes = ["38:06:144003:1", "38:06:144003:2", "38:06:144003:3"]
+    output = str(tmp_path / "output")
+    batch_parser(codes, output=output, file_name="list", delay=0, repeat=1, area_type=1, media_path=str(tmp_path))
+    # The failed code is retried after a delay, the fresh codes are not held back
+    assert requested[:3] == codes
+    assert requested[3:] == ["38:06:144003:1"]
+    assert sorted(f["properties"]["label"] for f in read_features(output, "list")) == codes
+
+
+def test_batch_parser_writes_kml_and_kmz(tmp_path, fake_request):
+    import xml.etree.ElementTree as ET
+    import zipfile
+
+    ns = {"kml": "http://www.opengis.net/kml/2.2"}
+    output = str(tmp_path / "output")
+    options = dict(output=output, file_name="list", delay=0, area_type=1, media_path=str(tmp_path), use_cache=False)
+    batch_parser(["38:06:144003:1", "38:06:144003:0"], formats=["kml", "kmz"], **options)
+    batch_parser(["38:06:144003:1", "38:06:144003:2"], formats=["kml", "kmz"], resume=True, **options)
+
+    kml = ET.parse(os.path.join(output, "kml", "list.kml")).getroot()
+    with zipfile.ZipFile(os.path.join(output, "kmz", "list.kmz")) as kmz:
+        doc = ET.fromstring(kmz.read("doc.kml"))
+    for root in (kml, doc):
+        names = [el.text for el in root.findall("kml:Document/kml:Placemark/kml:name", ns)]
+        assert names == ["38:06:144003:1", "38:06:144003:2"]
+        ring = root.find(".//kml:outerBoundaryIs/kml:LinearRing/kml:coordinates", ns).text
+        assert len(ring.split()) == len(MERCATOR_SQUARE[0])
+
+
+def test_kmz_keeps_flushed_placemarks_of_interrupted_run(tmp_path):
+    import zipfile
+
+    from rosreestr2coord.export import KMZStreamWriter
+
+    output = str(tmp_path / "output")
+    writer = KMZStreamWriter(output, "list")
+    writer.write(make_feature("38:06:144003:1"))
+    writer.flush()
+    # Killed before close: the archive is not written yet
+    writer._file.close()
+    assert not os.path.exists(writer.path)
+
+    with KMZStreamWriter(output, "list", append=True) as writer:
+        writer.write(make_feature("38:06:144003:2"))
+    assert not os.path.exists(writer.spool_path)
+    with zipfile.ZipFile(writer.path) as kmz:
+        doc = kmz.read("doc.kml").decode()
+    assert doc.count("<Placemark>") == 2 and doc.endswith("</Document></kml>\n")
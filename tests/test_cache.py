@@ -0,0 +1,68 @@
+import os
+import time
+
+from rosreestr2coord.cache import ResponseCache, make_cache_key
+from rosreestr2coord.parser import Area
+
+RESPONSE = {
+    "data": {
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"label": "38:06:144003:4723"},
+                "geometry": {"type": "Polygon", "coordinates": [[[0, 0], [10, 0], [10, 10], [0, 0]]]},
+            }
+        ]
+    }
+}
+
+
+class CountingArea(Area):
+    calls = 0
+
+    def make_request(self, url, method="GET", body=None):
+        CountingArea.calls += 1
+        return {"data": {"features": [dict(f, geometry=dict(f["geometry"])) for f in RESPONSE["data"]["features"]]}}
+
+
+def test_cache_key_normalizes_code():
+    assert make_cache_key(1, "38:06:0144003:4723", "EPSG:4326") == make_cache_key(1, " 38:6:144003:4723", "epsg:4326")
+    assert make_cache_key(1, "38:06:144003:4723", "EPSG:4326") != make_cache_key(2, "38:06:144003:4723", "EPSG:4326")
+
+
+def test_ttl_expires_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    cache.put("abcdef", RESPONSE)
+    assert cache.get("abcdef") == RESPONSE
+
+    path = cache._entry_path("abcdef")
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert cache.get("abcdef") is None
+    assert not os.path.exists(path)
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size=1000)
+    payload = {"data": "x" * 300}
+    cache.put("aa0", payload)
+    cache.put("aa1", payload)
+    old = time.time() - 100
+    os.utime(cache._entry_path("aa0"), (old, old))
+    cache.get("aa1")
+    cache.put("aa2", payload)
+    cache.put("aa3", payload)
+
+    assert cache.get("aa0") is None
+    assert cache.get("aa3") == payload
+
+
+def test_area_uses_cache(tmp_path):
+    CountingArea.calls = 0
+    first = CountingArea("38:06:144003:4723", area_type=1, media_path=str(tmp_path), with_log=False)
+    second = CountingArea("38:06:144003:4723", area_type=1, media_path=str(tmp_path), with_log=False)
+    assert CountingArea.calls == 1
+    assert first.feature == second.feature
+
+    CountingArea("38:06:144003:4723", area_type=1, media_path=str(tmp_path), with_log=False, use_cache=False)
+    assert CountingArea.calls == 2
@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+
+from rosreestr2coord.batch import batch_parser
+from rosreestr2coord.parser import STATUS_ERROR, STATUS_OK, Area
+from rosreestr2coord.request.proxy_handling import ProxyHandling
+from rosreestr2coord.request.proxy_pool import ProxyPool
+from rosreestr2coord.request.retry import RetryPolicy
+
+from .mock_server import SEARCH_PATH, MockNspdServer
+
+
+def test_area_from_mock_server(tmp_path, nspd_server, area_coords):
+    area = Area("38:06:144003:4723", area_type=1, media_path=str(tmp_path), base_url=nspd_server.url)
+    assert area.status == STATUS_OK
+    ring = area.feature["geometry"]["coordinates"][0]
+    for (x, y), (lon, lat) in zip(ring, area_coords[0][0]):
+        assert x == pytest.approx(lon, abs=1e-6) and y == pytest.approx(lat, abs=1e-6)
+
+    # The response is cached, the second area makes no request
+    Area("38:6:144003:4723", area_type=1, media_path=str(tmp_path), base_url=nspd_server.url)
+    assert nspd_server.requests == 1
+
+
+def test_mock_server_errors(tmp_path):
+    with MockNspdServer(forbidden_every=2, forbidden_burst=1, retry_after=7) as server:
+        options = dict(area_type=1, media_path=str(tmp_path), use_cache=False, base_url=server.url, with_log=False)
+        assert Area("38:06:144003:1", **options).status == STATUS_OK
+        area = Area("38:06:144003:2", **options)
+    assert area.status == STATUS_ERROR
+    assert area.exception.retry_after == 7
+    assert server.statuses == {200: 1, 403: 1}
+
+
+def test_batch_against_flaky_server(tmp_path):
+    codes = [f"38:06:144003:{i}" for i in range(1, 31)]
+    output = str(tmp_path / "output")
+    with MockNspdServer(latency=(0, 0.01), error_rate=0.2, missing=["38:06:144003:30"], seed=3) as server:
+        batch_parser(
+            codes,
+            output=output,
+            file_name="list",
+            delay=0,
+            workers=4,
+            area_type=1,
+            media_path=str(tmp_path),
+            base_url=server.url,
+            retry_policy=RetryPolicy(tries=10, base_delay=0.001, jitter=False),
+            with_log=False,
+        )
+    assert server.statuses[503] > 0
+    with open(os.path.join(output, "geojson", "list.geojson"), encoding="utf-8") as f:
+        labels = [feature["properties"]["label"] for feature in json.load(f)["features"]]
+    assert labels == codes[:-1]
+
+
+def test_batch_does_not_requeue_permanent_errors(tmp_path):
+    output = str(tmp_path / "output")
+    with MockNspdServer(error_rate=1, error_status=400) as server:
+        batch_parser(
+            ["38:06:144003:1"],
+            output=output,
+            file_name="list",
+            delay=0,
+            repeat=2,
+            area_type=1,
+            media_path=str(tmp_path),
+            base_url=server.url,
+            with_log=False,
+        )
+    assert server.statuses == {400: 1}
+
+
+def test_batch_checks_proxies_first(tmp_path, nspd_server):
+    # The mock server answers proxied requests too
+    proxy = nspd_server.url[len("http://") : -len(SEARCH_PATH)]
+    handler = ProxyHandling(path=str(tmp_path / "proxy.txt"))
+    handler.dump_proxies([f"{proxy}\n", "127.0.0.1:9\n"])
+    pool = ProxyPool(handler, max_failures=1)
+    output = str(tmp_path / "output")
+    batch_parser(
+        ["38:06:144003:1", "38:06:144003:2"],
+        output=output,
+        file_name="list",
+        delay=0,
+        area_type=1,
+        media_path=str(tmp_path),
+        base_url=f"http://nspd.invalid{SEARCH_PATH}",
+        with_proxy=True,
+        proxy_handler=pool,
+        check_proxies=True,
+        with_log=False,
+    )
+    # The dead proxy failed the check and was never tried by the batch
+    assert pool.proxies() == [proxy]
+    assert [code for code, _ in nspd_server.log] == ["38:06:144003:1"] * 2 + ["38:06:144003:2"]
+    with open(os.path.join(output, "geojson", "list.geojson"), encoding="utf-8") as f:
+        assert len(json.load(f)["features"]) == 2
@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import struct
+
+import pytest
+
+from rosreestr2coord.export import open_batch_writers
+from rosreestr2coord.formats.flatgeobuf import MAGIC, NODE_ITEM, FlatGeobufWriter, _table_field, level_bounds
+from rosreestr2coord.formats.shapefile import _signed_area
+
+from .conftest import make_feature, square
+
+
+def parcel(i, geometry=True):
+    """Parcel ``i`` of a diagonal row of small squares."""
+    return make_feature(f"38:06:144003:{i}", square(104 + i * 0.01, 52 + i * 0.01, 0.005) if geometry else None)
+
+
+def write(output, formats, features, append=False):
+    writers = open_batch_writers(output, "list", formats, append=append)
+    for feature in features:
+        for writer in writers:
+            writer.write(feature)
+            writer.flush()
+    for writer in writers:
+        writer.close()
+
+
+def test_geopackage(tmp_path):
+    output = str(tmp_path)
+    write(output, ["gpkg"], [parcel(0), parcel(1, geometry=False)])
+    write(output, ["gpkg"], [parcel(2)], append=True)
+
+    path = os.path.join(output, "gpkg", "list.gpkg")
+    assert not os.path.exists(path + "-wal")
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA application_id").fetchone()[0] == 0x47504B47
+    assert [r[0] for r in conn.execute("SELECT label FROM areas ORDER BY fid")] == [
+        "38:06:144003:0",
+        "38:06:144003:1",
+        "38:06:144003:2",
+    ]
+    hits = conn.execute("SELECT id FROM rtree_areas_geom WHERE maxx >= 104.021 AND minx <= 104.022").fetchall()
+    assert hits == [(3,)]
+    # Exact, not rounded to the float32 of the R-tree
+    extent = conn.execute("SELECT min_x, min_y, max_x, max_y FROM gpkg_contents").fetchone()
+    assert extent == pytest.approx((104.0, 52.0, 104.025, 52.025), abs=1e-12)
+
+
+def test_flatgeobuf(tmp_path):
+    output = str(tmp_path)
+    write(output, ["fgb"], [parcel(i) for i in range(20)])
+    write(output, ["fgb"], [parcel(i) for i in range(20, 30)], append=True)
+
+    path = os.path.join(output, "fgb", "list.fgb")
+    assert not os.path.exists(path + ".part")
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data[:8] == MAGIC
+    (header_size,) = struct.unpack_from("<I", data, 8)
+    header = data[12 : 12 + header_size]
+    root = struct.unpack_from("<I", header)[0]
+    assert _table_field(header, root, 8, "<Q", 0) == 30
+    assert _table_field(header, root, 2, "<B", 0) == 3  # Polygon
+
+    nodes = level_bounds(30)[0][1]
+    index = 12 + header_size
+    minx, miny, maxx, maxy, _ = NODE_ITEM.unpack_from(data, index)
+    assert (minx, miny) == (104.0, 52.0)
+    assert (round(maxx, 3), round(maxy, 3)) == (104.295, 52.295)
+
+    # Every leaf points to a size-prefixed feature inside the features section
+    features = index + nodes * NODE_ITEM.size
+    sizes = []
+    for i in range(nodes - 30, nodes):
+        *_, offset = NODE_ITEM.unpack_from(data, index + i * NODE_ITEM.size)
+        sizes.append(4 + struct.unpack_from("<I", data, features + offset)[0])
+    assert features + sum(sizes) == len(data)
+
+
+def test_flatgeobuf_survives_crash_while_continued(tmp_path, monkeypatch):
+    output = str(tmp_path)
+    write(output, ["fgb"], [parcel(i) for i in range(3)])
+
+    def torn_copy(writer, path, spool):
+        spool.write(b"torn")
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(FlatGeobufWriter, "_spool_file", torn_copy)
+        with pytest.raises(KeyboardInterrupt):
+            write(output, ["fgb"], [parcel(3)], append=True)
+    path = os.path.join(output, "fgb", "list.fgb")
+    assert not os.path.exists(path + ".part")
+
+    write(output, ["fgb"], [parcel(3)], append=True)
+    with open(path, "rb") as f:
+        data = f.read()
+    header = data[12 : 12 + struct.unpack_from("<I", data, 8)[0]]
+    assert _table_field(header, struct.unpack_from("<I", header)[0], 8, "<Q", 0) == 4
+
+
+@pytest.mark.parametrize("file_format", ["fgb", "gpkg", "shp"])
+def test_read_by_gdal(tmp_path, file_format):
+    pyogrio = pytest.importorskip("pyogrio")
+    output = str(tmp_path)
+    write(output, [file_format], [parcel(i) for i in range(20)])
+    write(output, [file_format], [parcel(i) for i in range(20, 30)], append=True)
+
+    path = os.path.join(output, file_format, f"list.{file_format}")
+    info = pyogrio.read_info(path)
+    assert info["features"] == 30 and info["crs"] == "EPSG:4326"
+    assert list(info["fields"][:2]) == ["cad_num", "label"]
+    assert info["total_bounds"] == pytest.approx((104.0, 52.0, 104.295, 52.295), abs=1e-4)
+    # Read through the spatial index where the format has one
+    _, _, geometries, fields = pyogrio.raw.read(path, bbox=(104.2, 52.2, 104.215, 52.215))
+    assert sorted(fields[1]) == ["38:06:144003:20", "38:06:144003:21"]
+    assert all(geometry is not None for geometry in geometries)
+
+
+def test_shapefile(tmp_path):
+    output = str(tmp_path)
+    write(output, ["shp"], [parcel(0), parcel(1, geometry=False), parcel(2)])
+
+    base = os.path.join(output, "shp", "list")
+    with open(base + ".shp", "rb") as f:
+        shp = f.read()
+    assert struct.unpack_from(">i", shp, 24)[0] * 2 == len(shp)
+    assert struct.unpack_from("<i", shp, 32)[0] == 5
+    # Outer rings are clockwise in shapefiles
+    num_points = struct.unpack_from("<i", shp, 100 + 8 + 40)[0]
+    xy = struct.unpack_from(f"<{2 * num_points}d", shp, 100 + 8 + 48)
+    assert _signed_area([xy[i : i + 2] for i in range(0, len(xy), 2)]) < 0
+    assert os.path.getsize(base + ".shx") == 100 + 3 * 8
+    with open(base + ".dbf", "rb") as f:
+        dbf = f.read()
+    assert struct.unpack_from("<I", dbf, 4)[0] == 3
+    assert dbf.endswith(b"\x1a")
+    with open(base + ".prj", encoding="ascii") as f:
+        assert f.read().startswith('GEOGCS["WGS 84"')
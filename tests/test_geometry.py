@@ -0,0 +1,46 @@
+import copy
+import json
+
+import pytest
+
+from rosreestr2coord.geometry import CompactFeature, CompactGeometry
+from rosreestr2coord.utils import np
+
+RING = [[104.6, 52.2], [104.7, 52.2], [104.7, 52.3], [104.6, 52.2]]
+
+
+@pytest.mark.parametrize(
+    "geom",
+    [
+        {"type": "Point", "coordinates": RING[0]},
+        {"type": "LineString", "coordinates": RING},
+        {"type": "Polygon", "coordinates": [RING, RING[:3]], "crs": {"type": "name", "properties": {"name": "x"}}},
+        {"type": "MultiPolygon", "coordinates": [[RING], [], [RING, RING]]},
+        {"type": "LineString", "coordinates": [[*p, 10.0] for p in RING]},
+    ],
+)
+def test_compact_geometry_round_trip(geom):
+    compact = CompactGeometry.from_geojson(copy.deepcopy(geom))
+    assert json.dumps(compact.to_geojson()) == json.dumps(geom)
+
+
+def test_compact_feature_keeps_members():
+    feature = {
+        "type": "Feature",
+        "id": 1,
+        "geometry": {"type": "Polygon", "coordinates": [RING * 50]},
+        "properties": {"label": "38:06:144003:4723"},
+    }
+    compact = CompactFeature.from_geojson(copy.deepcopy(feature))
+    assert json.dumps(compact.to_geojson()) == json.dumps(feature)
+    assert compact.geometry.nbytes < 20 * len(RING * 50)
+
+    collection = {"type": "GeometryCollection", "geometries": []}
+    assert CompactFeature.from_geojson({"geometry": collection}).geometry is collection
+
+
+@pytest.mark.skipif(np is None, reason="numpy is not installed")
+def test_compact_geometry_numpy_view():
+    compact = CompactGeometry.from_geojson({"type": "LineString", "coordinates": RING})
+    assert compact.as_numpy().shape == (4, 2)
+    assert compact.as_numpy()[1, 0] == 104.7
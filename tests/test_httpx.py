@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from rosreestr2coord.metrics import PHASE_SECONDS, get_metrics
+from rosreestr2coord.request.exceptions import RequestException
+from rosreestr2coord.request.request import create_adapter
+
+from .mock_server import SEARCH_PATH
+
+pytest.importorskip("httpx")
+
+CODE = "38:06:144003:4723"
+
+
+def search_url(base_url, code=CODE):
+    return f"{base_url}?thematicSearchId=1&query={code}"
+
+
+def labels(response):
+    return [feature["properties"]["label"] for feature in response["data"]["features"]]
+
+
+def test_httpx_adapter(nspd_server):
+    adapter = create_adapter("httpx")
+    before = get_metrics().snapshot()
+    assert labels(adapter.perform_request(search_url(nspd_server.url), None, None, 5)) == [CODE]
+    # Observed by the trace extension
+    period = get_metrics().snapshot() - before
+    assert {"connect", "ttfb", "download", "parse"} <= set(period.phases())
+    assert period.histogram(PHASE_SECONDS, phase="connect")["count"] == 1
+
+    # The mock server answers proxied requests too; every proxy gets a client of its own
+    proxy = nspd_server.url[: -len(SEARCH_PATH)]
+    response = adapter.perform_request(search_url(f"http://nspd.invalid{SEARCH_PATH}"), proxy, None, 5)
+    assert labels(response) == [CODE]
+    assert set(adapter._clients) == {"", proxy}
+
+    with pytest.raises(RequestException):
+        adapter.perform_request(nspd_server.url.replace("search", "missing"), None, None, 5)
+    clients = list(adapter._clients.values())
+    adapter.close()
+    assert adapter._clients == {} and all(client.is_closed for client in clients)
+
+
+def test_async_httpx_adapter(nspd_server):
+    adapter = create_adapter("httpx", is_async=True)
+    codes = [f"38:06:144003:{i}" for i in range(1, 6)]
+
+    async def run():
+        responses = await asyncio.gather(
+            *(adapter.perform_request(search_url(nspd_server.url, code), None, None, 5) for code in codes)
+        )
+        clients = list(adapter._clients.values())
+        await adapter.aclose()
+        return responses, clients
+
+    before = get_metrics().snapshot()
+    responses, clients = asyncio.run(run())
+    assert [labels(response) for response in responses] == [[code] for code in codes]
+    assert len(clients) == 1 and clients[0].is_closed and adapter._clients == {}
+    assert (get_metrics().snapshot() - before).histogram(PHASE_SECONDS, phase="ttfb")["count"] == len(codes)
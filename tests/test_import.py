@@ -0,0 +1,55 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generous on purpose: it catches a heavy import slipping into the console startup, it is not a benchmark
+IMPORT_BUDGET_MS = 250
+# Loaded on first use only
+LAZY_MODULES = (
+    "asyncio",
+    "httpx",
+    "importlib.metadata",
+    "numpy",
+    "pyproj",
+    "sqlite3",
+    "urllib.request",
+    "rosreestr2coord.async_parser",
+    "rosreestr2coord.formats",
+)
+
+
+def run_python(code, cwd, *options):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run(
+        [sys.executable, *options, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+
+
+def test_import_has_no_side_effects(tmp_path):
+    code = (
+        "import json, logging, sys\n"
+        "import rosreestr2coord, rosreestr2coord.console, rosreestr2coord.request.request as request\n"
+        "print(json.dumps({'modules': sorted(sys.modules), 'root_handlers': len(logging.getLogger().handlers),"
+        " 'shared': list(request._shared)}))\n"
+    )
+    result = json.loads(run_python(code, str(tmp_path)).stdout)
+    assert os.listdir(tmp_path) == []  # no debug.log
+    assert result["root_handlers"] == 0
+    assert result["shared"] == []
+    assert [m for m in LAZY_MODULES if m in result["modules"]] == []
+
+    # The lazy exports still work
+    code = "from rosreestr2coord import Area, AsyncArea, SpatialIndex; from rosreestr2coord.utils import np"
+    run_python(code, str(tmp_path))
+
+
+def test_console_import_time(tmp_path):
+    times = []
+    for _ in range(3):
+        stderr = run_python("import rosreestr2coord.console", str(tmp_path), "-X", "importtime").stderr
+        match = re.search(r"\|\s*(\d+) \| rosreestr2coord\.console$", stderr, re.MULTILINE)
+        times.append(int(match.group(1)) / 1000)
+    assert min(times) < IMPORT_BUDGET_MS
@@ -0,0 +1,36 @@
+import pytest
+
+from rosreestr2coord import jsonlib
+from rosreestr2coord.request.helpers import is_error_response
+
+FEATURE = {
+    "type": "Feature",
+    "properties": {"label": "Участок 1"},
+    "geometry": {"type": "Point", "coordinates": [1.5, 2]},
+}
+
+
+@pytest.fixture(params=jsonlib.BACKENDS)
+def backend(request):
+    try:
+        jsonlib.set_backend(request.param)
+    except ValueError:
+        pytest.skip(f"{request.param} is not installed")
+    yield request.param
+    jsonlib.set_backend()
+
+
+def test_round_trip(backend):
+    text = jsonlib.dumps(FEATURE)
+    assert "Участок" in text
+    assert ": " not in text
+    assert jsonlib.loads(text) == FEATURE
+    assert jsonlib.loads(jsonlib.dumps_bytes(FEATURE)) == FEATURE
+    assert jsonlib.loads(jsonlib.dumps(FEATURE, indent=True)) == FEATURE
+
+
+def test_is_error_response_works_on_parsed_data():
+    assert is_error_response("", {"error": {"message": "Not found"}}) == "Not found"
+    assert is_error_response("", b'{"error": {"code": 500}}') == "error"
+    assert is_error_response("", {"data": {"features": []}}) is False
+    assert is_error_response("", b"not json") is False
@@ -0,0 +1,61 @@
+import json
+import os
+
+from rosreestr2coord.batch import batch_parser
+from rosreestr2coord.metrics import (
+    AREAS,
+    PHASE_SECONDS,
+    REQUESTS,
+    JsonSummarySink,
+    Metrics,
+    PrometheusTextSink,
+    quantile,
+)
+
+
+def test_histogram_quantiles_and_snapshot_difference():
+    metrics = Metrics(buckets=(0.1, 0.2, 0.4))
+    metrics.observe("latency", 0.05)
+    before = metrics.snapshot()
+    for value in (0.15, 0.15, 0.3, 1.0):
+        metrics.observe("latency", value, phase="ttfb")
+    metrics.inc(REQUESTS, status="ok")
+
+    period = metrics.snapshot() - before
+    assert period.histogram("latency") is None
+    summary = period.histogram("latency", phase="ttfb")
+    assert summary["count"] == 4 and summary["mean"] == 0.4
+    assert summary["p50"] == 0.2
+    # The +Inf bucket is estimated with the last bound
+    assert quantile((0.1, 0.2, 0.4), [0, 0, 0, 1], 0.99) == 0.4
+
+    text = period.to_prometheus()
+    assert '# TYPE rosreestr2coord_latency histogram' in text
+    assert 'rosreestr2coord_latency_bucket{phase="ttfb",le="0.2"} 2' in text
+    assert 'rosreestr2coord_latency_bucket{phase="ttfb",le="+Inf"} 4' in text
+    assert 'rosreestr2coord_requests_total{status="ok"} 1' in text
+
+
+def test_batch_metrics_sinks(tmp_path, nspd_server):
+    codes = ["38:06:144003:4723", "38:06:144003:1"]
+    json_path = str(tmp_path / "metrics.json")
+    prom_path = str(tmp_path / "metrics.prom")
+    batch_parser(
+        codes,
+        output=str(tmp_path / "output"),
+        file_name="list",
+        delay=0,
+        area_type=1,
+        media_path=str(tmp_path),
+        base_url=nspd_server.url,
+        with_log=False,
+        metrics_sinks=[JsonSummarySink(json_path), PrometheusTextSink(prom_path)],
+    )
+    with open(json_path, encoding="utf-8") as f:
+        summary = json.load(f)
+    # Only the requests of this batch are reported
+    assert summary["counters"][f'{REQUESTS}{{status="ok"}}'] == 2
+    assert summary["counters"][f'{AREAS}{{status="ok"}}'] == 2
+    for phase in ("dns", "connect", "ttfb", "download", "parse", "transform", "export"):
+        assert f'{PHASE_SECONDS}{{phase="{phase}"}}' in summary["histograms"]
+    assert os.path.getsize(prom_path)
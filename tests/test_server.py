@@ -0,0 +1,94 @@
+import http.client
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from rosreestr2coord.server import LookupService, SingleFlight, create_server
+
+from .mock_server import MockNspdServer
+
+
+@pytest.fixture
+def running():
+    servers = []
+
+    def start(service, **kwargs):
+        server = create_server(service, port=0, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append((server, service))
+        return server
+
+    yield start
+    for server, service in servers:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+
+def get(conn, path):
+    conn.request("GET", path)
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_single_flight_shares_errors():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait()
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(flight.do, "key", fail)
+        started.wait()
+        follower = executor.submit(flight.do, "key", lambda: "not called")
+        time.sleep(0.1)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+    assert flight.do("key", lambda: 1) == (1, False)
+
+
+def test_concurrent_lookups_are_coalesced(tmp_path, running):
+    with MockNspdServer(latency=0.3) as nspd:
+        service = LookupService(media_path=str(tmp_path), base_url=nspd.url)
+        server = running(service)
+        host, port = server.server_address[:2]
+
+        def lookup(_):
+            return get(http.client.HTTPConnection(host, port), "/area?code=38:06:144003:4723&type=1")
+
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lookup, range(4)))
+        assert nspd.requests == 1
+        assert {status for status, _ in results} == {200}
+        assert results[0][1]["feature"]["properties"]["label"] == "38:06:144003:4723"
+
+        conn = http.client.HTTPConnection(host, port)
+        nspd.missing.add("38:06:144003:1")
+        assert get(conn, "/area?code=38:06:144003:1&type=1")[0] == 404
+        assert get(conn, "/area?code=38:06:144003:1&type=3")[0] == 400
+        status, result = get(conn, "/area?code=38:06:144003:4723&type=1&crs=EPSG:99999")
+        assert status == 400 and "EPSG:99999" in result["error"]
+        status, health = get(conn, "/health")
+        assert status == 200 and health["coalesced"] >= 3
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="unix sockets are not supported")
+def test_unix_socket(tmp_path, running, nspd_server):
+    path = str(tmp_path / "lookup.sock")
+    running(LookupService(media_path=str(tmp_path), base_url=nspd_server.url), unix_socket=path)
+
+    conn = http.client.HTTPConnection("localhost")
+    conn.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.sock.connect(path)
+    status, result = get(conn, "/area?code=38:06:144003:4723&type=1&crs=EPSG:3857")
+    assert status == 200 and result["status"] == "ok"
+    assert result["feature"]["geometry"]["coordinates"][0][0][0] > 180
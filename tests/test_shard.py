@@ -0,0 +1,87 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+from rosreestr2coord.batch import batch_parser
+from rosreestr2coord.metrics import REQUESTS, JsonSummarySink
+from rosreestr2coord.request.proxy_handling import ProxyHandling
+from rosreestr2coord.shard import Shard, ShardProxyHandling, merge_shards, run_shards, shards
+
+from .mock_server import MockNspdServer
+
+CODES = [f"38:06:144003:{i}" for i in range(1, 21)]
+
+
+def feature_codes(path):
+    with open(path, encoding="utf-8") as f:
+        return sorted(feature["properties"]["options"]["cad_num"] for feature in json.load(f)["features"])
+
+
+def test_partition_is_deterministic_and_complete(tmp_path):
+    assert Shard.parse("2/4") == Shard(2, 4)
+    for spec in ("0/4", "5/4", "2", "a/b"):
+        with pytest.raises(ValueError):
+            Shard.parse(spec)
+
+    parts = [[c for c in CODES if shard.contains_code(c)] for shard in shards(3)]
+    assert sorted(sum(parts, [])) == sorted(CODES)
+    assert all(parts)
+    # Variants of a code are requested by the same shard
+    assert Shard(1, 3).contains_code("38:06:144003:0007") == Shard(1, 3).contains_code("38:06:144003:7")
+
+    source = ProxyHandling(path=str(tmp_path / "proxy.txt"))
+    source.dump_proxies(f"10.0.0.{i}:3128\n" for i in range(30))
+    proxies = [ShardProxyHandling(source, shard).get_proxies() for shard in shards(3)]
+    assert sorted(sum(proxies, [])) == sorted(source.get_proxies())
+    assert ShardProxyHandling(source, Shard(2, 3)).path == str(tmp_path / "proxy.part-2-of-3.txt")
+
+
+def test_shards_merge_to_the_whole_batch(tmp_path):
+    output = str(tmp_path / "output")
+    formats = ["geojson", "geojsonseq", "csv", "kml", "gpkg"]
+    with MockNspdServer(missing=["38:06:144003:0"]) as server:
+        options = dict(delay=0, area_type=1, media_path=str(tmp_path), base_url=server.url, with_log=False)
+        for shard in shards(2):
+            codes = CODES + ["38:06:144003:0"]
+            batch_parser(codes, output=output, file_name="list", formats=formats, shard=shard, **options)
+    paths = merge_shards(output, "list", 2, formats)
+
+    assert feature_codes(paths[0]) == sorted(CODES)
+    with open(paths[1], encoding="utf-8") as f:
+        assert len(f.readlines()) == len(CODES)
+    with open(paths[3], encoding="utf-8") as f:
+        assert f.read().count("<Placemark>") == len(CODES)
+    conn = sqlite3.connect(paths[4])
+    assert conn.execute("SELECT count(*) FROM areas").fetchone()[0] == len(CODES)
+    assert conn.execute("SELECT count(*) FROM rtree_areas_geom").fetchone()[0] == len(CODES)
+    conn.close()
+    with open(os.path.join(output, "csv", "list_no_coord.csv"), encoding="utf-8") as f:
+        assert f.read().split() == ["code", "38:06:144003:0"]
+    with open(os.path.join(output, "list.journal.jsonl"), encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert len({record["code"] for record in records if "code" in record}) == len(CODES) + 1
+    # The merged outputs are checkpointed last, so the merged batch can be resumed
+    assert set(records[-1]["outputs"]) == {"geojson", "geojsonl", "csv", "kml", "gpkg"}
+
+
+def test_run_shards_in_processes(tmp_path, nspd_server):
+    output = str(tmp_path / "output")
+    metrics_path = str(tmp_path / "metrics.json")
+    paths = run_shards(
+        CODES,
+        2,
+        output=output,
+        file_name="list",
+        formats=["geojson"],
+        metrics_sinks=[JsonSummarySink(metrics_path)],
+        delay=0,
+        area_type=1,
+        media_path=str(tmp_path),
+        base_url=nspd_server.url,
+        with_log=False,
+    )
+    assert feature_codes(paths[0]) == sorted(CODES)
+    with open(metrics_path, encoding="utf-8") as f:
+        assert json.load(f)["counters"][f'{REQUESTS}{{status="ok"}}'] == len(CODES)
@@ -0,0 +1,65 @@
+import os
+import random
+
+from rosreestr2coord.cache import ResponseCache
+from rosreestr2coord.spatial_index import INDEX_FILE_NAME, SpatialIndex, get_spatial_index
+from rosreestr2coord.utils import xy2lonlat
+
+from .conftest import MERCATOR_SQUARE, make_feature, square
+
+
+def labels(features):
+    return sorted(f["properties"]["label"] for f in features)
+
+
+def test_queries_match_linear_scan():
+    rng = random.Random(1)
+    features = [
+        make_feature(f"1:1:1:{i}", square(rng.uniform(0, 100), rng.uniform(0, 100), rng.uniform(0.5, 3)))
+        for i in range(500)
+    ]
+    index = SpatialIndex(features, node_size=8)
+    assert len(index) == 500
+    for _ in range(20):
+        minx, miny = rng.uniform(0, 100), rng.uniform(0, 100)
+        maxx, maxy = minx + rng.uniform(0, 10), miny + rng.uniform(0, 10)
+        expected = [
+            f
+            for f in features
+            if f["geometry"]["coordinates"][0][0][0] <= maxx
+            and f["geometry"]["coordinates"][0][2][0] >= minx
+            and f["geometry"]["coordinates"][0][0][1] <= maxy
+            and f["geometry"]["coordinates"][0][2][1] >= miny
+        ]
+        assert labels(index.query_bbox(minx, miny, maxx, maxy)) == labels(expected)
+
+
+def test_query_point_excludes_holes():
+    index = SpatialIndex([make_feature("a", square(0, 0, 4, hole=True)), make_feature("b", square(3, 3, 4))])
+    assert labels(index.query_point(0.5, 0.5)) == ["a"]
+    assert labels(index.query_point(2, 2)) == []
+    assert labels(index.query_point(3.5, 3.5)) == ["a", "b"]
+    assert labels(index.query_point(10, 10)) == []
+    assert SpatialIndex([]).query_point(0, 0) == []
+
+
+def test_index_of_cache_is_persisted(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    # Web-Mercator response and a duplicate of the same parcel
+    mercator = make_feature("38:06:144003:1", MERCATOR_SQUARE)
+    cache.put("aa1", {"data": {"features": [mercator]}})
+    cache.put("aa2", {"data": {"features": [mercator, make_feature("38:06:144003:2", square(104.7, 52.1, 0.01))]}})
+
+    index = get_spatial_index(cache)
+    assert len(index) == 2
+    lon, lat = xy2lonlat(11647500.0, 6843500.0)
+    assert labels(index.query_point(lon, lat)) == ["38:06:144003:1"]
+    assert labels(index.query_bbox(104.0, 52.0, 105.0, 53.0)) == ["38:06:144003:1", "38:06:144003:2"]
+
+    path = os.path.join(str(tmp_path), INDEX_FILE_NAME)
+    assert os.path.exists(path)
+    assert labels(SpatialIndex.load(path).query_point(lon, lat)) == ["38:06:144003:1"]
+
+    cache.put("bb3", {"data": {"features": [make_feature("38:06:144003:3", square(104.9, 52.1, 0.01))]}})
+    os.utime(os.path.join(str(tmp_path), "bb"), (os.path.getmtime(path) + 1,) * 2)
+    assert len(get_spatial_index(cache)) == 3
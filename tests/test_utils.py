@@ -0,0 +1,94 @@
+import pytest
+
+from rosreestr2coord.crs import WEB_MERCATOR, WGS84, detect_crs, register_transformer, reproject, request_crs
+from rosreestr2coord.utils import guess_area_types, np, rings_to_wgs, transform_to_wgs, xy2lonlat
+
+from .conftest import make_feature
+
+RING = [[4187000.0, 7509000.0], [4188000.0, 7509000.0], [4188000.0, 7510000.0], [4187000.0, 7509000.0]]
+
+
+@pytest.mark.parametrize(
+    "geom_type,coordinates,depth",
+    [
+        ("Point", RING[0], 0),
+        ("LineString", RING, 1),
+        ("Polygon", [RING, RING], 2),
+        ("MultiPolygon", [[RING], [RING, RING]], 3),
+    ],
+)
+def test_transform_to_wgs_geometry_types(geom_type, coordinates, depth):
+    result = transform_to_wgs(make_feature(None, coordinates, geom_type), use_numpy=False)
+    coords = result["geometry"]["coordinates"]
+    for _ in range(depth):
+        coords = coords[0]
+    assert coords == xy2lonlat(*RING[0])
+
+
+def test_transform_to_wgs_keeps_third_dimension_out():
+    result = transform_to_wgs(make_feature(None, [[*p, 10.0] for p in RING], "LineString"), use_numpy=False)
+    assert result["geometry"]["coordinates"][1] == xy2lonlat(*RING[1])
+
+
+@pytest.mark.skipif(np is None, reason="numpy is not installed")
+def test_numpy_path_matches_python_path():
+    rings = [RING * 100, RING[:3]]
+    python = rings_to_wgs(rings, use_numpy=False)
+    vectorized = rings_to_wgs(rings, use_numpy=True)
+    assert [len(r) for r in vectorized] == [len(r) for r in python]
+    assert np.allclose(np.array(vectorized[0]), np.array(python[0]), rtol=0, atol=1e-12)
+    assert np.allclose(np.array(vectorized[1]), np.array(python[1]), rtol=0, atol=1e-12)
+
+
+def test_detect_crs():
+    mercator = make_feature(None, RING, "LineString")
+    assert detect_crs(mercator) == WEB_MERCATOR
+    wgs = make_feature(None, [[104.6, 52.2], [104.7, 52.3]], "LineString")
+    assert detect_crs(wgs) == WGS84
+    wgs["geometry"]["crs"] = {"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::3857"}}
+    assert detect_crs(wgs) == WEB_MERCATOR
+    response = {"data": {"crs": {"properties": {"name": "EPSG:102100"}}}}
+    assert detect_crs(make_feature(None, [1, 2], "Point"), response) == WEB_MERCATOR
+
+
+def test_reproject_skips_features_in_target_crs():
+    wgs = make_feature(None, [[104.6, 52.2], [104.7, 52.3]], "LineString")
+    assert reproject(wgs, WGS84, "epsg:4326")["geometry"]["coordinates"] == [[104.6, 52.2], [104.7, 52.3]]
+
+    mercator = make_feature(None, RING, "LineString")
+    mercator["geometry"]["crs"] = {"type": "name", "properties": {"name": "EPSG:3857"}}
+    reproject(mercator, detect_crs(mercator), WGS84)
+    assert mercator["geometry"]["coordinates"][0] == xy2lonlat(*RING[0])
+    assert detect_crs(mercator) == WGS84
+
+
+def test_request_crs():
+    assert request_crs("EPSG:4326") == WGS84
+    assert request_crs("EPSG:3857") == WEB_MERCATOR
+    assert request_crs("EPSG:32648") == WEB_MERCATOR
+
+
+def test_custom_transformer():
+    register_transformer(WGS84, "LOCAL:1", lambda rings: [[[p[0] + 1, p[1] + 1] for p in ring] for ring in rings])
+    local = reproject(make_feature(None, [1.0, 2.0], "Point"), WGS84, "LOCAL:1")
+    assert local["geometry"]["coordinates"] == [2.0, 3.0]
+
+
+def test_pyproj_transformer():
+    pytest.importorskip("pyproj")
+    zone = reproject(make_feature(None, [105.0, 52.0], "Point"), WGS84, "EPSG:32648")
+    assert zone["geometry"]["coordinates"][0] == pytest.approx(500000, abs=1e-3)
+
+
+@pytest.mark.parametrize(
+    "code,types",
+    [
+        ("38:06:144003:4723", [1, 15]),
+        ("38:06:0144003", [2]),
+        ("38", [2]),
+        ("38:06-6.123", [5, 7]),
+        ("38:06-7.12", [7, 5]),
+    ],
+)
+def test_guess_area_types(code, types):
+    assert guess_area_types(code) == types